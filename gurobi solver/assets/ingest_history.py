@@ -0,0 +1,315 @@
+import pandas as pd
+import numpy as np
+import argparse
+import datetime
+import glob
+import os
+import re
+import time as time_time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from ingest_intervals import DISTRICTS
+
+# === 多日快照歷史匯入 ===
+# prepare_demand_from_intervals.py 直接以可還車位／可借車數（庫存水準）當作需求；這裡改由相鄰快照的
+# 可借車數變化估算流量：可借車數減少為借車、增加為還車。流程：
+#   1. 快照檔分批以多個行程平行讀取（只讀需要的欄位），每個快照取一個時間點（檔名中的日期時間，
+#      沒有時取 srcUpdateTime 的最大值）；
+#   2. 每 chunk 個快照依時間排序後樞紐為 (站, 快照) 陣列，以向量運算求各站與其上一次觀測的差值，
+#      相隔超過 max_gap 分鐘（斷線）或變化超過 max_jump（卡車調度）的差值捨棄；
+#      只保留上一批最後的觀測跨批銜接，記憶體與天數無關、只與 chunk 成正比；
+#   3. 差值依 (日, 時段) 加總為每日的借車量、還車量與實際觀測分鐘數；
+#   4. 跨日彙總（平均或分位數，可只取平日或假日）：觀測不足 min_coverage 的 (站, 日, 時段) 視為缺漏，
+#      其餘依觀測分鐘數換算為整個時段的流量。
+# 同一分鐘內的借與還會互相抵銷，快照間隔越短估算越接近實際流量。
+
+data_pattern = os.path.join("snapshots", "**", "*.csv")
+daily_path = "history_daily.npz"
+full_table = "gurobi_demand_table.csv"
+
+_COLUMNS = ["sno", "sna", "sarea", "total", "available_rent_bikes", "srcUpdateTime"]
+_NAME_TIME = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})[ _T-]?(\d{2}):?(\d{2})")
+
+
+def snapshot_minute(filepath, df=None):
+    """快照時間（自 1970 起的分鐘數）：優先取檔名中的日期時間，否則取 srcUpdateTime 的最大值。"""
+    m = _NAME_TIME.search(os.path.basename(filepath))
+    if m:
+        stamp = np.datetime64("{}-{}-{}T{}:{}".format(*m.groups()), "m")
+    else:
+        stamp = np.datetime64(pd.to_datetime(df["srcUpdateTime"]).max(), "m")
+    return int(stamp.astype(np.int64))
+
+
+def read_batch(paths):
+    """
+    讀取一批快照（平行工作單元）。回傳 (各快照時間, 各快照列數, sno, 可借車數, 站點資料)：
+    sno 與可借車數為整批串接的陣列，站點資料為批內各站最後一筆的 sna、sarea、total。
+    """
+    minutes, counts, snos, levels, infos = [], [], [], [], []
+    for path in paths:
+        df = pd.read_csv(path, usecols=lambda c: c in _COLUMNS)
+        minutes.append(snapshot_minute(path, df))
+        counts.append(len(df))
+        snos.append(df["sno"].to_numpy(dtype=np.int64))
+        levels.append(df["available_rent_bikes"].to_numpy(dtype=np.float32))
+        infos.append(df[["sno", "sna", "sarea", "total"]])
+    info = pd.concat(infos, ignore_index=True).drop_duplicates("sno", keep="last")
+    return (np.array(minutes, dtype=np.int64), np.array(counts, dtype=np.int64),
+            np.concatenate(snos), np.concatenate(levels), info)
+
+
+class History:
+    """
+    stations (S,)、days：日期（自 1970 起的日數，D,）；
+    borrow / ret / coverage (D, S, P)：每日各時段的借車量、還車量與觀測分鐘數；info：站點資料（sno 為索引）。
+    """
+
+    def __init__(self, stations, days, borrow, ret, coverage, info, period_minutes):
+        self.stations = stations
+        self.days = days
+        self.borrow = borrow
+        self.ret = ret
+        self.coverage = coverage
+        self.info = info
+        self.period_minutes = period_minutes
+
+    @property
+    def P(self):
+        return self.borrow.shape[2]
+
+    def weekday(self):
+        # 1970-01-01 為星期四
+        return (self.days + 3) % 7
+
+
+class _Accumulator:
+    """逐批累加每日流量；站點依出現順序編號，新站點出現時各日陣列補零。"""
+
+    def __init__(self, P):
+        self.P = P
+        self.index = pd.Index([], dtype=np.int64)
+        self.days = {}
+        self.carry_level = np.zeros(0, dtype=np.float32)
+        self.carry_time = np.zeros(0, dtype=np.int64)
+        self.info = []
+
+    def station_index(self, sno):
+        idx = self.index.get_indexer(sno)
+        new = idx < 0
+        if new.any():
+            added = pd.unique(sno[new])
+            self.index = self.index.append(pd.Index(added, dtype=np.int64))
+            n = len(added)
+            self.carry_level = np.concatenate([self.carry_level, np.full(n, np.nan, dtype=np.float32)])
+            self.carry_time = np.concatenate([self.carry_time, np.zeros(n, dtype=np.int64)])
+            idx = self.index.get_indexer(sno)
+        return idx
+
+    def add(self, day, p, borrow, ret, cov):
+        S = len(self.index)
+        if day not in self.days:
+            self.days[day] = np.zeros((3, S, self.P), dtype=np.float32)
+        arr = self.days[day]
+        if arr.shape[1] < S:
+            arr = self.days[day] = np.concatenate(
+                [arr, np.zeros((3, S - arr.shape[1], self.P), dtype=np.float32)], axis=1)
+        arr[:, :, p] += np.stack([borrow, ret, cov])
+
+
+def _chunk_flows(acc, minutes, counts, sno, level, period_minutes, max_gap, max_jump):
+    """一批快照（已依時間排序）轉為流量並累加到 acc；回傳因時間重複或倒退而捨棄的快照數。"""
+    s_idx = acc.station_index(sno)
+    col = np.repeat(np.arange(1, len(minutes) + 1), counts)
+    S, n = len(acc.index), len(minutes)
+
+    # 第 0 欄為上一批各站最後的觀測
+    grid = np.full((S, n + 1), np.nan, dtype=np.float32)
+    grid[:, 0] = acc.carry_level
+    grid[s_idx, col] = level
+    obs = ~np.isnan(grid)
+    last = np.maximum.accumulate(np.where(obs, np.arange(n + 1), -1), axis=1)
+    prev = np.maximum(last[:, :-1], 0)
+    prev_level = np.take_along_axis(grid, prev, axis=1)
+    prev_time = np.where(prev == 0, acc.carry_time[:, None], minutes[np.maximum(prev - 1, 0)])
+    dt = minutes[None, :] - prev_time
+
+    delta = grid[:, 1:] - prev_level
+    valid = obs[:, 1:] & (last[:, :-1] >= 0) & ~np.isnan(prev_level) & (dt > 0) & (dt <= max_gap)
+    if max_jump is not None:
+        valid &= np.abs(delta) <= max_jump
+    delta = np.where(valid, delta, 0.0)
+    borrow = np.maximum(-delta, 0.0)
+    ret = np.maximum(delta, 0.0)
+    cov = np.where(valid, dt, 0).astype(np.float32)
+
+    # 依 (日, 時段) 分組加總；快照已排序，同組的欄位相鄰
+    day = minutes // 1440
+    p = (minutes % 1440) // period_minutes
+    key = day * (1440 // period_minutes) + p
+    starts = np.flatnonzero(np.r_[True, np.diff(key) != 0])
+    sums = [np.add.reduceat(a, starts, axis=1) for a in (borrow, ret, cov)]
+    for g, k in enumerate(starts):
+        acc.add(int(day[k]), int(p[k]), sums[0][:, g], sums[1][:, g], sums[2][:, g])
+
+    # 跨批銜接：各站最後一次觀測
+    tail = last[:, -1]
+    acc.carry_level = np.take_along_axis(grid, tail[:, None], axis=1)[:, 0]
+    acc.carry_time = np.where(tail == 0, acc.carry_time, minutes[np.maximum(tail - 1, 0)])
+    return int((np.diff(minutes) <= 0).sum())
+
+
+def ingest_history(paths, period_minutes=30, max_gap=10, max_jump=None, workers=None, batch=100, chunk=2000,
+                   log=print):
+    """
+    讀取快照檔並估算每日流量，回傳 History。
+    paths 應大致依時間排序（例如檔名含日期時間）；每 chunk 個快照為一批處理，批內再依時間排序。
+    """
+    if 1440 % period_minutes:
+        raise ValueError("period_minutes 必須整除一天的分鐘數")
+    start_time = time_time.time()
+    P = 1440 // period_minutes
+    acc = _Accumulator(P)
+    batches = [paths[k:k + batch] for k in range(0, len(paths), batch)]
+    per_chunk = max(chunk // batch, 1)
+    dropped, done = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for result in pool.map(read_batch, batches):
+            pending.append(result)
+            done += len(result[0])
+            if len(pending) == per_chunk or done == len(paths):
+                minutes, counts, sno, level, info = (
+                    [r[k] for r in pending] for k in range(5))
+                minutes, counts = np.concatenate(minutes), np.concatenate(counts)
+                sno, level = np.concatenate(sno), np.concatenate(level)
+                # 依快照時間排序（保留每個快照的列）
+                order = np.argsort(minutes, kind="stable")
+                offsets = np.r_[0, np.cumsum(counts)]
+                rows = np.concatenate([np.arange(offsets[k], offsets[k + 1]) for k in order])
+                dropped += _chunk_flows(acc, minutes[order], counts[order], sno[rows], level[rows],
+                                        period_minutes, max_gap, max_jump)
+                acc.info.extend(info)
+                pending = []
+                log(f"📥 已處理 {done} / {len(paths)} 個快照｜{time_time.time() - start_time:.1f} 秒")
+    if dropped:
+        log(f"⚠️ {dropped} 個快照的時間與前一個相同或較早，其差值已捨棄")
+
+    stations = acc.index.to_numpy()
+    order = np.argsort(stations, kind="stable")
+    days = np.array(sorted(acc.days), dtype=np.int64)
+    S = len(stations)
+    daily = np.zeros((3, len(days), S, P), dtype=np.float32)
+    for d, day in enumerate(days):
+        arr = acc.days[day]
+        daily[:, d, :arr.shape[1]] = arr
+    daily = daily[:, :, order]
+    info = pd.concat(acc.info, ignore_index=True).drop_duplicates("sno", keep="last").set_index("sno")
+    return History(stations[order], days, daily[0], daily[1], daily[2], info.reindex(stations[order]),
+                   period_minutes)
+
+
+def save_history(history, path=daily_path):
+    info = history.info
+    np.savez_compressed(path, stations=history.stations, days=history.days, borrow=history.borrow,
+                        ret=history.ret, coverage=history.coverage, period_minutes=history.period_minutes,
+                        sna=np.asarray(info["sna"], dtype=str), sarea=np.asarray(info["sarea"], dtype=str),
+                        total=info["total"].to_numpy(dtype=float))
+
+
+def load_history(path=daily_path):
+    with np.load(path) as f:
+        info = pd.DataFrame(dict(sna=f["sna"], sarea=f["sarea"], total=f["total"]), index=f["stations"])
+        info.index.name = "sno"
+        return History(f["stations"], f["days"], f["borrow"], f["ret"], f["coverage"], info,
+                       int(f["period_minutes"]))
+
+
+def profile(history, stat="mean", days="all", min_coverage=0.5):
+    """
+    跨日彙總為各時段需求 (borrow, ret)，皆為 (S, P)，沒有任何有效觀測的 (站, 時段) 為 NaN。
+    stat："mean" 或分位數如 "q0.9"；days："all"、"weekday" 或 "weekend"。
+    """
+    wd = history.weekday()
+    mask = {"all": np.ones(len(wd), dtype=bool), "weekday": wd < 5, "weekend": wd >= 5}[days]
+    if not mask.any():
+        raise ValueError(f"歷史資料中沒有 {days} 的日期")
+    cov = history.coverage[mask]
+    ok = cov >= min_coverage * history.period_minutes
+    scale = np.divide(history.period_minutes, cov, out=np.zeros_like(cov), where=ok)
+    out = []
+    for flow in (history.borrow[mask], history.ret[mask]):
+        rate = np.where(ok, flow * scale, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # 全為缺漏的 (站, 時段)
+            if stat == "mean":
+                out.append(np.nanmean(rate, axis=0))
+            else:
+                out.append(np.nanquantile(rate, float(stat.lstrip("q")), axis=0))
+    return tuple(out)
+
+
+def profile_frame(history, borrow, ret):
+    """彙總結果轉為需求表格式；只保留至少一站有資料的時段，缺漏的 (站, 時段) 補 0。"""
+    periods = np.flatnonzero(~np.isnan(borrow).all(axis=0))
+    S = len(history.stations)
+    labels = [f"{p * history.period_minutes // 60:02d}:{p * history.period_minutes % 60:02d}" for p in periods]
+    info = history.info
+    sna = info["sna"].astype(str).str.replace("YouBike2.0_", "", regex=False).to_numpy()
+    return pd.DataFrame({
+        "sno": np.tile(history.stations, len(periods)),
+        "sna": np.tile(sna, len(periods)),
+        "sarea": np.tile(info["sarea"].to_numpy(), len(periods)),
+        "interval_time": np.repeat(labels, S),
+        "total": np.tile(info["total"].to_numpy(dtype=float), len(periods)),
+        "demand_borrow": np.nan_to_num(borrow[:, periods].T.ravel()).round(4),
+        "demand_return": np.nan_to_num(ret[:, periods].T.ravel()).round(4),
+    })
+
+
+def write_tables(demand_df, out_dir=".", log=print):
+    """寫入全市需求表與各行政區需求表（與 prepare_demand_from_intervals.py 相同的檔名與欄位）。"""
+    os.makedirs(out_dir, exist_ok=True)
+    demand_df.to_csv(os.path.join(out_dir, full_table), index=False, encoding="utf-8-sig")
+    for sarea, group in demand_df.groupby("sarea", sort=False):
+        slug = DISTRICTS.get(sarea)
+        if slug is None:
+            log(f"⚠️ 未知行政區 {sarea}，只寫入 {full_table}")
+            continue
+        group.to_csv(os.path.join(out_dir, f"gurobi_demand_table_{slug}.csv"), index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="由多日快照歷史估算各時段借還車需求")
+    parser.add_argument("patterns", nargs="*", default=[data_pattern],
+                        help=f"快照檔的 glob 樣式（可多個），預設 {data_pattern}")
+    parser.add_argument("--period", type=int, default=30, help="時段長度（分鐘），預設 30")
+    parser.add_argument("--max-gap", type=int, default=10, help="相鄰觀測相隔超過此分鐘數時不計差值，預設 10")
+    parser.add_argument("--max-jump", type=float, default=None, help="單次變化超過此車數視為卡車調度而捨棄")
+    parser.add_argument("--stat", default="mean", help="跨日彙總方式：mean 或分位數如 q0.9，預設 mean")
+    parser.add_argument("--days", default="all", choices=["all", "weekday", "weekend"])
+    parser.add_argument("--min-coverage", type=float, default=0.5, help="時段內觀測比例低於此值視為缺漏，預設 0.5")
+    parser.add_argument("--workers", type=int, default=None, help="平行讀檔的行程數，預設為 CPU 數")
+    parser.add_argument("--chunk", type=int, default=2000, help="每批處理的快照數，預設 2000")
+    parser.add_argument("--daily", default=daily_path, help=f"每日流量存檔，預設 {daily_path}")
+    parser.add_argument("--from-daily", action="store_true", help="不讀快照，直接由 --daily 存檔彙總")
+    parser.add_argument("--out-dir", default=".", help="需求表輸出資料夾，預設目前資料夾")
+    args = parser.parse_args()
+
+    start_time = time_time.time()
+    if args.from_daily:
+        history = load_history(args.daily)
+    else:
+        paths = sorted({p for pattern in args.patterns for p in glob.glob(pattern, recursive=True)})
+        if not paths:
+            raise SystemExit(f"⚠️ 找不到符合 {' '.join(args.patterns)} 的快照檔")
+        history = ingest_history(paths, args.period, args.max_gap, args.max_jump, args.workers,
+                                 chunk=args.chunk)
+        save_history(history, args.daily)
+    borrow, ret = profile(history, args.stat, args.days, args.min_coverage)
+    demand_df = profile_frame(history, borrow, ret)
+    write_tables(demand_df, args.out_dir)
+    first, last = (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(d)) for d in history.days[[0, -1]])
+    print(f"✔ {len(history.days)} 天（{first} ~ {last}）、{len(history.stations)} 站、"
+          f"{demand_df['interval_time'].nunique()} 個時段｜{args.stat}／{args.days}"
+          f"｜{time_time.time() - start_time:.1f} 秒")
@@ -0,0 +1,137 @@
+import pandas as pd
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from demand_store import append_store, load_demand, _source_stamp
+
+# === 增量匯入 interval 快照 ===
+# 只處理檢查點中尚未出現的 interval_*.csv，一次讀入後附加到 gurobi_demand_table.csv，
+# 並依 sarea 分組附加到各行政區需求表（不重讀既有 CSV）；對應的二進位快取同步擴充。
+# 附加前以各需求表的快取比對 (sno, interval_time)，已存在的列一律略過：
+# 沒有檢查點（例如第一次執行）時，已隨需求表出貨的時段不會被重複附加。
+
+data_folder = "interval_outputs"
+checkpoint_path = "ingest_checkpoint.json"
+full_table = "gurobi_demand_table.csv"
+
+# 行政區名稱 → 需求表檔名
+DISTRICTS = {
+    "北投區": "beitou", "大安區": "daan", "大同區": "datong", "南港區": "nangang",
+    "內湖區": "neihu", "士林區": "shilin", "松山區": "songshan", "萬華區": "wanhua",
+    "文山區": "wenshan", "信義區": "xinyi", "中山區": "zhongshan", "中正區": "zhongzheng",
+    "臺大公館校區": "ntu",
+}
+
+
+def snapshot_demand(filepath):
+    """單一 interval 快照轉為需求表格式（與 prepare_demand_from_intervals.py 相同的估算方式）。"""
+    time_str = os.path.splitext(os.path.basename(filepath))[0].split("_")[1]  # e.g., 0030
+    df = pd.read_csv(filepath)
+    df["interval_time"] = f"{int(time_str[:2]):02d}:{int(time_str[2:]):02d}"
+    df["sna"] = df["sna"].str.replace("YouBike2.0_", "", regex=False)
+    # 可還車位作為借車需求、可借車數作為還車需求
+    df["demand_borrow"] = df["available_return_bikes"]
+    df["demand_return"] = df["available_rent_bikes"]
+    return df[["sno", "sna", "sarea", "interval_time", "total", "demand_borrow", "demand_return"]]
+
+
+def load_checkpoint(path=checkpoint_path):
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint, path=checkpoint_path):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def drop_existing(path, df):
+    """去除需求表中已存在（及 df 內重複）的 (sno, interval_time) 列；需求表不存在時只去除 df 內的重複。"""
+    df = df.drop_duplicates(["sno", "interval_time"])
+    if not os.path.exists(path) or df.empty:
+        return df
+    demand = load_demand(path=path)
+    sno = df["sno"].to_numpy()
+    s = np.minimum(np.searchsorted(demand.stations, sno), demand.S - 1)
+    t = df["interval_time"].map({label: k for k, label in enumerate(demand.times)})
+    known = (demand.stations[s] == sno) & t.notna().to_numpy()
+    present = np.zeros(len(df), dtype=bool)
+    present[known] = demand.present[s[known], t[known].to_numpy(dtype=int)]
+    return df[~present]
+
+
+def append_table(path, df, encoding="utf-8"):
+    """
+    附加到需求表（檔案不存在時連同標題列建立），並同步擴充二進位快取。
+    已存在的 (sno, interval_time) 不重複附加，回傳實際附加的列數。
+    """
+    df = drop_existing(path, df)
+    if df.empty:
+        return 0
+    if os.path.exists(path):
+        stamp = _source_stamp(path)
+        text = df.to_csv(index=False)
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            f.write(text.split("\n", 1)[1])
+        # 快取以寫入後的文字解析，與之後重讀 CSV 得到的數值一致
+        append_store(path, pd.read_csv(io.StringIO(text)), stamp)
+    else:
+        df.to_csv(path, index=False, encoding=encoding)
+    return len(df)
+
+
+def ingest(folder=data_folder, checkpoint_file=checkpoint_path, log=print):
+    if not os.path.exists(checkpoint_file):
+        log(f"⚠️ 找不到檢查點 {checkpoint_file}，以各需求表既有的 (sno, interval_time) 建立")
+    checkpoint = load_checkpoint(checkpoint_file)
+    seen = checkpoint["files"]
+    new_files = []
+    for filepath in sorted(glob.glob(os.path.join(folder, "interval_*.csv"))):
+        name = os.path.basename(filepath)
+        st = os.stat(filepath)
+        if name not in seen:
+            new_files.append((filepath, name, st))
+        elif seen[name]["size"] != st.st_size:
+            log(f"⚠️ {name} 已匯入但之後被修改，略過（需要時請以 prepare_demand_from_intervals.py 重建）")
+    if not new_files:
+        log("✔ 沒有新的快照")
+        return 0
+
+    frames = [snapshot_demand(filepath) for filepath, _, _ in new_files]
+    demand_df = pd.concat(frames, ignore_index=True)
+
+    appended = append_table(full_table, demand_df, encoding="utf-8-sig")
+    for sarea, group in demand_df.groupby("sarea", sort=False):
+        slug = DISTRICTS.get(sarea)
+        if slug is None:
+            log(f"⚠️ 未知行政區 {sarea}，只寫入 {full_table}")
+            continue
+        path = f"gurobi_demand_table_{slug}.csv"
+        n = append_table(path, group)
+        if n < len(group):
+            log(f"⏭️ {path}: {len(group) - n} 列的 (sno, interval_time) 已存在，略過")
+
+    for (_, name, st), frame in zip(new_files, frames):
+        seen[name] = dict(size=st.st_size, mtime_ns=st.st_mtime_ns, rows=len(frame),
+                          interval_time=frame["interval_time"].iat[0] if len(frame) else None)
+    save_checkpoint(checkpoint, checkpoint_file)
+    log(f"✔ 已匯入 {len(new_files)} 個快照，共 {len(demand_df)} 列（{full_table} 新增 {appended} 列）")
+    return len(new_files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量匯入新的 interval 快照")
+    parser.add_argument("--folder", default=data_folder)
+    parser.add_argument("--checkpoint", default=checkpoint_path)
+    args = parser.parse_args()
+    ingest(args.folder, args.checkpoint)
@@ -0,0 +1,217 @@
+import numpy as np
+import scipy.sparse as sp
+import time as time_time
+from model_builder import to_gurobi, BINARY, INTEGER
+
+# === 求解器後端 ===
+# 同一個 MatrixModel 可送進 Gurobi 或 HiGHS（scipy.optimize.milp），
+# 兩者使用相同的目標函數、時間上限與 MIP gap，解一律以 {欄區塊名稱: 一維陣列} 回傳。
+# HiGHS 不支援二次限制式，h_in * h_out == 0 以二元變數 z 線性化：
+#   h_in <= U_in * z，h_out <= U_out * (1 - z)，U 為 MatrixModel.implied_ub 推得的上界。
+# 建好的後端可以只更新列區塊的右手邊（update_rhs）與欄區塊的上下界（update_bounds）後再求解，不必重建。
+
+
+class Solution:
+    def __init__(self, values, objective, gap, status, num_vars, num_constrs, build_time, solve_time,
+                 num_nonzeros=None, bound=None):
+        self.values = values
+        self.objective = objective
+        self.gap = gap
+        self.status = status
+        self.num_vars = num_vars
+        self.num_constrs = num_constrs
+        self.build_time = build_time
+        self.solve_time = solve_time
+        self.num_nonzeros = num_nonzeros
+        self.bound = bound
+
+
+class GurobiBackend:
+    name = "gurobi"
+
+    def __init__(self, mm, model_name="YouBike_Multiperiod"):
+        build_start = time_time.time()
+        self.mm = mm
+        self.model, self.var, self.con = to_gurobi(mm, model_name)
+        self.model.setParam("OutputFlag", 0)
+        self.model.update()
+        self.build_time = time_time.time() - build_start
+
+    def set_start(self, start):
+        """起始值中的 NaN 視為未指定。"""
+        from gurobipy import GRB
+
+        for name, value in start.items():
+            value = np.asarray(value, dtype=float).ravel()
+            self.var[name].Start = np.where(np.isnan(value), GRB.UNDEFINED, value)
+
+    def update_rhs(self, name, rhs):
+        rhs = np.asarray(rhs, dtype=float)
+        self.mm.rows[name].rhs = rhs
+        self.con[name].RHS = rhs
+
+    def update_bounds(self, name, lb=None, ub=None):
+        cb = self.mm.cols[name]
+        if lb is not None:
+            cb.lb[:] = lb
+            self.var[name].LB = cb.lb
+        if ub is not None:
+            cb.ub[:] = ub
+            self.var[name].UB = cb.ub
+
+    def solve(self, time_limit=600, mip_gap=0.05, threads=None, progress=None):
+        """progress：傳入 list 時，以回呼記錄 (秒, incumbent, bound)，只在兩者變動或每秒至多一次時新增。"""
+        from gurobipy import GRB
+
+        m = self.model
+        m.setParam("TimeLimit", time_limit)
+        m.setParam("MIPGap", mip_gap)
+        if threads:
+            m.setParam("Threads", threads)
+
+        def callback(model, where):
+            if where != GRB.Callback.MIP:
+                return
+            t = model.cbGet(GRB.Callback.RUNTIME)
+            best = model.cbGet(GRB.Callback.MIP_OBJBST)
+            bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+            best = None if best >= GRB.INFINITY else best
+            if progress and progress[-1][1:] == [best, bound] and t - progress[-1][0] < 1.0:
+                return
+            progress.append([t, best, bound])
+
+        solve_start = time_time.time()
+        m.optimize(callback if progress is not None else None)
+        solve_time = time_time.time() - solve_start
+        if m.SolCount == 0:
+            raise RuntimeError(f"Gurobi 未找到可行解（狀態碼 {m.Status}）")
+        # 純 LP（例如鬆弛模型）沒有 MIPGap / ObjBound
+        gap, bound = (m.MIPGap, m.ObjBound) if m.IsMIP else (0.0, m.ObjVal)
+        if progress is not None:
+            progress.append([m.Runtime, m.ObjVal, bound])
+        values = {name: mv.X for name, mv in self.var.items()}
+        return Solution(values, m.ObjVal, gap, m.Status, m.NumVars, m.NumConstrs + m.NumQConstrs,
+                        self.build_time, solve_time, num_nonzeros=m.NumNZs + m.NumQNZs, bound=bound)
+
+
+class HighsBackend:
+    name = "highs"
+
+    def __init__(self, mm, model_name=None):
+        build_start = time_time.time()
+        self.mm = mm
+        cols = list(mm.cols.values())
+        self.offsets = np.cumsum([0] + [cb.size for cb in cols])
+        n = int(self.offsets[-1])
+
+        blocks = []
+        lo, hi = [], []
+        self.row_pos = {}
+        offset = 0
+        for rb in mm.rows.values():
+            blocks.append(mm.row_matrix(rb))
+            self.row_pos[rb.name] = slice(offset, offset + len(rb.rhs))
+            offset += len(rb.rhs)
+            lo.append(np.full(len(rb.rhs), -np.inf) if rb.sense == "<" else rb.rhs)
+            hi.append(np.full(len(rb.rhs), np.inf) if rb.sense == ">" else rb.rhs)
+
+        # 互斥條件：每組 (a, b) 新增同長度的二元欄 z
+        c = np.concatenate([cb.obj for cb in cols])
+        lb = np.concatenate([cb.lb for cb in cols])
+        ub = np.concatenate([cb.ub for cb in cols])
+        integrality = np.concatenate([np.full(cb.size, int(cb.vtype in (BINARY, INTEGER))) for cb in cols])
+        pos = {name: k for k, name in enumerate(mm.cols)}
+        for a, b in mm.exclusive:
+            size = mm.cols[a].size
+            for name, sign in ((a, -1.0), (b, 1.0)):
+                # a - U_a * z <= 0；b + U_b * z <= U_b
+                k, bound = pos[name], mm.implied_ub[name]
+                blocks.append(sp.hstack([sp.csr_matrix((size, int(self.offsets[k]))), sp.identity(size),
+                                         sp.csr_matrix((size, n - int(self.offsets[k + 1]))),
+                                         sign * sp.diags(bound)], format="csr"))
+                lo.append(np.full(size, -np.inf))
+                hi.append(np.zeros(size) if sign < 0 else bound)
+            c = np.concatenate([c, np.zeros(size)])
+            lb = np.concatenate([lb, np.zeros(size)])
+            ub = np.concatenate([ub, np.ones(size)])
+            integrality = np.concatenate([integrality, np.ones(size, dtype=int)])
+            n += size
+        # 前面的列區塊不含 z 欄，補零欄對齊
+        blocks = [sp.hstack([blk, sp.csr_matrix((blk.shape[0], n - blk.shape[1]))], format="csr")
+                  if blk.shape[1] < n else blk for blk in blocks]
+
+        self.A = sp.vstack(blocks, format="csr")
+        self.row_lo = np.concatenate(lo)
+        self.row_hi = np.concatenate(hi)
+        self.c, self.lb, self.ub, self.integrality = c, lb, ub, integrality
+        self.build_time = time_time.time() - build_start
+
+    def set_start(self, start):
+        # scipy.optimize.milp 不接受起始解
+        pass
+
+    def update_rhs(self, name, rhs):
+        rb = self.mm.rows[name]
+        rb.rhs = np.asarray(rhs, dtype=float)
+        rows = self.row_pos[name]
+        if rb.sense != "<":
+            self.row_lo[rows] = rb.rhs
+        if rb.sense != ">":
+            self.row_hi[rows] = rb.rhs
+
+    def update_bounds(self, name, lb=None, ub=None):
+        k = list(self.mm.cols).index(name)
+        cols = slice(int(self.offsets[k]), int(self.offsets[k + 1]))
+        cb = self.mm.cols[name]
+        if lb is not None:
+            cb.lb[:] = lb
+            self.lb[cols] = cb.lb
+        if ub is not None:
+            cb.ub[:] = ub
+            self.ub[cols] = cb.ub
+
+    def solve(self, time_limit=600, mip_gap=0.05, threads=None, progress=None):
+        """scipy 的 milp 沒有回呼，progress 只記錄最終的 (秒, incumbent, bound)。"""
+        from scipy.optimize import milp, LinearConstraint, Bounds
+
+        solve_start = time_time.time()
+        res = milp(self.c, integrality=self.integrality, bounds=Bounds(self.lb, self.ub),
+                   constraints=LinearConstraint(self.A, self.row_lo, self.row_hi),
+                   options=dict(time_limit=time_limit, mip_rel_gap=mip_gap, disp=False))
+        solve_time = time_time.time() - solve_start
+        if res.x is None:
+            raise RuntimeError(f"HiGHS 未找到可行解：{res.message}")
+        values = {name: res.x[self.offsets[k]:self.offsets[k + 1]] for k, name in enumerate(self.mm.cols)}
+        # 純 LP（沒有整數變數）時 scipy 回傳的 mip_gap / mip_dual_bound 為 None
+        gap = getattr(res, "mip_gap", None) or 0.0
+        bound = getattr(res, "mip_dual_bound", None)
+        bound = res.fun if bound is None else bound
+        if progress is not None:
+            progress.append([solve_time, res.fun, bound])
+        return Solution(values, res.fun, gap, res.status, len(self.c), self.A.shape[0],
+                        self.build_time, solve_time, num_nonzeros=self.A.nnz, bound=bound)
+
+
+BACKENDS = {"gurobi": GurobiBackend, "highs": HighsBackend}
+
+
+def gurobi_available(min_vars=2001):
+    """gurobipy 可匯入且授權能求解至少 min_vars 個變數的模型（受限授權上限為 2000）。"""
+    try:
+        import gurobipy as gp
+        with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+            m.addMVar(min_vars)
+            m.optimize()
+        return True
+    except Exception:
+        return False
+
+
+def default_backend():
+    return "gurobi" if gurobi_available() else "highs"
+
+
+def make_backend(mm, backend="gurobi", model_name="YouBike_Multiperiod"):
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的求解器後端: {backend}（可用: {', '.join(BACKENDS)}）")
+    return BACKENDS[backend](mm, model_name)
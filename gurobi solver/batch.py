@@ -0,0 +1,110 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import os
+import pandas as pd
+from demand_store import load_demand
+import time as time_time
+
+# === 多行政區平行批次求解 ===
+# 所有行政區同時求解，依站點數分配 CPU 核心（大區如大安、內湖、中山分到較多執行緒），
+# 各區保留自己的時間上限；結果沿用 results/ 的命名，另輸出一份合併總表。
+
+
+def all_locations():
+    return sorted(os.path.basename(p)[len("gurobi_demand_table_"):-len(".csv")]
+                  for p in glob.glob("assets/gurobi_demand_table_*.csv"))
+
+
+def station_count(location):
+    return load_demand(location).S
+
+
+def split_cores(weights, cores):
+    """依權重以最大餘數法分配核心數，每項至少 1 核。"""
+    names = list(weights)
+    if cores <= len(names):
+        return {n: 1 for n in names}
+    total = sum(weights.values())
+    spare = cores - len(names)
+    raw = {n: spare * weights[n] / total for n in names}
+    share = {n: 1 + int(raw[n]) for n in names}
+    rest = cores - sum(share.values())
+    for n in sorted(names, key=lambda n: raw[n] - int(raw[n]), reverse=True)[:rest]:
+        share[n] += 1
+    return share
+
+
+def _run(solver, location, threads, limit_time, options):
+    # 子程序內執行，輸出只保留在結果檔案
+    quiet = lambda *a, **k: None
+    if solver == "greedy":
+        from greedy import run_greedy
+        result = run_greedy(location, log=quiet)
+    else:
+        from quicksolve import solve_location
+        result = solve_location(location, limit_time, threads=threads, backend=solver, log=quiet, **options)
+    result["threads"] = threads
+    return result
+
+
+def run_batch(locations, solvers=("greedy", "gurobi"), cores=None, limit_time=600, limits=None, options=None,
+              log=print):
+    cores = cores or os.cpu_count() or 1
+    limits = limits or {}
+    options = options or {}
+    # MIP 的模型規模約與站點數平方成正比；多個 MIP 求解器時各自分配，總執行緒數不超過 cores
+    mip = [s for s in solvers if s != "greedy"]
+    size = {loc: station_count(loc) ** 2 for loc in locations} if mip else {}
+    threads = split_cores({(s, loc): size[loc] for s in mip for loc in locations}, cores)
+
+    jobs = [(s, loc) for s in solvers for loc in locations]
+    rows = []
+    start_time = time_time.time()
+    # 同時執行的工作數不超過 cores；MIP 工作多於核心數時各用 1 執行緒、排隊執行
+    with ProcessPoolExecutor(max_workers=max(min(len(jobs), cores), 1)) as pool:
+        futures = {
+            pool.submit(_run, s, loc, 1 if s == "greedy" else threads[s, loc], limits.get(loc, limit_time), options): (s, loc)
+            for s, loc in jobs
+        }
+        for fut in as_completed(futures):
+            s, loc = futures[fut]
+            try:
+                row = fut.result()
+                log(f"✅ {s:<6} {loc:<11} 成本 {row['objective']:.2f}｜{row['runtime']:.1f} 秒｜{row['threads']} 執行緒")
+            except Exception as e:
+                row = dict(location=loc, solver=s, error=str(e))
+                log(f"❌ {s:<6} {loc:<11} {e}")
+            rows.append(row)
+    wall = time_time.time() - start_time
+
+    summary = pd.DataFrame(rows)
+    if not summary.empty:
+        summary = summary.sort_values(["location", "solver"]).reset_index(drop=True)
+    summary.to_csv("./results/batch_summary.csv", index=False)
+    # 所有工作都失敗時沒有 runtime 欄位
+    busy = summary["runtime"].sum() if "runtime" in summary else 0.0
+    log(f"⏱️ 總牆鐘時間: {wall:.2f} 秒（各工作加總 {busy:.2f} 秒）")
+    return summary, wall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多行政區平行批次求解")
+    parser.add_argument("locations", nargs="*", help="預設為 assets/ 內所有行政區")
+    parser.add_argument("--solvers", default="greedy,gurobi", help="以逗號分隔：greedy, gurobi, highs")
+    parser.add_argument("--cores", type=int, default=None, help="可用核心數，預設為本機核心數")
+    parser.add_argument("--time-limit", type=int, default=600, help="每區 MIP 時間上限（秒）")
+    parser.add_argument("--limit", action="append", default=[], metavar="LOCATION=SECONDS",
+                        help="個別行政區的時間上限，可重複指定")
+    parser.add_argument("--greedy-start", action="store_true", help="MIP 以貪婪法結果作為起始解")
+    parser.add_argument("--no-cache", action="store_true", help="不使用結果快取，所有行政區一律重新求解")
+    parser.add_argument("--compact", action="store_true", help="MIP 另輸出欄式 npz 結果檔")
+    args = parser.parse_args()
+
+    if not os.path.exists("results"):
+        os.makedirs("results")
+    limits = {loc: int(sec) for loc, sec in (item.split("=") for item in args.limit)}
+    summary, _ = run_batch(args.locations or all_locations(), solvers=args.solvers.split(","), cores=args.cores,
+                           limit_time=args.time_limit, limits=limits, options=dict(use_greedy=args.greedy_start, use_cache=not args.no_cache,
+                                                    compact=args.compact))
+    print(summary.to_string(index=False))
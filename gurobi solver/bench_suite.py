@@ -0,0 +1,223 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time as time_time
+import numpy as np
+import pandas as pd
+
+# === 合成資料規模測試 ===
+# 依站點數、期數與需求波動產生合成需求表（固定 seed），每個 (資料, 求解模式) 在獨立子程序中執行，
+# 記錄載入／建模／求解時間、記憶體峰值與目標值，並與儲存的基準比較、標出退步項目。
+# 沒有 Gurobi 完整授權時自動改用 HiGHS。任何模式執行失敗一律視為失敗（不論有無基準），以狀態碼 1 結束。
+# 基準與機器有關，不納入版本控制：先在同一台機器上以 --save-baseline 跑一次建立
+# results/bench_baseline.json，之後的執行才會比較時間、記憶體與目標值；沒有基準時只檢查錯誤。
+
+μ = 6
+α = 1
+β = 0.04
+L = 20
+T_num = 30
+max_visit = 3
+K = T_num * L
+delay = 2
+
+DATA_DIR = os.path.join("results", "bench", "data")
+BASELINE = os.path.join("results", "bench_baseline.json")
+MODES = ("greedy", "mip", "mip-compact", "rolling", "decompose")
+KEY = ["stations", "periods", "volatility", "seed", "mode", "backend"]
+
+
+def case_path(n, T, vol, seed):
+    return os.path.join(DATA_DIR, f"synthetic_{n}_{T}_{vol:g}_{seed}.csv")
+
+
+def prepare_case(n, T, vol, seed):
+    """產生合成需求表並預先建立二進位快取，回傳 (路徑, 快取建立秒數)。"""
+    from synthetic import generate_demand
+    from demand_store import load_demand
+
+    path = case_path(n, T, vol, seed)
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        df, lat, lon = generate_demand(n, T, vol, seed)
+        df.to_csv(path, index=False)
+        np.save(path[:-4] + "_coords.npy", np.column_stack([lat, lon]))
+    t0 = time_time.time()
+    load_demand(path=path)
+    return path, time_time.time() - t0
+
+
+def run_case(job):
+    # 子程序內執行：記憶體峰值只反映本工作
+    from demand_store import load_demand
+    from telemetry import peak_rss_mb
+
+    path, mode, backend, opts = job["path"], job["mode"], job["backend"], job["opts"]
+    row = {k: job[k] for k in ("stations", "periods", "volatility", "seed")}
+    row.update(mode=mode, backend=backend if mode != "greedy" else "-")
+    t0 = time_time.time()
+    demand = load_demand(path=path)
+    stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+    lat, lon = np.load(path[:-4] + "_coords.npy").T
+    B0 = (0.35 * C).astype(int)
+    hide_cap = (0.4 * C).astype(int)
+    params = dict(μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay)
+    row["load_time"] = time_time.time() - t0
+
+    try:
+        if mode == "greedy":
+            from greedy import greedy_plan, greedy_cost
+            t0 = time_time.time()
+            dispatch_result, hide_result, B = greedy_plan(demand)
+            row["solve_time"] = time_time.time() - t0
+            row["build_time"] = 0.0
+            row["objective"] = sum(greedy_cost(demand, B, dispatch_result, hide_result, μ, α, β))
+        elif mode in ("mip", "mip-compact"):
+            from model_builder import build_matrices
+            from backends import make_backend
+            from spatial import candidate_arcs
+            t0 = time_time.time()
+            arcs = candidate_arcs(lat, lon, k=opts["k"], radius_km=opts["radius"])
+            mm = build_matrices(C, D_borrow, D_return, B0, hide_cap, arcs=arcs,
+                                formulation="compact" if mode == "mip-compact" else "standard", **params)
+            solver = make_backend(mm, backend)
+            row["build_time"] = time_time.time() - t0
+            sol = solver.solve(time_limit=opts["time_limit"], mip_gap=opts["mip_gap"])
+            row.update(solve_time=sol.solve_time, objective=sol.objective, gap=sol.gap,
+                       vars=sol.num_vars, constrs=sol.num_constrs, nonzeros=sol.num_nonzeros)
+        elif mode == "rolling":
+            from rolling import rolling_solve
+            from spatial import candidate_arcs
+            t0 = time_time.time()
+            arcs = candidate_arcs(lat, lon, k=opts["k"], radius_km=opts["radius"])
+            plan = rolling_solve(C, D_borrow, D_return, B0, hide_cap, time_limit=opts["window_time_limit"],
+                                 mip_gap=opts["mip_gap"], arcs=arcs, backend=backend, log=lambda *a, **k: None,
+                                 **params)
+            row["build_time"] = sum(w["build_time"] for w in plan["windows"])
+            row["solve_time"] = time_time.time() - t0 - row["build_time"]
+            row["objective"] = plan["objective"]
+        elif mode == "decompose":
+            from decompose import decompose_solve
+            t0 = time_time.time()
+            plan = decompose_solve(C, D_borrow, D_return, B0, hide_cap, lat=lat, lon=lon, sarea=demand.sarea,
+                                   k=opts["k"], radius_km=opts["radius"], time_limit=opts["time_limit"],
+                                   coord_time_limit=opts["time_limit"], mip_gap=opts["mip_gap"], backend=backend,
+                                   log=lambda *a, **k: None, **params)
+            row["build_time"] = sum(c["build_time"] for c in plan["clusters"])
+            row["solve_time"] = time_time.time() - t0
+            row["objective"] = plan["objective"]
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["peak_rss_mb"] = max(peak_rss_mb(), peak_rss_mb(__import__("resource").RUSAGE_CHILDREN))
+    return row
+
+
+def compare(table, baseline, time_tol=0.25, mem_tol=0.25, obj_tol=0.01, min_seconds=0.5):
+    """
+    與基準比較，回傳加上 regression 欄的表（時間、記憶體、目標值任一超出容許範圍即標記）；
+    執行失敗的項目不論有無基準一律標記。
+    """
+    errors = table["error"].fillna("") if "error" in table else pd.Series("", index=table.index)
+    if baseline.empty:
+        table["regression"] = np.where(errors != "", "error: " + errors, "")
+        return table
+    merged = table.merge(baseline, on=KEY, how="left", suffixes=("", "_base"))
+    flags = []
+    for k, r in merged.iterrows():
+        f = [f"error: {errors.iat[k]}"] if errors.iat[k] else []
+        total = r.get("build_time", np.nan) + r.get("solve_time", np.nan)
+        total_base = r.get("build_time_base", np.nan) + r.get("solve_time_base", np.nan)
+        if np.isfinite(total_base) and total > total_base * (1 + time_tol) and total - total_base > min_seconds:
+            f.append(f"time {total_base:.2f}→{total:.2f}s")
+        if np.isfinite(r.get("peak_rss_mb_base", np.nan)) and r["peak_rss_mb"] > r["peak_rss_mb_base"] * (1 + mem_tol):
+            f.append(f"rss {r['peak_rss_mb_base']:.0f}→{r['peak_rss_mb']:.0f}MB")
+        obj, obj_base = r.get("objective", np.nan), r.get("objective_base", np.nan)
+        if np.isfinite(obj_base) and not np.isfinite(obj):
+            f.append("no solution")
+        elif np.isfinite(obj_base) and obj > obj_base + obj_tol * abs(obj_base) + 1e-6:
+            f.append(f"objective {obj_base:.2f}→{obj:.2f}")
+        flags.append("; ".join(f))
+    table["regression"] = flags
+    return table
+
+
+if __name__ == "__main__":
+    from backends import default_backend
+
+    parser = argparse.ArgumentParser(description="合成資料規模測試")
+    parser.add_argument("--stations", default="50,100,200,500,1000,2000", help="站點數，以逗號分隔")
+    parser.add_argument("--periods", default="46", help="期數，以逗號分隔")
+    parser.add_argument("--volatility", default="0.1,0.3", help="需求波動，以逗號分隔")
+    parser.add_argument("--seeds", default="0", help="亂數種子，以逗號分隔")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"以逗號分隔：{', '.join(MODES)}")
+    parser.add_argument("--backend", choices=["auto", "gurobi", "highs"], default="auto",
+                        help="auto：有 Gurobi 完整授權時用 Gurobi，否則用 HiGHS")
+    parser.add_argument("--time-limit", type=float, default=60, help="MIP 每次求解的時間上限（秒）")
+    parser.add_argument("--window-time-limit", type=float, default=10, help="滾動視窗每個視窗的時間上限（秒）")
+    parser.add_argument("--mip-gap", type=float, default=0.05)
+    parser.add_argument("--mip-max-stations", type=int, default=200, help="整體 MIP 與滾動視窗只跑到這個站點數")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--radius", type=float, default=2.0)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="以本次結果覆寫基準")
+    args = parser.parse_args()
+
+    backend = default_backend() if args.backend == "auto" else args.backend
+    modes = args.modes.split(",")
+    opts = dict(time_limit=args.time_limit, window_time_limit=args.window_time_limit, mip_gap=args.mip_gap,
+                k=args.k, radius=args.radius)
+    print(f"🧪 求解器: {backend}")
+
+    jobs = []
+    ingest = {}
+    for n, T, vol, seed in itertools.product([int(v) for v in args.stations.split(",")],
+                                             [int(v) for v in args.periods.split(",")],
+                                             [float(v) for v in args.volatility.split(",")],
+                                             [int(v) for v in args.seeds.split(",")]):
+        path, ingest_time = prepare_case(n, T, vol, seed)
+        ingest[(n, T, vol, seed)] = ingest_time
+        for mode in modes:
+            if mode in ("mip", "mip-compact", "rolling") and n > args.mip_max_stations:
+                continue
+            jobs.append(dict(path=path, stations=n, periods=T, volatility=vol, seed=seed, mode=mode,
+                             backend=backend, opts=opts))
+
+    rows = []
+    # 每個工作一個全新的 spawn 子程序，記憶體峰值互不影響
+    ctx = multiprocessing.get_context("spawn")
+    for job in jobs:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            row = pool.submit(run_case, job).result()
+        row["ingest_time"] = ingest[(row["stations"], row["periods"], row["volatility"], row["seed"])]
+        rows.append(row)
+        status = row.get("error") or (f"成本 {row['objective']:.2f}｜建模 {row['build_time']:.2f} 秒｜"
+                                      f"求解 {row['solve_time']:.2f} 秒｜{row['peak_rss_mb']:.0f} MB")
+        print(f"📊 {row['stations']:>5} 站 × {row['periods']} 期 σ={row['volatility']:g} {row['mode']:<12} {status}")
+
+    table = pd.DataFrame(rows)
+    baseline = pd.DataFrame()
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = pd.DataFrame(json.load(f))
+    elif not args.save_baseline:
+        print(f"⚠️ 找不到基準 {args.baseline}，只檢查執行錯誤（以 --save-baseline 建立基準）")
+    table = compare(table, baseline)
+    os.makedirs("results", exist_ok=True)
+    table.to_csv("./results/bench_suite.csv", index=False)
+
+    if args.save_baseline:
+        keep = KEY + ["build_time", "solve_time", "peak_rss_mb", "objective"]
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(table[[c for c in keep if c in table]].to_dict("records"), f, ensure_ascii=False, indent=1)
+        print(f"💾 基準已寫入 {args.baseline}")
+
+    flagged = table[table["regression"] != ""]
+    if len(flagged):
+        print("❌ 執行失敗或與基準相比退步：")
+        print(flagged[KEY + ["regression"]].to_string(index=False))
+        sys.exit(1)
+    print("✅ 沒有退步項目" if not baseline.empty else "✅ 所有項目執行成功（沒有基準可比較）")
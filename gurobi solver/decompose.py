@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time as time_time
+import numpy as np
+from model_builder import build_matrices
+from backends import make_backend
+from spatial import candidate_arcs
+
+# === 全市空間分解求解 ===
+# 1. 依行政區分群，過大的行政區再沿較寬的座標軸遞迴對半切，每群最多 max_cluster 站；
+# 2. 各群只含群內調度弧，依站點數分得每期調度量 K 與拜訪次數的一部分，於子程序中平行求解；
+# 3. 協調模型：只含跨群候選弧兩端的邊界站，群內調度固定為已知的流入／流出，
+#    重新決定邊界站的藏車與跨群調度，使用各群剩下的 K 與拜訪次數。
+#    各群的解（跨群調度為 0）在協調模型中可行，因此協調只會讓總成本不增。
+
+
+def cluster_stations(lat, lon, sarea, max_size=60):
+    """回傳各站的群編號：先依行政區分，過大的行政區遞迴沿經度或緯度中位數切半。"""
+    S = len(lat)
+    labels = np.full(S, -1)
+    coslat = np.cos(np.radians(np.nanmean(lat))) if np.isfinite(lat).any() else 1.0
+    xy = np.column_stack([np.asarray(lon) * coslat, np.asarray(lat)])
+
+    def split(idx):
+        if len(idx) <= max_size:
+            labels[idx] = labels.max() + 1
+            return
+        known = idx[np.isfinite(xy[idx]).all(axis=1)]
+        if len(known) == 0:
+            halves = np.array_split(idx, 2)
+        else:
+            axis = np.argmax(np.ptp(xy[known], axis=0))
+            order = idx[np.argsort(np.nan_to_num(xy[idx, axis], nan=np.nanmedian(xy[known, axis])), kind="stable")]
+            halves = np.array_split(order, 2)
+        for half in halves:
+            split(half)
+
+    sarea = np.asarray(sarea)
+    for area in sorted(set(sarea.tolist())):
+        split(np.flatnonzero(sarea == area))
+    return labels
+
+
+def _share(total, weights):
+    """以最大餘數法將整數 total 依權重分配（可為 0）。"""
+    weights = np.asarray(weights, dtype=float)
+    raw = total * weights / weights.sum()
+    share = np.floor(raw).astype(int)
+    rest = int(total - share.sum())
+    share[np.argsort(-(raw - share), kind="stable")[:rest]] += 1
+    return share
+
+
+def fixed_net_flow(arcs, x, S, delay):
+    """固定調度造成的各站淨流入 (S, T)，計入期數與模型相同：流出自第 1 期起、流入自第 delay 期起。"""
+    T = x.shape[1]
+    net = np.zeros((S, T))
+    np.add.at(net, (arcs[:, 0], slice(1, None)), -x[:, 1:])
+    if delay < T:
+        np.add.at(net, (arcs[:, 1], slice(delay, None)), x[:, :T - delay])
+    return net
+
+
+def _solve_part(args):
+    # 子程序：建構並求解一個群（或協調模型），回傳各欄區塊 (列數, T) 的解
+    data, params, opts = args
+    mm = build_matrices(data["C"], data["D_borrow"], data["D_return"], data["B0"], data["hide_cap"],
+                        arcs=data["arcs"], arrivals=data.get("arrivals"), K=data["K"],
+                        visit_budget=data["visit_budget"], formulation=opts["formulation"], **params)
+    solver = make_backend(mm, opts["backend"], opts["name"])
+    if data.get("start") is not None:
+        solver.set_start(data["start"])
+    sol = solver.solve(time_limit=opts["time_limit"], mip_gap=opts["mip_gap"], threads=opts["threads"])
+    T = mm.T
+    return dict(values={name: val.reshape(-1, T) for name, val in sol.values.items()},
+                objective=sol.objective, gap=sol.gap, build_time=sol.build_time, solve_time=sol.solve_time)
+
+
+def decompose_solve(C, D_borrow, D_return, B0, hide_cap, μ, α, β, L, K, T_num, max_visit, delay, lat, lon, sarea,
+                    max_cluster=60, k=8, radius_km=2.0, coord_k=2, coord_radius_km=1.0, reserve=0.1,
+                    time_limit=60, coord_time_limit=120,
+                    mip_gap=0.05, backend="gurobi", formulation="standard", workers=None, cores=None, log=print):
+    S, T = D_borrow.shape
+    B0 = np.asarray(B0, dtype=float)
+    hide_cap = np.asarray(hide_cap)
+    params = dict(μ=μ, α=α, β=β, L=L, T_num=T_num, max_visit=max_visit, delay=delay)
+    cores = cores or os.cpu_count() or 1
+
+    # === 分群與候選弧 ===
+    labels = cluster_stations(lat, lon, sarea, max_cluster)
+    groups = [np.flatnonzero(labels == c) for c in range(labels.max() + 1)]
+    sizes = np.array([len(g) for g in groups])
+    # 跨群弧用較稀疏的近鄰條件，控制協調模型的邊界站數
+    all_arcs = candidate_arcs(lat, lon, k=coord_k, radius_km=coord_radius_km)
+    located = np.isfinite(lat) & np.isfinite(lon)
+    cross = ((labels[all_arcs[:, 0]] != labels[all_arcs[:, 1]])
+             & located[all_arcs[:, 0]] & located[all_arcs[:, 1]])
+    inter_arcs = all_arcs[cross]
+    log(f"🧩 {len(groups)} 群（最大 {sizes.max()} 站），跨群候選弧 {len(inter_arcs)} 條")
+    workers = workers or min(len(groups), cores)
+
+    # === 預算分配：保留 reserve 比例給協調模型 ===
+    visits_total = T_num * max_visit
+    K_total = np.broadcast_to(np.asarray(K, dtype=float), (T,))
+    visit_share = _share(int(visits_total * (1 - reserve)), sizes)
+    K_share = np.floor(np.outer(sizes / S, K_total) * (1 - reserve))
+
+    jobs = []
+    group_arcs = []
+    for c, idx in enumerate(groups):
+        arcs_c = candidate_arcs(lat[idx], lon[idx], k=k, radius_km=radius_km)
+        group_arcs.append(arcs_c)
+        data = dict(C=C[idx], D_borrow=D_borrow[idx], D_return=D_return[idx], B0=B0[idx], hide_cap=hide_cap[idx],
+                    arcs=arcs_c, K=K_share[c], visit_budget=int(visit_share[c]))
+        opts = dict(backend=backend, formulation=formulation, name=f"YouBike_Cluster_{c}", time_limit=time_limit,
+                    mip_gap=mip_gap, threads=max(1, cores // workers))
+        jobs.append((data, params, opts))
+
+    # === 各群平行求解 ===
+    cluster_start = time_time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_solve_part, jobs))
+    cluster_time = time_time.time() - cluster_start
+
+    blocks = ("h_in", "h_out", "B", "W_borrow", "W_return")
+    plan = {name: np.zeros((S, T)) for name in blocks}
+    x_parts, arc_parts = [], []
+    K_used = np.zeros(T)
+    visits_used = 0
+    clusters = []
+    for c, (idx, res) in enumerate(zip(groups, results)):
+        vals = res["values"]
+        for name in blocks:
+            plan[name][idx] = vals[name]
+        arc_parts.append(idx[group_arcs[c]])
+        x_parts.append(vals["x"])
+        K_used += vals["x"].sum(axis=0)
+        visits_used += int(round(vals["v"].sum()))
+        clusters.append(dict(cluster=c, stations=len(idx), arcs=len(group_arcs[c]), objective=res["objective"],
+                             gap=res["gap"], build_time=res["build_time"], solve_time=res["solve_time"]))
+    intra_arcs = np.vstack(arc_parts)
+    intra_x = np.vstack(x_parts)
+    log(f"✅ 各群完成｜{cluster_time:.1f} 秒｜使用拜訪 {visits_used} / {visits_total}")
+
+    # === 協調模型：邊界站與跨群弧 ===
+    inter_x = np.zeros((len(inter_arcs), T))
+    coord = None
+    P = np.unique(inter_arcs) if len(inter_arcs) else np.zeros(0, dtype=int)
+    if len(P):
+        local = np.full(S, -1)
+        local[P] = np.arange(len(P))
+        arcs_p = local[inter_arcs]
+        arrivals = fixed_net_flow(intra_arcs, intra_x, S, delay)[P]
+        # 起始解：邊界站沿用各群的解、跨群調度為 0
+        start = {name: plan[name][P] for name in blocks}
+        start.update(x=np.zeros((len(arcs_p), T)), v=np.zeros((len(arcs_p), T)))
+        if formulation == "compact":
+            start["H"] = np.cumsum(plan["h_in"][P] - plan["h_out"][P], axis=1)
+            start["z"] = (plan["h_in"][P] > 0).astype(float)
+        data = dict(C=C[P], D_borrow=D_borrow[P], D_return=D_return[P], B0=B0[P], hide_cap=hide_cap[P],
+                    arcs=arcs_p, arrivals=arrivals, K=np.maximum(K_total - K_used, 0),
+                    visit_budget=max(visits_total - visits_used, 0), start=start)
+        opts = dict(backend=backend, formulation=formulation, name="YouBike_Coordination",
+                    time_limit=coord_time_limit, mip_gap=mip_gap, threads=cores)
+        coord = _solve_part((data, params, opts))
+        for name in blocks:
+            plan[name][P] = coord["values"][name]
+        inter_x = coord["values"]["x"]
+        log(f"🤝 協調模型：{len(P)} 個邊界站｜跨群調度 {int(inter_x.sum())} 輛｜"
+            f"求解 {coord['solve_time']:.1f} 秒")
+
+    plan["arcs"] = np.vstack([intra_arcs, inter_arcs])
+    plan["x"] = np.vstack([intra_x, inter_x])
+    plan["labels"] = labels
+    plan["clusters"] = clusters
+    plan["coordination"] = None if coord is None else dict(
+        stations=len(P), arcs=len(inter_arcs), objective=coord["objective"], gap=coord["gap"],
+        build_time=coord["build_time"], solve_time=coord["solve_time"])
+    plan["cluster_time"] = cluster_time
+    plan["objective"] = (plan["W_borrow"].sum() + plan["W_return"].sum()
+                         + α * plan["x"].sum() + β * (plan["h_in"].sum() + plan["h_out"].sum()))
+    return plan
@@ -0,0 +1,203 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# === 共用需求資料載入器 ===
+# 每個 gurobi_demand_table_*.csv 第一次載入時轉成 assets/.store/<檔名>/ 下的 .npy 欄位檔，
+# 之後以 memory map 直接讀取；來源 CSV 的大小或修改時間改變時自動重建。
+# 需求陣列在 float32 可無損表示時以 float32 儲存，否則保留 float64（例如 13.4166…）。
+
+STORE_VERSION = 1
+_ARRAYS = ("sno", "capacity", "demand_borrow", "demand_return", "present", "row_station", "row_period")
+
+
+def demand_path(location=None):
+    """行政區需求表路徑；location 為 None 時為全台北市需求表。"""
+    if location is None:
+        return os.path.join("assets", "gurobi_demand_table.csv")
+    return os.path.join("assets", f"gurobi_demand_table_{location}.csv")
+
+
+class Demand:
+    """
+    stations: 站點代號（排序後）；times: 時段標籤（排序後）；
+    capacity (S,)、D_borrow / D_return (S, T)：缺漏的 (站, 期) 為 0，present 標記實際存在的列；
+    row_station / row_period：原 CSV 每一列對應的站點與時段索引（保留原列順序）。
+    """
+
+    def __init__(self, arrays, meta):
+        self.stations = arrays["sno"]
+        self.times = meta["times"]
+        self.sna = meta["sna"]
+        self.sarea = meta["sarea"]
+        self.sna_map = dict(zip(self.stations.tolist(), self.sna))
+        self.capacity = np.asarray(arrays["capacity"], dtype=float)
+        self.D_borrow = np.asarray(arrays["demand_borrow"], dtype=float)
+        self.D_return = np.asarray(arrays["demand_return"], dtype=float)
+        self.present = arrays["present"]
+        self.row_station = arrays["row_station"]
+        self.row_period = arrays["row_period"]
+
+    @property
+    def S(self):
+        return len(self.stations)
+
+    @property
+    def T(self):
+        return len(self.times)
+
+    def arrays(self):
+        """(stations, times, sna_map, C, D_borrow, D_return)，供各求解器直接解包。"""
+        return list(self.stations), list(self.times), self.sna_map, self.capacity, self.D_borrow, self.D_return
+
+    def period_order(self):
+        """order[t]：第 t 期出現在原 CSV 的站點索引，依原列順序。"""
+        by_t = np.argsort(self.row_period, kind="stable")
+        bounds = np.searchsorted(self.row_period[by_t], np.arange(self.T + 1))
+        return [self.row_station[by_t[bounds[t]:bounds[t + 1]]] for t in range(self.T)]
+
+
+def _compact(values):
+    f32 = values.astype(np.float32)
+    return f32 if np.array_equal(f32.astype(np.float64), values) else values
+
+
+def frame_arrays(df):
+    """將需求表 DataFrame 轉為 (arrays, meta)。"""
+    times = sorted(df["interval_time"].unique())
+    stations = np.sort(df["sno"].unique()).astype(np.int64)
+    first = df.drop_duplicates("sno").set_index("sno").reindex(stations)
+    s_idx = np.searchsorted(stations, df["sno"].to_numpy())
+    t_idx = np.searchsorted(np.asarray(times, dtype=object), df["interval_time"].to_numpy(dtype=object))
+    S, T = len(stations), len(times)
+
+    D_borrow = np.zeros((S, T))
+    D_return = np.zeros((S, T))
+    present = np.zeros((S, T), dtype=bool)
+    D_borrow[s_idx, t_idx] = df["demand_borrow"].to_numpy(dtype=float)
+    D_return[s_idx, t_idx] = df["demand_return"].to_numpy(dtype=float)
+    present[s_idx, t_idx] = True
+
+    arrays = dict(
+        sno=stations,
+        capacity=_compact(first["total"].to_numpy(dtype=float)),
+        demand_borrow=_compact(D_borrow),
+        demand_return=_compact(D_return),
+        present=present,
+        row_station=s_idx.astype(np.int32),
+        row_period=t_idx.astype(np.int32),
+    )
+    meta = dict(
+        times=[str(t) for t in times],
+        sna=[str(s) for s in first["sna"]],
+        sarea=[str(s) for s in first["sarea"]] if "sarea" in first else [""] * S,
+    )
+    return arrays, meta
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return dict(version=STORE_VERSION, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+def store_dir(path):
+    return os.path.join(os.path.dirname(path), ".store", os.path.splitext(os.path.basename(path))[0])
+
+
+def _read_meta(store):
+    meta_path = os.path.join(store, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_store(path, store, arrays, meta):
+    os.makedirs(store, exist_ok=True)
+    for name in _ARRAYS:
+        tmp = os.path.join(store, f"{name}.tmp.npy")
+        np.save(tmp, arrays[name])
+        os.replace(tmp, os.path.join(store, f"{name}.npy"))
+    # meta.json 最後寫入：它存在且與來源相符時才視為有效
+    meta["source"] = _source_stamp(path)
+    tmp = os.path.join(store, "meta.tmp.json")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(store, "meta.json"))
+
+
+def build_store(path, store):
+    arrays, meta = frame_arrays(pd.read_csv(path))
+    _write_store(path, store, arrays, meta)
+    return arrays, meta
+
+
+def append_store(path, df, stamp):
+    """
+    CSV 已附加 df 的各列後，直接擴充既有快取而不重讀整份 CSV。
+    stamp 為附加前的 _source_stamp(path)；快取與它不符時不處理（下次載入時自動重建），回傳是否已更新。
+    """
+    store = store_dir(path)
+    meta = _read_meta(store)
+    if meta is None or meta.get("source") != stamp:
+        return False
+    old = {name: np.load(os.path.join(store, f"{name}.npy")) for name in _ARRAYS}
+    new, new_meta = frame_arrays(df)
+
+    stations = np.union1d(old["sno"], new["sno"])
+    times = sorted(set(meta["times"]) | set(new_meta["times"]))
+    t_lookup = {t: i for i, t in enumerate(times)}
+    s_old = np.searchsorted(stations, old["sno"])
+    s_new = np.searchsorted(stations, new["sno"])
+    t_old = np.array([t_lookup[t] for t in meta["times"]], dtype=np.int64)
+    t_new = np.array([t_lookup[t] for t in new_meta["times"]], dtype=np.int64)
+    S, T = len(stations), len(times)
+
+    # 既有站點沿用原本的容量與名稱，新站點取自附加資料
+    capacity = np.zeros(S)
+    sna, sarea = [""] * S, [""] * S
+    for idx, src, m in ((s_new, new, new_meta), (s_old, old, meta)):
+        capacity[idx] = src["capacity"]
+        for i, j in enumerate(idx):
+            sna[j], sarea[j] = m["sna"][i], m["sarea"][i]
+
+    dense = {}
+    for name, dtype in (("demand_borrow", float), ("demand_return", float), ("present", bool)):
+        grid = np.zeros((S, T), dtype=dtype)
+        grid[np.ix_(s_old, t_old)] = old[name]
+        rows = np.ix_(s_new, t_new)
+        grid[rows] = np.where(new["present"], new[name], grid[rows])
+        dense[name] = grid
+
+    arrays = dict(
+        sno=stations,
+        capacity=_compact(capacity),
+        demand_borrow=_compact(dense["demand_borrow"]),
+        demand_return=_compact(dense["demand_return"]),
+        present=dense["present"],
+        row_station=np.concatenate([s_old[old["row_station"]], s_new[new["row_station"]]]).astype(np.int32),
+        row_period=np.concatenate([t_old[old["row_period"]], t_new[new["row_period"]]]).astype(np.int32),
+    )
+    _write_store(path, store, arrays, dict(times=times, sna=sna, sarea=sarea))
+    return True
+
+
+def load_demand(location=None, path=None):
+    """載入需求資料（必要時先由 CSV 建立二進位快取）。"""
+    path = path or demand_path(location)
+    store = store_dir(path)
+    meta = _read_meta(store)
+    if meta is not None and meta.get("source") != _source_stamp(path):
+        meta = None
+    if meta is None:
+        arrays, meta = build_store(path, store)
+    else:
+        arrays = {name: np.load(os.path.join(store, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+    return Demand(arrays, meta)
+
+
+def load_frame(df):
+    """直接由 DataFrame 建立 Demand（不寫入快取），供合成資料或切片使用。"""
+    arrays, meta = frame_arrays(df)
+    return Demand(arrays, meta)
@@ -0,0 +1,388 @@
+from model_builder import build_matrices, state_rhs, extract_records
+from backends import make_backend, default_backend
+from demand_store import load_demand
+from spatial import load_coordinates, candidate_arcs
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import math
+import os
+import time as time_time
+import numpy as np
+import pandas as pd
+
+# === 常駐線上調度服務 ===
+# 每個行政區的模型（horizon 期的滾動視窗）只建構一次並常駐記憶體。
+# 每次更新（目前時段、各站現有車數、已藏車數、需求預測、停用站點）只改寫受影響的右手邊與上下界，
+# 再以上一次的解（依經過的期數平移）作為起始解重解，數秒內回傳新計畫。
+# 起始解只有 Gurobi 會使用；HiGHS 後端沒有起始解介面，每次都從頭求解（預設在有完整授權時使用 Gurobi）。
+# 同一行政區的請求排隊並合併：求解期間收到的多個更新合併成一次求解，所有等待者取得同一份結果。
+# 每個更新在合併前個別檢查（時段不可早於目前計畫、站點須存在），有誤者單獨回傳 400，不影響同批的其他更新。
+# 停用站點會保留到下一次帶有 closed 的更新為止（傳入空清單即全部恢復）。
+# 本機 HTTP（或 Unix socket）介面：
+#   GET  /health、GET /districts
+#   POST /districts/<行政區>/plan      更新並重新規劃（JSON，欄位見 merge_updates）
+#   GET  /districts/<行政區>/plan      最近一次的計畫
+#   POST /districts/<行政區>/snapshot  {"path": interval_*.csv}：以快照的可借車數作為現有車數後重新規劃
+
+μ = 6
+α = 1
+β = 0.04
+L = 20
+T_num = 30
+max_visit = 3
+K = T_num * L
+delay = 2
+
+
+def merge_updates(old, new):
+    """
+    合併同一行政區排隊中的更新，較新的值覆蓋較舊的值：
+    time：目前時段標籤；inventory / hidden：{sno: 車數}；demand：{"borrow" | "return": {sno: [自目前時段起的預測]}}；
+    closed：停用站點清單（取代先前的清單，未提供時沿用）；visits_left：剩餘拜訪次數。
+    """
+    merged = dict(old)
+    for key, value in new.items():
+        if key in ("inventory", "hidden"):
+            merged[key] = {**old.get(key, {}), **value}
+        elif key == "demand":
+            merged[key] = {side: {**old.get(key, {}).get(side, {}), **value.get(side, {})}
+                           for side in set(old.get(key, {})) | set(value)}
+        else:
+            merged[key] = value
+    return merged
+
+
+class DistrictPlanner:
+    """單一行政區的常駐模型與跨次規劃的狀態（現有車數、已藏車數、在途車輛、剩餘拜訪次數）。"""
+
+    def __init__(self, location, horizon=12, backend=None, formulation="standard", k=8, radius=2.0,
+                 time_limit=20, mip_gap=0.05, threads=None):
+        build_start = time_time.time()
+        self.location = location
+        self.demand = load_demand(location)
+        stations, times, self.sna_map, C, D_borrow, D_return = self.demand.arrays()
+        self.stations, self.times = stations, times
+        self.index = {s: i for i, s in enumerate(stations)}
+        self.C = C
+        self.hide_cap = (0.4 * C).astype(int)
+        self.horizon = horizon
+        self.time_limit, self.mip_gap, self.threads = time_limit, mip_gap, threads
+        S, T = self.demand.S, self.demand.T
+
+        lat, lon = load_coordinates(stations)
+        self.arcs = candidate_arcs(lat, lon, k=k, radius_km=radius)
+        # 已藏車數的上界（一天最多每期都藏滿），用於互斥條件的上界，之後只更新右手邊
+        H_bound = self.hide_cap * T
+        self.mm = build_matrices(C, *self._window_demand(0, {}), (0.35 * C).astype(int), self.hide_cap,
+                                 μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay,
+                                 arcs=self.arcs, H0=H_bound, arrivals=np.zeros((S, horizon)),
+                                 first_period_flows=True, formulation=formulation)
+        self.solver = make_backend(self.mm, backend or default_backend(), f"YouBike_Service_{location}")
+        self.default_ub = {name: cb.ub.copy() for name, cb in self.mm.cols.items()}
+
+        self.t = None
+        self.B = (0.35 * C).astype(int).astype(float)
+        self.H = np.zeros(S)
+        self.in_transit = np.zeros((S, T + horizon + delay + 1))
+        self.visits_left = T_num * max_visit
+        self.closed = np.zeros(S, dtype=bool)
+        self.last = None
+        self.plan = None
+        self.build_time = time_time.time() - build_start
+        self.solves = 0
+
+    def _window_demand(self, t, forecast):
+        # 自第 t 期起 horizon 期的需求：需求表的值，超出一天的期數為 0，再以預測覆蓋
+        S, T = self.demand.S, self.demand.T
+        D = {}
+        for side, table in (("borrow", self.demand.D_borrow), ("return", self.demand.D_return)):
+            d = np.zeros((S, self.horizon))
+            n = max(min(self.horizon, T - t), 0)
+            d[:, :n] = table[:, t:t + n]
+            for sno, values in forecast.get(side, {}).items():
+                i = self._station(sno)
+                values = np.asarray(values, dtype=float)[:self.horizon]
+                d[i, :len(values)] = values
+            D[side] = d
+        return D["borrow"], D["return"]
+
+    def _period(self, label):
+        # 時段標籤對應到需求表的期數；不在表中時取之後最近的時段
+        if label is None:
+            return 0 if self.t is None else min(self.t + 1, self.demand.T - 1)
+        later = [k for k, t in enumerate(self.times) if t >= label]
+        return later[0] if later else self.demand.T - 1
+
+    def _station(self, sno):
+        try:
+            return self.index[int(sno)]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"{self.location} 沒有站點 {sno}") from None
+
+    def _parse(self, update):
+        """檢查並轉換更新內容（不改動狀態），回傳 (t, 現有車數, 已藏車數, 停用站點, 剩餘拜訪次數)，未提供者為 None。"""
+        label = update.get("time")
+        if label is not None and not isinstance(label, str):
+            raise ValueError(f"time 須為時段標籤字串，例如 \"08:30\"，收到 {label!r}")
+        t = self._period(label)
+        if self.t is not None and t < self.t:
+            raise ValueError(f"時段 {self.times[t]} 早於目前計畫的時段 {self.times[self.t]}，不能倒退")
+        inventory = {self._station(sno): float(bikes) for sno, bikes in update.get("inventory", {}).items()}
+        hidden = {self._station(sno): float(value) for sno, value in update.get("hidden", {}).items()}
+        for side, forecast in update.get("demand", {}).items():
+            if side not in ("borrow", "return"):
+                raise ValueError(f"未知的需求種類: {side}")
+            for sno, values in forecast.items():
+                self._station(sno)
+                np.asarray(values, dtype=float)
+        closed = None
+        if "closed" in update:
+            closed = np.zeros(self.demand.S, dtype=bool)
+            closed[[self._station(sno) for sno in update["closed"]]] = True
+        visits_left = int(update["visits_left"]) if "visits_left" in update else None
+        return t, inventory, hidden, closed, visits_left
+
+    def _advance(self, t):
+        # 將上次計畫中 [self.t, t) 的決策視為已執行，推進狀態
+        if self.last is None or self.t is None or t <= self.t:
+            return
+        n = min(t - self.t, self.horizon)
+        x = self.last["x"][:, :n]
+        self.B = self.last["B"][:, n - 1].copy()
+        self.H += self.last["h_in"][:, :n].sum(axis=1) - self.last["h_out"][:, :n].sum(axis=1)
+        for k in range(n):
+            np.add.at(self.in_transit[:, self.t + k + delay], self.arcs[:, 1], x[:, k])
+        self.visits_left -= int(round(self.last["v"][:, :n].sum()))
+
+    def replan(self, update):
+        """
+        依更新調整右手邊與上下界後重解，回傳計畫（dict，可直接轉為 JSON）。
+        更新內容有誤時在改動任何狀態前拋出 ValueError。
+        """
+        update_start = time_time.time()
+        S, T, Hz = self.demand.S, self.demand.T, self.horizon
+        t, inventory, hidden, closed, visits_left = self._parse(update)
+        self._advance(t)
+        shift = 0 if self.t is None else t - self.t
+
+        for i, bikes in inventory.items():
+            self.B[i] = min(max(bikes, 0.0), self.C[i])
+        for i, value in hidden.items():
+            self.H[i] = max(value, 0.0)
+        if closed is not None:
+            self.closed = closed
+        if visits_left is not None:
+            self.visits_left = visits_left
+        self.visits_left = max(self.visits_left, 0)
+        budget = self.visits_left if t + Hz >= T else math.ceil(self.visits_left * Hz / (T - t))
+
+        # === 只更新右手邊與上下界 ===
+        D_borrow, D_return = self._window_demand(t, update.get("demand", {}))
+        rhs = state_rhs(self.mm, self.C, D_borrow, D_return, self.B, μ, H0=self.H,
+                        arrivals=self.in_transit[:, t:t + Hz], visit_budget=budget)
+        for name, value in rhs.items():
+            self.solver.update_rhs(name, value)
+        arc_closed = np.repeat(self.closed[self.arcs[:, 0]] | self.closed[self.arcs[:, 1]], Hz)
+        for name in ("x", "v"):
+            self.solver.update_bounds(name, ub=np.where(arc_closed, 0.0, self.default_ub[name]))
+        self.solver.update_bounds("h_in", ub=np.where(np.repeat(self.closed, Hz), 0.0, self.default_ub["h_in"]))
+
+        # === 上一次的解平移後作為起始解 ===
+        if self.last is not None and shift < Hz:
+            start = {}
+            for name, value in self.last.items():
+                st = np.full_like(value, np.nan)
+                st[:, :Hz - shift] = value[:, shift:]
+                start[name] = st
+            self.solver.set_start(start)
+        update_time = time_time.time() - update_start
+
+        self.t = t
+        try:
+            sol = self.solver.solve(time_limit=self.time_limit, mip_gap=self.mip_gap, threads=self.threads)
+        except RuntimeError:
+            self.last = None  # 狀態已推進到第 t 期，舊解不能再用來推進或作為起始解
+            raise
+        self.last = {name: value.reshape(-1, Hz) for name, value in sol.values.items()}
+        self.solves += 1
+
+        n = min(Hz, T - t)
+        labels = list(self.times[t:t + n])
+        dispatch, hide = extract_records(self.arcs, self.last["x"][:, :n], self.last["h_in"][:, :n],
+                                         self.last["h_out"][:, :n], self.stations, labels, self.sna_map)
+        self.plan = dict(location=self.location, time=self.times[t], horizon=labels, objective=sol.objective,
+                         gap=sol.gap, update_time=update_time, solve_time=sol.solve_time,
+                         visits_left=self.visits_left, dispatch=dispatch, hide=hide)
+        return self.plan
+
+    def status(self):
+        return dict(location=self.location, stations=self.demand.S, arcs=len(self.arcs), horizon=self.horizon,
+                    backend=self.solver.name, build_time=self.build_time, solves=self.solves,
+                    time=None if self.t is None else self.times[self.t],
+                    objective=None if self.plan is None else self.plan["objective"])
+
+
+def snapshot_update(path, stations, time=None):
+    """interval_*.csv 快照轉為更新：可借車數即各站現有車數（只取 stations 內的站），時段取自檔名。"""
+    df = pd.read_csv(path, usecols=["sno", "available_rent_bikes"]).drop_duplicates("sno")
+    df = df[df["sno"].isin(stations)]
+    if time is None:
+        stem = os.path.splitext(os.path.basename(path))[0].split("_")[1]
+        time = f"{int(stem[:2]):02d}:{int(stem[2:]):02d}"
+    return dict(time=time, inventory=dict(zip(df["sno"].tolist(), df["available_rent_bikes"].tolist())))
+
+
+class DispatchService:
+    def __init__(self, locations, workers=None, **planner_opts):
+        self.locations = list(locations)
+        self.planner_opts = planner_opts
+        self.planners = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers or max(len(self.locations), 1))
+        self.slots = {}
+
+    async def planner(self, location):
+        if location not in self.locations:
+            raise KeyError(location)
+        if location not in self.planners:
+            loop = asyncio.get_running_loop()
+            self.planners[location] = await loop.run_in_executor(
+                self.executor, lambda: DistrictPlanner(location, **self.planner_opts))
+        return self.planners[location]
+
+    async def submit(self, location, update):
+        """加入該行政區的佇列；求解進行中收到的更新會合併成下一次求解。更新有誤時直接拋出 ValueError。"""
+        planner = await self.planner(location)
+        planner._parse(update)
+        slot = self.slots.get(location)
+        if slot is None:
+            slot = self.slots[location] = dict(pending=[], wake=asyncio.Event())
+            asyncio.create_task(self._worker(location, slot))
+        fut = asyncio.get_running_loop().create_future()
+        slot["pending"].append((update, fut))
+        slot["wake"].set()
+        return await fut
+
+    async def _worker(self, location, slot):
+        loop = asyncio.get_running_loop()
+        while True:
+            await slot["wake"].wait()
+            slot["wake"].clear()
+            batch, slot["pending"] = slot["pending"], []
+            if not batch:
+                continue
+            planner = await self.planner(location)
+            # 排隊期間計畫可能已推進，合併前依目前狀態逐一重新檢查，只讓有誤的更新失敗
+            update, waiters = None, []
+            for item, fut in batch:
+                try:
+                    planner._parse(item)
+                except ValueError as e:
+                    fut.set_exception(e)
+                    continue
+                update = item if update is None else merge_updates(update, item)
+                waiters.append(fut)
+            if not waiters:
+                continue
+            try:
+                plan = await loop.run_in_executor(self.executor, planner.replan, update)
+                plan = dict(plan, coalesced=len(waiters))
+                for fut in waiters:
+                    fut.set_result(plan)
+            except Exception as e:
+                for fut in waiters:
+                    fut.set_exception(e)
+
+    async def route(self, method, path, body):
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            return 200, dict(status="ok")
+        if method == "GET" and parts == ["districts"]:
+            return 200, dict(districts=[self.planners[loc].status() if loc in self.planners
+                                        else dict(location=loc, loaded=False) for loc in self.locations])
+        if len(parts) == 3 and parts[0] == "districts":
+            location, action = parts[1], parts[2]
+            if location not in self.locations:
+                return 404, dict(error=f"未提供的行政區: {location}")
+            if method == "GET" and action == "plan":
+                plan = self.planners[location].plan if location in self.planners else None
+                return (200, plan) if plan is not None else (404, dict(error="尚未規劃"))
+            if method == "POST" and action == "plan":
+                return 200, await self.submit(location, json.loads(body or b"{}"))
+            if method == "POST" and action == "snapshot":
+                req = json.loads(body or b"{}")
+                planner = await self.planner(location)
+                update = snapshot_update(req["path"], planner.stations, req.get("time"))
+                return 200, await self.submit(location, update)
+        return 404, dict(error=f"未知的路徑: {method} {path}")
+
+    async def handle(self, reader, writer):
+        # 最小的 HTTP/1.1：每個連線處理一個請求
+        try:
+            request = await reader.readline()
+            method, path, _ = request.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            try:
+                status, payload = await self.route(method, path, body)
+            except (ValueError, KeyError) as e:
+                status, payload = 400, dict(error=f"{type(e).__name__}: {e}")
+            except Exception as e:
+                status, payload = 500, dict(error=f"{type(e).__name__}: {e}")
+            data = json.dumps(payload, ensure_ascii=False, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+            data = data.encode("utf-8")
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}[status]
+            writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8765, unix=None, preload=False):
+    if preload:
+        await asyncio.gather(*(service.planner(loc) for loc in service.locations))
+        for loc in service.locations:
+            print(f"🏗️ {loc} 模型已建構（{service.planners[loc].build_time:.2f} 秒）")
+    if unix:
+        server = await asyncio.start_unix_server(service.handle, path=unix)
+        print(f"🚀 調度服務已啟動：unix:{unix}")
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        print(f"🚀 調度服務已啟動：http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常駐線上調度服務")
+    parser.add_argument("locations", nargs="+", help="要提供服務的行政區")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="改以 Unix socket 提供服務")
+    parser.add_argument("--horizon", type=int, default=12, help="每次規劃的期數")
+    parser.add_argument("--time-limit", type=float, default=20, help="每次重解的時間上限（秒）")
+    parser.add_argument("--mip-gap", type=float, default=0.05)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="同時求解的行政區數，預設為全部")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--radius", type=float, default=2.0)
+    parser.add_argument("--backend", choices=["auto", "gurobi", "highs"], default="auto")
+    parser.add_argument("--formulation", choices=["standard", "compact"], default="standard")
+    parser.add_argument("--preload", action="store_true", help="啟動時先建構所有行政區的模型")
+    args = parser.parse_args()
+
+    backend = None if args.backend == "auto" else args.backend
+    service = DispatchService(args.locations, workers=args.workers, horizon=args.horizon, backend=backend,
+                              formulation=args.formulation, k=args.k, radius=args.radius,
+                              time_limit=args.time_limit, mip_gap=args.mip_gap, threads=args.threads)
+    asyncio.run(serve(service, args.host, args.port, args.unix, args.preload))
@@ -0,0 +1,300 @@
+from demand_store import load_demand
+import argparse
+import os
+import time as time_time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# === 調度計畫評估器 ===
+# 讀取任一求解器輸出的 *_dispatch-*.csv / *_hide-*.csv（貪婪法與 MIP 的欄位順序不同，皆可），
+# 依調度延遲與站點容量重播各站庫存，計算每期、每站的等待、調度與藏車成本。
+# 多個計畫 × 多個需求情境（例如一週中的每一天）一次以陣列運算評估：
+# 庫存只由計畫決定、與需求無關，因此每個計畫只重播一次，再對所有情境廣播計算等待成本。
+#
+# 重播規則（每期依序）：
+#   1. 釋放不超過之前已藏的車數，釋放的車回到站上；
+#   2. 可用車數 = 上期庫存 + 本期抵達 + 本期釋放；出發量超過可用車數時，該站各弧依比例縮減；
+#   3. 調出的車於 delay 期後抵達目的站；
+#   4. 藏車不超過調出後的站上車數；
+#   5. 超過容量的車數視為溢出（記錄於 overflow，不留在站上）。
+# 此順序與 MIP 同期內的庫存平衡一致（藏車與釋放互斥），因此 first_period_outflow=False 時
+# 可行的 MIP 解不會觸發任何縮減：此時沿用 MIP 的記帳方式（第 0 期的調出不從起點扣除），
+# 用來核對求解器回報的目標值。預設的 True 會扣除第 0 期調出，MIP 解在第 0 期可能被縮減。
+
+μ = 6
+α = 1
+β = 0.04
+delay = 2
+
+
+def load_plan(dispatch_csv, hide_csv, demand):
+    """讀取調度／藏車 CSV，回傳 dict(arcs (A, 2), x (A, T), h_in (S, T), h_out (S, T))（站點索引依 demand）。"""
+    S, T = demand.S, demand.T
+    stations = np.asarray(demand.stations)
+    period = {t: k for k, t in enumerate(demand.times)}
+
+    def station_index(sno, source):
+        idx = np.searchsorted(stations, sno)
+        bad = (idx >= S) | (stations[np.minimum(idx, S - 1)] != sno)
+        if bad.any():
+            raise ValueError(f"{source} 含需求表中沒有的站點: {sorted(set(sno[bad].tolist()))[:5]}")
+        return idx
+
+    def period_index(labels, source):
+        unknown = sorted(set(labels) - set(period))
+        if unknown:
+            raise ValueError(f"{source} 含需求表中沒有的時段: {unknown[:5]}")
+        return np.array([period[t] for t in labels], dtype=int)
+
+    x = np.zeros((0, T))
+    arcs = np.zeros((0, 2), dtype=int)
+    if os.path.exists(dispatch_csv) and os.path.getsize(dispatch_csv) > 1:
+        df = pd.read_csv(dispatch_csv, dtype={"time": str})
+        if len(df):
+            i = station_index(df["from_sno"].to_numpy(dtype=np.int64), dispatch_csv)
+            j = station_index(df["to_sno"].to_numpy(dtype=np.int64), dispatch_csv)
+            t = period_index(df["time"].tolist(), dispatch_csv)
+            arcs, a = np.unique(np.column_stack([i, j]), axis=0, return_inverse=True)
+            x = np.zeros((len(arcs), T))
+            np.add.at(x, (a.ravel(), t), df["quantity"].to_numpy(dtype=float))
+
+    h_in = np.zeros((S, T))
+    h_out = np.zeros((S, T))
+    if os.path.exists(hide_csv) and os.path.getsize(hide_csv) > 1:
+        df = pd.read_csv(hide_csv, dtype={"time": str})
+        if len(df):
+            i = station_index(df["sno"].to_numpy(dtype=np.int64), hide_csv)
+            t = period_index(df["time"].tolist(), hide_csv)
+            np.add.at(h_in, (i, t), df["hide"].to_numpy(dtype=float))
+            np.add.at(h_out, (i, t), df["release"].to_numpy(dtype=float))
+    return dict(arcs=arcs, x=x, h_in=h_in, h_out=h_out)
+
+
+def stack_plans(plans, S, T):
+    """將多個計畫對齊到共同的弧集合，回傳 (arcs, x (P, A, T), h_in (P, S, T), h_out (P, S, T))。"""
+    arcs = np.unique(np.vstack([p["arcs"] for p in plans] + [np.zeros((0, 2), dtype=int)]), axis=0)
+    x = np.zeros((len(plans), len(arcs), T))
+    key = arcs[:, 0] * S + arcs[:, 1]
+    for k, p in enumerate(plans):
+        if len(p["arcs"]):
+            x[k, np.searchsorted(key, p["arcs"][:, 0] * S + p["arcs"][:, 1])] = p["x"]
+    h_in = np.stack([p["h_in"] for p in plans])
+    h_out = np.stack([p["h_out"] for p in plans])
+    return arcs, x, h_in, h_out
+
+
+def replay(C, B0, arcs, x, h_in, h_out, delay=delay, first_period_outflow=True, H0=None):
+    """
+    重播 P 個計畫的庫存（對 P 與站點向量化，時間依序）。
+    回傳 dict(B, h_in, h_out, H, overflow：(P, S, T)；x：(P, A, T) 實際執行量；
+    dispatch_short / hide_short / release_short：因車數不足而未執行的量 (P, S, T))。
+    """
+    P, A, T = x.shape
+    S = len(C)
+    C = np.asarray(C, dtype=float)
+    # 站 × 弧的關聯矩陣：out_t @ x_t 為各站調出量，in_t @ x_t 為各站調入量
+    out_t = sp.csr_matrix((np.ones(A), (arcs[:, 0], np.arange(A))), shape=(S, A))
+    in_t = sp.csr_matrix((np.ones(A), (arcs[:, 1], np.arange(A))), shape=(S, A))
+
+    B_prev = np.broadcast_to(np.asarray(B0, dtype=float), (P, S)).copy()
+    H = np.zeros((P, S)) if H0 is None else np.broadcast_to(np.asarray(H0, dtype=float), (P, S)).copy()
+    arriving = np.zeros((P, S, T + delay + 1))
+    res = {name: np.zeros((P, S, T)) for name in
+           ("B", "h_in", "h_out", "H", "overflow", "dispatch_short", "hide_short", "release_short")}
+    shipped = np.zeros_like(x)
+
+    for t in range(T):
+        release = np.minimum(h_out[:, :, t], H)
+        H -= release
+        avail = B_prev + arriving[:, :, t] + release
+        x_t = x[:, :, t]
+        if t == 0 and not first_period_outflow:
+            # MIP 的記帳方式：第 0 期調出不扣除起點庫存，delay 為 0 時也不計入抵達
+            ship = x_t
+            after = avail
+            if delay > 0:
+                arriving[:, :, delay] += (in_t @ ship.T).T
+        else:
+            want = (out_t @ x_t.T).T
+            scale = np.ones((P, S))
+            over = want > avail + 1e-9
+            scale[over] = np.maximum(avail[over], 0) / want[over]
+            ship = x_t * scale[:, arcs[:, 0]]
+            sent = (out_t @ ship.T).T
+            res["dispatch_short"][:, :, t] = want - sent
+            after = avail - sent
+            inflow = (in_t @ ship.T).T
+            if delay == 0:
+                after = after + inflow
+            else:
+                arriving[:, :, t + delay] += inflow
+        shipped[:, :, t] = ship
+
+        hide = np.minimum(h_in[:, :, t], np.maximum(after, 0))
+        after = after - hide
+        H += hide
+        overflow = np.maximum(after - C, 0)
+        B_prev = after - overflow
+
+        res["B"][:, :, t] = B_prev
+        res["h_in"][:, :, t] = hide
+        res["h_out"][:, :, t] = release
+        res["H"][:, :, t] = H
+        res["overflow"][:, :, t] = overflow
+        res["hide_short"][:, :, t] = h_in[:, :, t] - hide
+        res["release_short"][:, :, t] = h_out[:, :, t] - release
+    res["x"] = shipped
+    return res
+
+
+def wait_costs(B, C, D_borrow, D_return, μ=μ, chunk_cells=1 << 24):
+    """
+    B: (P, S, T) 庫存；D_borrow / D_return: (N, S, T) 需求情境。
+    回傳 (總等待 (P, N), 各期等待 (P, N, T), 各站等待 (P, N, S))；依情境分塊以限制記憶體。
+    """
+    P, S, T = B.shape
+    N = D_borrow.shape[0]
+    empty = np.asarray(C, dtype=float)[None, :, None] - B
+    by_period = np.zeros((P, N, T))
+    by_station = np.zeros((P, N, S))
+    step = max(1, chunk_cells // max(P * S * T, 1))
+    for n0 in range(0, N, step):
+        n1 = min(n0 + step, N)
+        w = (np.maximum(D_borrow[None, n0:n1] - B[:, None], 0)
+             + np.maximum(D_return[None, n0:n1] - empty[:, None], 0)) / μ
+        by_period[:, n0:n1] = w.sum(axis=2)
+        by_station[:, n0:n1] = w.sum(axis=3)
+    return by_period.sum(axis=2), by_period, by_station
+
+
+def evaluate(plans, C, B0, D_borrow, D_return, μ=μ, α=α, β=β, delay=delay, first_period_outflow=True):
+    """
+    plans: load_plan 的結果清單；D_borrow / D_return: (S, T) 或 (N, S, T)。
+    回傳 dict：wait / total (P, N)，dispatch / hide (P,)，各期與各站成本明細，以及重播結果 replay。
+    """
+    S, T = len(C), np.shape(D_borrow)[-1]
+    D_borrow = np.asarray(D_borrow, dtype=float).reshape(-1, S, T)
+    D_return = np.asarray(D_return, dtype=float).reshape(-1, S, T)
+    arcs, x, h_in, h_out = stack_plans(plans, S, T)
+    rp = replay(C, B0, arcs, x, h_in, h_out, delay=delay, first_period_outflow=first_period_outflow)
+
+    wait, wait_by_period, wait_by_station = wait_costs(rp["B"], C, D_borrow, D_return, μ)
+    dispatch_by_period = α * rp["x"].sum(axis=1)
+    dispatch_by_station = α * np.stack([np.bincount(arcs[:, 0], weights=rp["x"][k].sum(axis=1), minlength=S)
+                                        for k in range(len(plans))])
+    moved = rp["h_in"] + rp["h_out"]
+    hide_by_period = β * moved.sum(axis=1)
+    hide_by_station = β * moved.sum(axis=2)
+    dispatch = dispatch_by_period.sum(axis=1)
+    hide = hide_by_period.sum(axis=1)
+    return dict(
+        wait=wait, dispatch=dispatch, hide=hide, total=wait + (dispatch + hide)[:, None],
+        wait_by_period=wait_by_period, wait_by_station=wait_by_station,
+        dispatch_by_period=dispatch_by_period, dispatch_by_station=dispatch_by_station,
+        hide_by_period=hide_by_period, hide_by_station=hide_by_station,
+        arcs=arcs, replay=rp,
+    )
+
+
+def scenario_arrays(demand, paths):
+    """將其他需求表（例如其他日期）對齊到 demand 的站點與時段，回傳 (D_borrow, D_return)：(N, S, T)。"""
+    D_b, D_r = [demand.D_borrow], [demand.D_return]
+    stations = np.asarray(demand.stations)
+    for path in paths:
+        other = load_demand(path=path)
+        s_pos = np.searchsorted(stations, other.stations)
+        s_ok = (s_pos < len(stations)) & (stations[np.minimum(s_pos, len(stations) - 1)] == other.stations)
+        period = {t: k for k, t in enumerate(demand.times)}
+        t_pos = np.array([period.get(t, -1) for t in other.times])
+        t_ok = t_pos >= 0
+        if not s_ok.all() or not t_ok.all():
+            print(f"⚠️ {path}: 略過 {int((~s_ok).sum())} 個站點、{int((~t_ok).sum())} 個時段（不在基準需求表中）")
+        b = np.zeros_like(demand.D_borrow)
+        r = np.zeros_like(demand.D_return)
+        b[np.ix_(s_pos[s_ok], t_pos[t_ok])] = np.asarray(other.D_borrow)[np.ix_(s_ok, t_ok)]
+        r[np.ix_(s_pos[s_ok], t_pos[t_ok])] = np.asarray(other.D_return)[np.ix_(s_ok, t_ok)]
+        D_b.append(b)
+        D_r.append(r)
+    return np.stack(D_b), np.stack(D_r)
+
+
+def perturbed_scenarios(D_borrow, D_return, C, n, volatility=0.1, seed=0):
+    """
+    以基準需求加上擾動產生 n 個情境 (n, S, T)：在站車數（demand_return）加上 volatility × 容量 的常態擾動，
+    demand_borrow 隨之調整，兩者和不變（與原始資料的定義一致）。
+    """
+    rng = np.random.default_rng(seed)
+    total = D_borrow + D_return
+    shift = rng.normal(0, volatility, (n,) + D_return.shape) * np.asarray(C, dtype=float)[None, :, None]
+    r = np.clip(np.round((D_return[None] + shift) * 4) / 4, 0, total[None])
+    return total[None] - r, r
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以相同規則重播並評估各求解器的調度計畫")
+    parser.add_argument("location", help="行政區，例如 datong")
+    parser.add_argument("--plan", action="append",
+                        help="計畫名稱（讀取 results/{plan}_dispatch-{location}.csv 與 _hide-），可重複指定；"
+                             "預設為 results/ 中所有可用的計畫")
+    parser.add_argument("--delay", type=int, default=delay, help="調度抵達延遲（期）")
+    parser.add_argument("--model-accounting", action="store_true",
+                        help="第 0 期調出不扣除起點庫存（與 MIP 模型相同，用來核對求解器的目標值）")
+    parser.add_argument("--scenario", action="append", default=[], help="額外的需求表 CSV（例如其他日期），可重複指定")
+    parser.add_argument("--perturb", type=int, default=0, help="另外產生的擾動需求情境數")
+    parser.add_argument("--volatility", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--details", action="store_true", help="另存基準情境的各期／各站成本明細")
+    args = parser.parse_args()
+
+    loc = args.location
+    start_time = time_time.time()
+    demand = load_demand(loc)
+    stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+    B0 = (0.35 * C).astype(int)
+
+    names = args.plan or sorted({f[:-len(f"_dispatch-{loc}.csv")] for f in os.listdir("results")
+                                 if f.endswith(f"_dispatch-{loc}.csv")})
+    plans = [load_plan(f"./results/{p}_dispatch-{loc}.csv", f"./results/{p}_hide-{loc}.csv", demand) for p in names]
+    if not plans:
+        raise SystemExit(f"⚠️ results/ 中沒有 {loc} 的調度計畫")
+
+    D_b, D_r = scenario_arrays(demand, args.scenario)
+    if args.perturb:
+        pb, pr = perturbed_scenarios(demand.D_borrow, demand.D_return, C, args.perturb, args.volatility, args.seed)
+        D_b, D_r = np.concatenate([D_b, pb]), np.concatenate([D_r, pr])
+    load_time = time_time.time() - start_time
+
+    t0 = time_time.time()
+    ev = evaluate(plans, C, B0, D_b, D_r, delay=args.delay, first_period_outflow=not args.model_accounting)
+    eval_time = time_time.time() - t0
+    rp = ev["replay"]
+
+    rows = []
+    for k, name in enumerate(names):
+        rows.append(dict(
+            plan=name, base_total=ev["total"][k, 0], mean_total=ev["total"][k].mean(),
+            min_total=ev["total"][k].min(), max_total=ev["total"][k].max(),
+            wait=ev["wait"][k, 0], dispatch=ev["dispatch"][k], hide=ev["hide"][k],
+            dispatch_short=rp["dispatch_short"][k].sum(), hide_short=rp["hide_short"][k].sum(),
+            release_short=rp["release_short"][k].sum(), overflow=rp["overflow"][k].sum(),
+        ))
+    table = pd.DataFrame(rows)
+    os.makedirs("results", exist_ok=True)
+    table.to_csv(f"./results/evaluation-{loc}.csv", index=False)
+    pd.DataFrame(ev["total"].T, columns=names).rename_axis("scenario").to_csv(
+        f"./results/evaluation_scenarios-{loc}.csv")
+
+    if args.details:
+        by_period = pd.concat([pd.DataFrame(dict(
+            plan=name, time=times, wait=ev["wait_by_period"][k, 0], dispatch=ev["dispatch_by_period"][k],
+            hide=ev["hide_by_period"][k])) for k, name in enumerate(names)])
+        by_period.to_csv(f"./results/evaluation_period-{loc}.csv", index=False)
+        by_station = pd.concat([pd.DataFrame(dict(
+            plan=name, sno=stations, sna=[sna_map[s] for s in stations], wait=ev["wait_by_station"][k, 0],
+            dispatch=ev["dispatch_by_station"][k], hide=ev["hide_by_station"][k])) for k, name in enumerate(names)])
+        by_station.to_csv(f"./results/evaluation_station-{loc}.csv", index=False)
+
+    pd.set_option("display.width", 200)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    print(f"\n📊 {len(names)} 個計畫 × {len(D_b)} 個情境｜載入 {load_time:.2f} 秒｜評估 {eval_time:.2f} 秒")
@@ -1,3 +1,6 @@
+from demand_store import load_demand
+from telemetry import RunTelemetry
+import numpy as np
 import pandas as pd
 import sys, os, time
 
@@ -6,141 +9,166 @@ import sys, os, time
 L = 20       # 每台卡車最多載車數
 T_num = 30   # 卡車數
 max_dispatch = T_num * L
-location = sys.argv[1]
-if not os.path.exists("results"):
-    os.makedirs("results")
-
-# === 讀取資料 ===
-start_time = time.time()
-df = pd.read_csv(f"assets/gurobi_demand_table_{location}.csv")
-times = sorted(df["interval_time"].unique())
-stations = sorted(df["sno"].unique())
-sna_map = df.drop_duplicates("sno").set_index("sno")["sna"].to_dict()
-
-# 站點資訊
-capacity = df.drop_duplicates("sno").set_index("sno")["total"].to_dict()
-B = {s: int(0.35 * capacity[s]) for s in stations}  # 初始車量
-
-# 儲存結果
-dispatch_result = []
-hide_result = []
-
-# === 每期處理 ===
-for t in times:
-    cur = df[df["interval_time"] == t]
-    
-    # 分為缺車（要補）與溢車（要收）
-    need = []
-    surplus = []
-    for _, row in cur.iterrows():
-        b_need = row.demand_borrow - B[row.sno]
-        r_over = row.demand_return - (capacity[row.sno] - B[row.sno])
-        if b_need > 0:
-            need.append((row.sno, b_need))
-        if r_over > 0:
-            surplus.append((row.sno, r_over))
-    
-    # 依據需求排序
-    need.sort(key=lambda x: -x[1])
-    surplus.sort(key=lambda x: -x[1])
-    
-    remaining_dispatch = max_dispatch
-
-    for s_from, extra in surplus:
-        if remaining_dispatch <= 0:
-            break
-        for i, (s_to, shortage) in enumerate(need):
-            if remaining_dispatch <= 0:
+
+
+def _scalar(value, is_int):
+    # 與原本逐列計算相同：min() 取到整數上限時為 int，否則為 float（影響 CSV 的輸出格式）
+    return int(value) if is_int else float(value)
+
+
+def greedy_plan(demand, max_dispatch=max_dispatch):
+    """貪婪法：每期先由溢車站補缺車站，再藏車／釋放。回傳 (調度紀錄, 藏車紀錄, 期末庫存陣列)。"""
+    stations, times, sna_map, capacity, D_borrow, D_return = demand.arrays()
+    order = demand.period_order()  # 每期依原檔列順序處理
+    sno = list(stations)
+    hide_cap = (0.4 * capacity).astype(int)
+    B = (0.35 * capacity).astype(int).astype(float)  # 初始車量
+
+    # 儲存結果
+    dispatch_result = []
+    hide_result = []
+
+    # === 每期處理 ===
+    for t, time_label in enumerate(times):
+        idx = order[t]
+        db, dr, cap = D_borrow[idx, t], D_return[idx, t], capacity[idx]
+
+        # 分為缺車（要補）與溢車（要收），依需求由大到小排序（同值維持原列順序）
+        b_need = db - B[idx]
+        r_over = dr - (cap - B[idx])
+        need_pos = np.flatnonzero(b_need > 0)
+        need_pos = need_pos[np.argsort(-b_need[need_pos], kind="stable")]
+        surplus_pos = np.flatnonzero(r_over > 0)
+        surplus_pos = surplus_pos[np.argsort(-r_over[surplus_pos], kind="stable")]
+        need_to = idx[need_pos].tolist()
+        need_left = b_need[need_pos].tolist()
+
+        # 依序配對：前面的缺車站補滿後才輪到下一站
+        remaining_dispatch = max_dispatch
+        p = 0
+        for s_from, extra in zip(idx[surplus_pos].tolist(), r_over[surplus_pos].tolist()):
+            if remaining_dispatch <= 0 or p >= len(need_to):
                 break
-            move = min(extra, shortage, remaining_dispatch)
-            if move <= 0:
-                continue
-            # 更新現況
-            B[s_from] -= move
-            B[s_to] += move
-            extra -= move
-            need[i] = (s_to, shortage - move)
-            remaining_dispatch -= move
-            dispatch_result.append(dict(
-                time=t,
-                from_sno=s_from,
-                from_sna=sna_map[s_from],
-                to_sno=s_to,
-                to_sna=sna_map[s_to],
-                quantity=move
-            ))
-
-    # 貪婪藏車／釋放
-    for _, row in cur.iterrows():
-        sno = row.sno
-        # 如果退車仍溢出，藏車
-        over = row.demand_return - (capacity[sno] - B[sno])
-        if over > 0:
-            hide = min(over, int(0.4 * capacity[sno]))
-            B[sno] -= hide
-            hide_result.append(dict(
-                time=t,
-                sno=sno,
-                sna=sna_map[sno],
-                hide=hide,
-                release=0
-            ))
-        # 如果借車仍不足，釋放
-        lack = row.demand_borrow - B[sno]
-        if lack > 0:
-            release = min(lack, int(0.4 * capacity[sno]))
-            B[sno] += release
-            hide_result.append(dict(
-                time=t,
-                sno=sno,
-                sna=sna_map[sno],
-                hide=0,
-                release=release
-            ))
-
-# === 輸出結果 ===
-pd.DataFrame(dispatch_result).to_csv(f"./results/greedy_dispatch-{location}.csv", index=False)
-pd.DataFrame(hide_result).to_csv(f"./results/greedy_hide-{location}.csv", index=False)
-print("✅ 貪婪演算法結果已輸出為 CSV 檔案")
-
-# === 成本估算（基於貪婪法結果） ===
-μ = 6
-α = 1
-β = 0.04
-
-wait_cost = 0
-dispatch_cost = 0
-hide_cost = 0
-
-# 計算等待成本
-for t in times:
-    cur = df[df["interval_time"] == t]
-    for _, row in cur.iterrows():
-        sno = row.sno
-        cap = capacity[sno]
-        b = B[sno]
-        wait_borrow = max(row.demand_borrow - b, 0) / μ
-        wait_return = max(row.demand_return - (cap - b), 0) / μ
-        wait_cost += wait_borrow + wait_return
-
-# 計算調度與藏車／釋放成本
-dispatch_cost = α * sum(r["quantity"] for r in dispatch_result)
-hide_cost = β * sum(r["hide"] + r["release"] for r in hide_result)
-total_cost = wait_cost + dispatch_cost + hide_cost
-
-end_time = time.time()
-
-with open(f"./results/greedy_summary-{location}.txt", "w", encoding='utf-8') as f:
-    f.write(f"⏱️ 借還車等待成本: {wait_cost:.2f}\n")
-    f.write(f"🚚 調度成本: {dispatch_cost:.2f}\n")
-    f.write(f"📦 藏車/釋放成本: {hide_cost:.2f}\n")
-    f.write(f"🎯 成本總和: {total_cost:.2f}\n")
-    f.write(f"🕒 執行時間: {end_time - start_time:.2f} 秒\n")
-
-# 顯示結果
-print("\n=== 成本明細（貪婪法） ===")
-print(f"⏱️ 借還車等待成本: {wait_cost:.2f}")
-print(f"🚚 調度成本: {dispatch_cost:.2f}")
-print(f"📦 藏車/釋放成本: {hide_cost:.2f}")
-print(f"🎯 成本總和: {total_cost:.2f}")
-print(f"🕒 執行時間: {end_time - start_time:.2f} 秒")
\ No newline at end of file
+            while p < len(need_to) and extra > 0 and remaining_dispatch > 0:
+                s_to, shortage = need_to[p], need_left[p]
+                move = min(extra, shortage, remaining_dispatch)
+                # 更新現況
+                B[s_from] -= move
+                B[s_to] += move
+                extra -= move
+                need_left[p] = shortage - move
+                remaining_dispatch -= move
+                dispatch_result.append(dict(
+                    time=time_label,
+                    from_sno=sno[s_from],
+                    from_sna=sna_map[sno[s_from]],
+                    to_sno=sno[s_to],
+                    to_sna=sna_map[sno[s_to]],
+                    quantity=move
+                ))
+                if need_left[p] <= 0:
+                    p += 1
+
+        # 貪婪藏車（退車仍溢出）／釋放（借車仍不足），上限為 40% 容量
+        hc = hide_cap[idx]
+        over = dr - (cap - B[idx])
+        do_hide = over > 0
+        hide = np.where(hc < over, hc, over)
+        B[idx[do_hide]] -= hide[do_hide]
+        lack = db - B[idx]
+        do_release = lack > 0
+        release = np.where(hc < lack, hc, lack)
+        B[idx[do_release]] += release[do_release]
+
+        # 同一站先記藏車、再記釋放
+        pos = np.concatenate([np.flatnonzero(do_hide) * 2, np.flatnonzero(do_release) * 2 + 1])
+        for k in np.sort(pos).tolist():
+            r, is_release = divmod(k, 2)
+            s = sno[idx[r]]
+            if is_release:
+                hide_result.append(dict(time=time_label, sno=s, sna=sna_map[s],
+                                        hide=0, release=_scalar(release[r], hc[r] < lack[r])))
+            else:
+                hide_result.append(dict(time=time_label, sno=s, sna=sna_map[s],
+                                        hide=_scalar(hide[r], hc[r] < over[r]), release=0))
+
+    return dispatch_result, hide_result, B
+
+
+def greedy_cost(demand, B, dispatch_result, hide_result, μ=6, α=1, β=0.04):
+    """成本估算（基於貪婪法結果，每期以期末庫存 B 計算），回傳 (等待成本, 調度成本, 藏車／釋放成本)。"""
+    capacity, D_borrow, D_return = demand.capacity, demand.D_borrow, demand.D_return
+    order = demand.period_order()
+
+    # 計算等待成本（與逐列累加的順序相同）
+    waits = []
+    for t, idx in enumerate(order):
+        b = B[idx]
+        wait_borrow = np.maximum(D_borrow[idx, t] - b, 0) / μ
+        wait_return = np.maximum(D_return[idx, t] - (capacity[idx] - b), 0) / μ
+        waits.append(wait_borrow + wait_return)
+    wait_cost = sum(np.concatenate(waits).tolist()) if waits else 0
+
+    # 計算調度與藏車／釋放成本
+    dispatch_cost = α * sum(r["quantity"] for r in dispatch_result)
+    hide_cost = β * sum(r["hide"] + r["release"] for r in hide_result)
+    return wait_cost, dispatch_cost, hide_cost
+
+
+def run_greedy(location, log=print, tag="greedy"):
+    """求解單一行政區並輸出 results/{tag}_*-{location} 檔案（預設 greedy），回傳結果總結。"""
+    if not os.path.exists("results"):
+        os.makedirs("results")
+
+    tel = RunTelemetry(tag, location)
+
+    # === 讀取資料 ===
+    start_time = time.time()
+    with tel.phase("load"):
+        demand = load_demand(location)
+    with tel.phase("solve"):
+        dispatch_result, hide_result, B = greedy_plan(demand)
+
+    # === 輸出結果 ===
+    with tel.phase("write"):
+        pd.DataFrame(dispatch_result).to_csv(f"./results/{tag}_dispatch-{location}.csv", index=False)
+        pd.DataFrame(hide_result).to_csv(f"./results/{tag}_hide-{location}.csv", index=False)
+    log("✅ 貪婪演算法結果已輸出為 CSV 檔案")
+
+    # === 成本估算（基於貪婪法結果） ===
+    μ = 6
+    α = 1
+    β = 0.04
+
+    with tel.phase("evaluate"):
+        wait_cost, dispatch_cost, hide_cost = greedy_cost(demand, B, dispatch_result, hide_result, μ, α, β)
+    total_cost = wait_cost + dispatch_cost + hide_cost
+
+    end_time = time.time()
+
+    with open(f"./results/{tag}_summary-{location}.txt", "w", encoding='utf-8') as f:
+        f.write(f"⏱️ 借還車等待成本: {wait_cost:.2f}\n")
+        f.write(f"🚚 調度成本: {dispatch_cost:.2f}\n")
+        f.write(f"📦 藏車/釋放成本: {hide_cost:.2f}\n")
+        f.write(f"🎯 成本總和: {total_cost:.2f}\n")
+        f.write(f"🕒 執行時間: {end_time - start_time:.2f} 秒\n")
+
+    # 顯示結果
+    log("\n=== 成本明細（貪婪法） ===")
+    log(f"⏱️ 借還車等待成本: {wait_cost:.2f}")
+    log(f"🚚 調度成本: {dispatch_cost:.2f}")
+    log(f"📦 藏車/釋放成本: {hide_cost:.2f}")
+    log(f"🎯 成本總和: {total_cost:.2f}")
+    log(f"🕒 執行時間: {end_time - start_time:.2f} 秒")
+    tel.set(objective=total_cost, stations=demand.S, periods=demand.T)
+    tel.write()
+
+    return dict(location=location, solver=tag, objective=total_cost,
+                dispatch=float(sum(r["quantity"] for r in dispatch_result)),
+                hide=float(sum(r["hide"] for r in hide_result)),
+                release=float(sum(r["release"] for r in hide_result)),
+                runtime=end_time - start_time)
+
+
+if __name__ == "__main__":
+    run_greedy(sys.argv[1])
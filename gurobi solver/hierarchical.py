@@ -0,0 +1,234 @@
+from concurrent.futures import ProcessPoolExecutor
+from model_builder import build_matrices, extract_frames
+from backends import make_backend, default_backend
+from demand_store import load_demand
+from spatial import load_coordinates, candidate_arcs
+from telemetry import RunTelemetry
+import argparse
+import os
+import time as time_time
+import numpy as np
+import scipy.sparse as sp
+
+# === 多解析度時間聚合求解 ===
+# 1. 粗解：每 block 期併成一個粗時段（需求取平均、μ 除以 block，使等待成本與逐期加總同量級），
+#    粗時段內的調度視為當段抵達，求出每段結束時的庫存 B 與藏車淨量；
+# 2. 細解：各段以完整解析度平行求解，期初狀態取自粗解，段末庫存固定為粗解的值、
+#    段內藏車淨量不少於粗解，最後 delay 期不出發（避免在途車輛跨段），拜訪次數依粗解用量分配；
+# 3. 接合：依序檢查各段的實際期初狀態；段末條件不可行或狀態接不上的段，
+#    以實際狀態依序重解（先保留段末條件，仍不可行則取消）。接合後的計畫在原模型中可行。
+
+μ = 6
+α = 1
+β = 0.04
+L = 20
+T_num = 30
+max_visit = 3
+K = T_num * L
+delay = 2
+
+PLAN_BLOCKS = ("x", "v", "h_in", "h_out", "B", "W_borrow", "W_return")
+
+
+def block_ranges(T, block):
+    return [range(s, min(s + block, T)) for s in range(0, T, block)]
+
+
+def aggregate(D, ranges):
+    """各粗時段的平均需求 (S, 段數)。"""
+    return np.column_stack([D[:, r].mean(axis=1) for r in ranges])
+
+
+def _solve_block(args):
+    # 子程序：建構並求解一段完整解析度的模型；段末條件不可行時回傳 None
+    data, params, opts = args
+    mm = build_matrices(data["C"], data["D_borrow"], data["D_return"], data["B0"], data["hide_cap"],
+                        arcs=data["arcs"], H0=data["H0"], first_period_flows=data["first_period_flows"],
+                        visit_budget=data["visit_budget"], formulation=opts["formulation"], **params)
+    S, T, A = mm.S, mm.T, len(mm.arcs)
+    if data["no_departure"]:
+        # 最後 delay 期不出發，調度都在段內抵達
+        late = (np.arange(A)[:, None] * T + np.arange(T - data["no_departure"], T)[None, :]).ravel()
+        mm.cols["x"].ub[late] = 0.0
+        mm.cols["v"].ub[late] = 0.0
+    if data.get("B_end") is not None:
+        last = np.arange(S) * T + T - 1
+        mm.cols["B"].lb[last] = data["B_end"]
+        mm.cols["B"].ub[last] = data["B_end"]
+        net = sp.kron(sp.identity(S), np.ones((1, T)), format="csr")
+        mm.add_rows("terminal_hide", {"h_in": net, "h_out": -net}, ">", data["hide_net"])
+    solver = make_backend(mm, opts["backend"], opts["name"])
+    try:
+        sol = solver.solve(time_limit=opts["time_limit"], mip_gap=opts["mip_gap"], threads=opts["threads"])
+    except RuntimeError:
+        return None
+    return dict(values={name: sol.values[name].reshape(-1, T) for name in PLAN_BLOCKS},
+                objective=sol.objective, gap=sol.gap, build_time=sol.build_time, solve_time=sol.solve_time)
+
+
+def hierarchical_solve(C, D_borrow, D_return, B0, hide_cap, μ, α, β, L, K, T_num, max_visit, delay, arcs,
+                       block=4, coarse_time_limit=60, time_limit=60, mip_gap=0.05, backend="gurobi",
+                       formulation="standard", workers=None, cores=None, log=print):
+    """
+    block：每個粗時段包含的期數，需大於 delay。回傳 dict：接合後的計畫（各欄區塊）、objective、
+    coarse（粗解統計）、blocks（各段統計）與 repaired（以實際狀態依序重解的段數）。
+    """
+    S, T = D_borrow.shape
+    if block <= delay:
+        raise ValueError(f"block ({block}) 需大於調度延遲 delay ({delay})")
+    C = np.asarray(C, dtype=float)
+    B0 = np.asarray(B0, dtype=float)
+    hide_cap = np.asarray(hide_cap)
+    A = len(arcs)
+    cores = cores or os.cpu_count() or 1
+    ranges = block_ranges(T, block)
+    visits_total = T_num * max_visit
+
+    # === 粗解 ===
+    coarse_start = time_time.time()
+    mm = build_matrices(C, aggregate(D_borrow, ranges), aggregate(D_return, ranges), B0, hide_cap,
+                        μ=μ / block, α=α, β=β, L=L, K=K * (block - delay), T_num=T_num, max_visit=max_visit,
+                        delay=0, arcs=arcs, first_period_flows=True, formulation=formulation)
+    sol = make_backend(mm, backend, "YouBike_Coarse").solve(time_limit=coarse_time_limit, mip_gap=mip_gap,
+                                                            threads=cores)
+    coarse = {name: sol.values[name].reshape(-1, len(ranges)) for name in PLAN_BLOCKS}
+    coarse_time = time_time.time() - coarse_start
+    log(f"🔭 粗解：{len(ranges)} 段 × {block} 期｜成本 {sol.objective:.2f}｜{coarse_time:.1f} 秒")
+
+    # 段末目標與各段狀態
+    hide_net = coarse["h_in"] - coarse["h_out"]
+    H_start = np.hstack([np.zeros((S, 1)), np.cumsum(hide_net, axis=1)[:, :-1]])
+    B_start = np.hstack([B0[:, None], coarse["B"][:, :-1]])
+    B_end = np.clip(coarse["B"], 0, C[:, None])
+    # 拜訪次數：依粗解各段用量分配，剩下的依段長平均分配
+    used = np.round(coarse["v"].sum(axis=0)).astype(int)
+    spare = max(visits_total - int(used.sum()), 0)
+    budget = used + spare * np.array([len(r) for r in ranges]) // T
+
+    params = dict(μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay)
+
+    def job(b, B_init, H_init, terminal):
+        r = ranges[b]
+        final = b == len(ranges) - 1
+        data = dict(C=C, D_borrow=D_borrow[:, r], D_return=D_return[:, r], B0=B_init, H0=H_init, hide_cap=hide_cap,
+                    arcs=arcs, first_period_flows=b > 0, visit_budget=int(budget[b]),
+                    no_departure=0 if final else delay,
+                    B_end=B_end[:, b] if terminal and not final else None, hide_net=hide_net[:, b])
+        opts = dict(backend=backend, formulation=formulation, name=f"YouBike_Block_{b}", time_limit=time_limit,
+                    mip_gap=mip_gap, threads=max(1, cores // (workers or 1)))
+        return data, params, opts
+
+    # === 各段平行求解 ===
+    workers = workers or min(len(ranges), cores)
+    fine_start = time_time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_solve_block, [job(b, B_start[:, b], H_start[:, b], True)
+                                               for b in range(len(ranges))]))
+    fine_time = time_time.time() - fine_start
+
+    # === 依序接合，狀態接不上的段以實際狀態重解 ===
+    plan = {name: np.zeros((A if name in ("x", "v") else S, T)) for name in PLAN_BLOCKS}
+    B_cur, H_cur = B0.copy(), np.zeros(S)
+    blocks, repaired = [], 0
+    for b, r in enumerate(ranges):
+        res = results[b]
+        matches = np.allclose(B_cur, B_start[:, b], atol=1e-6) and (H_cur >= H_start[:, b] - 1e-6).all()
+        if res is None or not matches:
+            repaired += 1
+            res = _solve_block(job(b, B_cur, H_cur, True)) or _solve_block(job(b, B_cur, H_cur, False))
+            if res is None:
+                raise RuntimeError(f"第 {b} 段（{r.start}–{r.stop}）在實際狀態下找不到可行解")
+            log(f"🔧 第 {b} 段以實際狀態重解｜成本 {res['objective']:.2f}")
+        vals = res["values"]
+        for name in PLAN_BLOCKS:
+            plan[name][:, r.start:r.stop] = vals[name]
+        B_cur = vals["B"][:, -1].copy()
+        H_cur = H_cur + vals["h_in"].sum(axis=1) - vals["h_out"].sum(axis=1)
+        blocks.append(dict(block=b, start=r.start, end=r.stop, objective=res["objective"], gap=res["gap"],
+                           build_time=res["build_time"], solve_time=res["solve_time"]))
+    log(f"✅ 細解：{len(ranges)} 段平行 {fine_time:.1f} 秒｜依序重解 {repaired} 段")
+
+    plan["arcs"] = arcs
+    plan["coarse"] = dict(objective=sol.objective, gap=sol.gap, time=coarse_time, periods=len(ranges))
+    plan["blocks"] = blocks
+    plan["fine_time"] = fine_time
+    plan["repaired"] = repaired
+    plan["objective"] = (plan["W_borrow"].sum() + plan["W_return"].sum()
+                         + α * plan["x"].sum() + β * (plan["h_in"].sum() + plan["h_out"].sum()))
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多解析度求解：先解粗時段，再平行細解各段")
+    parser.add_argument("location")
+    parser.add_argument("--block", type=int, default=4, help="每個粗時段的期數（需大於調度延遲）")
+    parser.add_argument("--coarse-time-limit", type=float, default=60, help="粗解的時間上限（秒）")
+    parser.add_argument("--time-limit", type=float, default=60, help="每段細解的時間上限（秒）")
+    parser.add_argument("--mip-gap", type=float, default=0.05)
+    parser.add_argument("--k", type=int, default=8, help="每站只建立到最近 k 站的調度弧")
+    parser.add_argument("--radius", type=float, default=2.0, help="調度弧最大距離（公里）")
+    parser.add_argument("--backend", choices=["auto", "gurobi", "highs"], default="auto",
+                        help="auto：有 Gurobi 完整授權時用 Gurobi，否則用 HiGHS")
+    parser.add_argument("--formulation", choices=["standard", "compact"], default="standard")
+    parser.add_argument("--workers", type=int, default=None, help="平行子程序數")
+    parser.add_argument("--compare-flat", action="store_true", help="另解單一完整解析度模型並比較目標值")
+    parser.add_argument("--flat-time-limit", type=float, default=600, help="完整模型的時間上限（秒）")
+    args = parser.parse_args()
+
+    loc = args.location
+    backend = default_backend() if args.backend == "auto" else args.backend
+    os.makedirs("results", exist_ok=True)
+    tel = RunTelemetry("hierarchical", loc, vars(args))
+
+    start_time = time_time.time()
+    with tel.phase("load"):
+        demand = load_demand(loc)
+        stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+        lat, lon = load_coordinates(stations)
+    B0 = (0.35 * C).astype(int)
+    hide_cap = (0.4 * C).astype(int)
+    arcs = candidate_arcs(lat, lon, k=args.k, radius_km=args.radius)
+    params = dict(μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay)
+
+    with tel.phase("solve"):
+        plan = hierarchical_solve(C, D_borrow, D_return, B0, hide_cap, arcs=arcs, block=args.block,
+                                  coarse_time_limit=args.coarse_time_limit, time_limit=args.time_limit,
+                                  mip_gap=args.mip_gap, backend=backend, formulation=args.formulation,
+                                  workers=args.workers, **params)
+    solve_time = time_time.time() - start_time
+
+    flat = None
+    if args.compare_flat:
+        with tel.phase("compare_flat"):
+            mm = build_matrices(C, D_borrow, D_return, B0, hide_cap, arcs=arcs, formulation=args.formulation,
+                                **params)
+            flat = make_backend(mm, backend, "YouBike_Flat").solve(time_limit=args.flat_time_limit,
+                                                                   mip_gap=args.mip_gap)
+
+    with tel.phase("write"):
+        dispatch_df, hide_df = extract_frames(arcs, plan["x"], plan["h_in"], plan["h_out"], stations, times, sna_map)
+        dispatch_df.to_csv(f"./results/hierarchical_dispatch-{loc}.csv", index=False)
+        hide_df.to_csv(f"./results/hierarchical_hide-{loc}.csv", index=False)
+
+    coarse = plan["coarse"]
+    lines = [
+        "=== 結果總結（多解析度）===",
+        f"🎯 總成本 (Objective): {plan['objective']:.2f}",
+        f"🔭 粗解: {coarse['periods']} 段 × {args.block} 期，成本 {coarse['objective']:.2f}，{coarse['time']:.2f} 秒",
+        f"🧩 細解: 平行 {plan['fine_time']:.2f} 秒，依序重解 {plan['repaired']} 段",
+        f"🚚 總調度數量: {int(plan['x'].sum())}",
+        f"📦 總藏車數量: {int(plan['h_in'].sum())}",
+        f"🔓 總釋放數量: {int(plan['h_out'].sum())}",
+    ]
+    if flat is not None:
+        lines.append(f"📉 完整模型目標值: {flat.objective:.2f}（gap {flat.gap:.2%}，{flat.solve_time:.2f} 秒），"
+                     f"差距: {plan['objective'] - flat.objective:.2f} "
+                     f"({(plan['objective'] - flat.objective) / flat.objective:.2%})")
+    lines.append(f"⏱️ 運行時間: {solve_time:.2f} 秒")
+    with open(f"./results/hierarchical_summary-{loc}.txt", "w", encoding="utf-8") as f:
+        f.write("".join(line + "\n" for line in lines))
+    for line in lines:
+        print(line)
+    tel.set(objective=plan["objective"], coarse_objective=coarse["objective"], repaired=plan["repaired"],
+            flat_objective=None if flat is None else flat.objective)
+    tel.write()
@@ -0,0 +1,230 @@
+from model_builder import build_matrices, extract_frames
+from backends import make_backend, default_backend
+from decompose import fixed_net_flow
+from demand_store import load_demand
+from spatial import load_coordinates, candidate_arcs
+from greedy import greedy_plan
+from warmstart import greedy_start
+from telemetry import RunTelemetry
+from scipy.spatial import cKDTree
+import argparse
+import os
+import time as time_time
+import numpy as np
+import pandas as pd
+
+# === 大鄰域搜尋（LNS）===
+# 以貪婪法（修補為模型可行）的計畫為起點，每輪釋放一個鄰域、其餘決策固定，只重解該子問題：
+#   cluster：隨機一站及其最近的 size 站，整天的決策；
+#   wait   ：依目前等待成本加權抽出 size 個站，整天的決策；
+#   window ：較大的空間群（window_factor × size 站），只釋放連續 window 期的決策。
+# 子問題與分解法的協調模型相同：鄰域外的調度視為已知流入／流出，每期調度量 K 與拜訪次數扣除鄰域外已用量，
+# 目前的解在子問題中可行，因此只接受更好的子解時總成本單調下降。可隨時以 time_budget 截止，並記錄成本曲線。
+
+μ = 6
+α = 1
+β = 0.04
+L = 20
+T_num = 30
+max_visit = 3
+K = T_num * L
+delay = 2
+
+KINDS = ("cluster", "wait", "window")
+DECISIONS = ("x", "v", "h_in", "h_out")
+STATION_BLOCKS = ("h_in", "h_out", "B", "W_borrow", "W_return")
+
+
+def plan_objective(plan, α=α, β=β):
+    return (plan["W_borrow"].sum() + plan["W_return"].sum() + α * plan["x"].sum()
+            + β * (plan["h_in"].sum() + plan["h_out"].sum()))
+
+
+def pick_neighbourhood(kind, rng, plan, tree, size, window, window_factor, T):
+    """回傳 (站點索引, 釋放的期數範圍或 None 表示整天)。"""
+    S = plan["B"].shape[0]
+    if kind == "wait":
+        wait = (plan["W_borrow"] + plan["W_return"]).sum(axis=1) + 1e-9
+        P = rng.choice(S, size=min(size, S), replace=False, p=wait / wait.sum())
+        return np.sort(P), None
+    n = min(size * (window_factor if kind == "window" else 1), S)
+    _, P = tree.query(tree.data[rng.integers(S)], k=n)
+    P = np.sort(np.atleast_1d(P))
+    if kind == "window":
+        t0 = int(rng.integers(0, max(T - window, 0) + 1))
+        return P, range(t0, min(t0 + window, T))
+    return P, None
+
+
+def lns_solve(C, D_borrow, D_return, B0, hide_cap, μ, α, β, L, K, T_num, max_visit, delay, lat, lon, arcs, start,
+              time_budget=60, sub_time_limit=10, size=10, window=6, window_factor=3, mip_gap=0.01,
+              backend="highs", formulation="standard", seed=0, log=print):
+    """
+    start：全模型各欄區塊的可行解（x、v 為 (A, T)，其餘為 (S, T)）。
+    回傳 dict：改善後的計畫、objective，以及 curve [(秒, 成本, 鄰域種類)] 與各輪紀錄 iterations。
+    """
+    begin = time_time.time()
+    S, T = D_borrow.shape
+    rng = np.random.default_rng(seed)
+    params = dict(μ=μ, α=α, β=β, L=L, T_num=T_num, max_visit=max_visit, delay=delay)
+    K_total = np.broadcast_to(np.asarray(K, dtype=float), (T,))
+    visits_total = T_num * max_visit
+    B0 = np.asarray(B0, dtype=float)
+    hide_cap = np.asarray(hide_cap)
+
+    plan = {name: np.asarray(start[name], dtype=float).reshape(-1, T).copy()
+            for name in DECISIONS + ("B", "W_borrow", "W_return")}
+    coslat = np.cos(np.radians(np.nanmean(lat))) if np.isfinite(lat).any() else 1.0
+    xy = np.column_stack([np.nan_to_num(lon * coslat), np.nan_to_num(lat)])
+    tree = cKDTree(xy)
+
+    objective = plan_objective(plan, α, β)
+    curve = [(0.0, objective, "start")]
+    iterations = []
+    weights = np.ones(len(KINDS))
+    log(f"🚀 起始成本 {objective:.2f}")
+
+    while True:
+        remaining = time_budget - (time_time.time() - begin)
+        if remaining < 0.5:
+            break
+        k = rng.choice(len(KINDS), p=weights / weights.sum())
+        kind = KINDS[k]
+        P, free = pick_neighbourhood(kind, rng, plan, tree, size, window, window_factor, T)
+
+        # === 子問題：鄰域內的站與兩端皆在鄰域內的弧 ===
+        inside = np.zeros(S, dtype=bool)
+        inside[P] = True
+        inner = inside[arcs[:, 0]] & inside[arcs[:, 1]]
+        local = np.full(S, -1)
+        local[P] = np.arange(len(P))
+        arrivals = fixed_net_flow(arcs[~inner], plan["x"][~inner], S, delay)[P]
+        K_rem = np.maximum(K_total - plan["x"][~inner].sum(axis=0), 0)
+        visit_rem = max(visits_total - int(round(plan["v"][~inner].sum())), 0)
+        mm = build_matrices(C[P], D_borrow[P], D_return[P], B0[P], hide_cap[P], arcs=local[arcs[inner]],
+                            arrivals=arrivals, K=K_rem, visit_budget=visit_rem, formulation=formulation, **params)
+
+        sub_start = {name: plan[name][inner] for name in ("x", "v")}
+        sub_start.update({name: plan[name][P] for name in STATION_BLOCKS})
+        if "H" in mm.cols:
+            sub_start["H"] = np.cumsum(sub_start["h_in"] - sub_start["h_out"], axis=1)
+            sub_start["z"] = (sub_start["h_in"] > 0).astype(float)
+        if free is not None:
+            # 視窗外的決策固定為目前的值
+            fixed = np.ones(T, dtype=bool)
+            fixed[list(free)] = False
+            for name in DECISIONS:
+                cb = mm.cols[name]
+                value = sub_start[name]
+                mask = np.broadcast_to(fixed, value.shape).ravel()
+                cb.lb[mask] = value.ravel()[mask]
+                cb.ub[mask] = value.ravel()[mask]
+        current = (sub_start["W_borrow"].sum() + sub_start["W_return"].sum() + α * sub_start["x"].sum()
+                   + β * (sub_start["h_in"].sum() + sub_start["h_out"].sum()))
+
+        solver = make_backend(mm, backend, "YouBike_LNS")
+        solver.set_start({name: value.ravel() for name, value in sub_start.items()})
+        try:
+            sol = solver.solve(time_limit=min(sub_time_limit, remaining), mip_gap=mip_gap, threads=1)
+        except RuntimeError:
+            sol = None
+        improved = sol is not None and sol.objective < current - 1e-6
+        if improved:
+            vals = {name: val.reshape(-1, T) for name, val in sol.values.items()}
+            for name in ("x", "v"):
+                plan[name][inner] = vals[name]
+            for name in STATION_BLOCKS:
+                plan[name][P] = vals[name]
+            for name in ("v", "h_in", "h_out"):
+                plan[name][...] = np.round(plan[name])
+            # MIP gap 容許 W 有鬆弛，依 B 重算為實際等待成本
+            B = plan["B"][P]
+            plan["W_borrow"][P] = np.maximum(D_borrow[P] - B, 0) / μ
+            plan["W_return"][P] = np.maximum(D_return[P] - (C[P, None] - B), 0) / μ
+            objective = plan_objective(plan, α, β)
+            weights[k] += 1
+            curve.append((time_time.time() - begin, objective, kind))
+            log(f"✨ {time_time.time() - begin:7.1f} 秒｜{kind:<7}｜{len(P)} 站｜成本 {objective:.2f}")
+        iterations.append(dict(kind=kind, stations=len(P), arcs=int(inner.sum()),
+                               periods=T if free is None else len(free), current=current,
+                               found=None if sol is None else sol.objective, improved=improved,
+                               solve_time=None if sol is None else sol.solve_time))
+
+    plan["objective"] = plan_objective(plan, α, β)
+    plan["curve"] = curve
+    plan["iterations"] = iterations
+    plan["arcs"] = arcs
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以貪婪法為起點的大鄰域搜尋，可隨時截止")
+    parser.add_argument("location")
+    parser.add_argument("time_budget", nargs="?", type=float, default=120, help="總時間上限（秒）")
+    parser.add_argument("--sub-time-limit", type=float, default=10, help="每個子問題的時間上限（秒）")
+    parser.add_argument("--size", type=int, default=10, help="每個鄰域的站點數")
+    parser.add_argument("--window", type=int, default=6, help="時間視窗鄰域的期數")
+    parser.add_argument("--window-factor", type=int, default=3, help="時間視窗鄰域的站點數倍率")
+    parser.add_argument("--mip-gap", type=float, default=0.01, help="子問題的 MIP gap")
+    parser.add_argument("--k", type=int, default=8, help="每站只建立到最近 k 站的調度弧")
+    parser.add_argument("--radius", type=float, default=2.0, help="調度弧最大距離（公里）")
+    parser.add_argument("--backend", choices=["auto", "gurobi", "highs"], default="auto",
+                        help="子問題求解器；auto：有 Gurobi 完整授權時用 Gurobi，否則用 HiGHS")
+    parser.add_argument("--formulation", choices=["standard", "compact"], default="standard")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    loc = args.location
+    backend = default_backend() if args.backend == "auto" else args.backend
+    os.makedirs("results", exist_ok=True)
+    tel = RunTelemetry("lns", loc, vars(args))
+
+    start_time = time_time.time()
+    with tel.phase("load"):
+        demand = load_demand(loc)
+    stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+    B0 = (0.35 * C).astype(int)
+    hide_cap = (0.4 * C).astype(int)
+    params = dict(μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay)
+
+    # === 起始解：貪婪法修補為模型可行 ===
+    with tel.phase("build"):
+        lat, lon = load_coordinates(stations)
+        arcs = candidate_arcs(lat, lon, k=args.k, radius_km=args.radius)
+        mm = build_matrices(C, D_borrow, D_return, B0, hide_cap, arcs=arcs, **params)
+        dispatch_result, hide_result, _ = greedy_plan(demand)
+        start = greedy_start(mm, stations, times, dispatch_result, hide_result, C, B0, D_borrow, D_return, hide_cap,
+                             μ=μ, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay)
+
+    with tel.phase("solve"):
+        plan = lns_solve(C, D_borrow, D_return, B0, hide_cap, lat=lat, lon=lon, arcs=arcs, start=start,
+                         time_budget=args.time_budget, sub_time_limit=args.sub_time_limit, size=args.size,
+                         window=args.window, window_factor=args.window_factor, mip_gap=args.mip_gap, backend=backend,
+                         formulation=args.formulation, seed=args.seed, **params)
+    tel.trajectory.extend([[t, obj, None] for t, obj, _ in plan["curve"]])
+
+    with tel.phase("write"):
+        dispatch_df, hide_df = extract_frames(arcs, plan["x"], plan["h_in"], plan["h_out"], stations, times, sna_map)
+        dispatch_df.to_csv(f"./results/lns_dispatch-{loc}.csv", index=False)
+        hide_df.to_csv(f"./results/lns_hide-{loc}.csv", index=False)
+        pd.DataFrame(plan["curve"], columns=["seconds", "objective", "neighbourhood"]).to_csv(
+            f"./results/lns_curve-{loc}.csv", index=False)
+
+    iters = pd.DataFrame(plan["iterations"])
+    end_time = time_time.time()
+    lines = [
+        "=== 結果總結（LNS） ===",
+        f"🎯 總成本: {plan['objective']:.2f}（起始 {plan['curve'][0][1]:.2f}）",
+        f"🚚 總調度數量: {int(round(plan['x'].sum()))}",
+        f"📦 總藏車數量: {int(plan['h_in'].sum())}",
+        f"🔓 總釋放數量: {int(plan['h_out'].sum())}",
+        f"🔁 迭代 {len(iters)} 輪，改善 {int(iters['improved'].sum()) if len(iters) else 0} 輪（求解器 {backend}）",
+        f"⏱️ 運行時間: {end_time - start_time:.2f} 秒",
+    ]
+    with open(f"./results/lns_summary-{loc}.txt", "w", encoding="utf-8") as f:
+        f.write("".join(line + "\n" for line in lines))
+    for line in lines:
+        print(line)
+    tel.set(objective=plan["objective"], stations=len(stations), periods=len(times), arcs=len(arcs),
+            iterations=len(iters))
+    tel.write()
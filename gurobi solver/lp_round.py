@@ -0,0 +1,182 @@
+import copy
+import time as time_time
+import numpy as np
+import scipy.sparse as sp
+from model_builder import CONTINUOUS, ColBlock, RowBlock
+from backends import make_backend, Solution
+
+# === LP 鬆弛＋取整修復快速求解 ===
+# 1. 鬆弛：所有整數／二元變數改為連續並去掉 h_in * h_out == 0，解 LP，得到原模型的下界。
+#    v 沒有成本，鬆弛後最佳時 v = x / 連結上限，因此 LP 中不建 v 與連結限制式，
+#    改為 x 的上界與「Σ x / 連結上限 <= 拜訪次數」一列，變數與限制式約少 A * T 個；
+#    固定 v 之後的 LP 只保留開啟的 (弧, 期) 的 x 欄，模型只比站點部分稍大；
+# 2. 拜訪取整：依 LP 調度量由大到小開啟 (弧, 期)（v = 1），最多用完拜訪次數，其餘 v = 0；
+#    固定 v 後再解一次 LP，使調度量與開啟的弧一致；
+# 3. 藏車取整：逐期把各站的累積藏車量取整（就近取整，若使庫存超出 [0, 容量]、超過藏車上限
+#    或釋放超過庫存則改取另一側），每期只留淨藏車或淨釋放，互斥條件自然成立；
+#    兩側都不合條件時維持上期的累積量（不藏也不釋放；整數模型中釋放後須留有不少於釋放量的藏車，
+#    LP 常以逐期減半的方式釋放，取整後只能留著），仍不合條件的站記為無法取整；
+# 4. 修復：固定 v 與可取整站的 h_in、h_out，其餘站的 h 保持整數並固定藏車／釋放方向，
+#    重新分配調度量與庫存（所有站都可取整時即為 LP）。仍不可行時，所有站的 h 都改為整數重解。
+# 回報的 gap 為修復後成本相對 LP 下界的差距，是與最佳解距離的上界。
+
+
+def _copy_model(mm):
+    # 欄區塊的上下界與型態會被修改，複製一份；列區塊只讀
+    out = copy.copy(mm)
+    out.cols = {name: copy.deepcopy(cb) for name, cb in mm.cols.items()}
+    out.exclusive = list(mm.exclusive)
+    return out
+
+
+def relaxed(mm, v=None):
+    """
+    mm 的 LP 鬆弛：整數與二元變數改為連續，去掉互斥條件（含 compact 的 z），並消去 v。
+    v 為 None 時以 Σ x / 連結上限 <= 拜訪次數 取代連結限制式；給定 v（一維 0/1）時只保留 v = 1 的 x 欄
+    （x <= 連結上限），其在原 x 中的位置記於 x_index。
+    """
+    lp = _copy_model(mm)
+    cap = mm.link_cap.ravel().astype(float)
+    for cb in lp.cols.values():
+        cb.vtype = CONTINUOUS
+    lp.exclusive = []
+    lp.rows = {name: rb for name, rb in mm.rows.items()
+               if name not in ("link", "visit_budget", "hide_switch_in", "hide_switch_out")}
+    del lp.cols["v"]
+    lp.cols.pop("z", None)
+    x = lp.cols["x"]
+    if v is None:
+        x.ub = np.minimum(x.ub, cap * mm.cols["v"].ub)
+        if "visit_budget" in mm.rows:
+            per_visit = np.divide(1.0, cap, out=np.zeros_like(cap), where=cap > 0)
+            lp.add_rows("visit_budget", {"x": sp.csr_matrix(per_visit[None, :])}, "<", mm.rows["visit_budget"].rhs)
+    else:
+        keep = np.flatnonzero(v > 0.5)
+        lp.cols["x"] = ColBlock("x", len(keep), lb=x.lb[keep], ub=np.minimum(x.ub[keep], cap[keep]), obj=x.obj[keep])
+        lp.rows = {name: RowBlock(name, {col: m.tocsc()[:, keep] if col == "x" else m
+                                         for col, m in rb.coeffs.items()}, rb.sense, rb.rhs)
+                   for name, rb in lp.rows.items()}
+        lp.x_index = keep
+    return lp
+
+
+def _full_x(lp, values, size):
+    # 只含開啟弧的 x 還原為原本的長度
+    x = np.zeros(size)
+    x[lp.x_index] = values["x"]
+    return dict(values, x=x)
+
+
+def round_visits(mm, x, eps=1e-6):
+    """LP 調度量 x（一維）> eps 的 (弧, 期) 依調度量由大到小開啟，最多 visit_budget 個，回傳 v（一維 0/1）。"""
+    v = mm.cols["v"]
+    budget = int(np.floor(mm.rows["visit_budget"].rhs[0] + eps)) if "visit_budget" in mm.rows else v.size
+    candidates = np.flatnonzero((x > eps) & (v.ub > 0))
+    chosen = candidates[np.argsort(-x[candidates], kind="stable")[:budget]]
+    out = np.zeros(v.size)
+    out[chosen] = 1.0
+    return out
+
+
+def round_hides(mm, h_in, h_out, B, eps=1e-6):
+    """
+    逐期將累積藏車量取整，回傳整數 (h_in, h_out)（皆為 (S, T)）與無法取整的站 (S,) 布林陣列。
+    B 為同一 LP 解的庫存；累積藏車量改變 δ 時庫存改變 -δ，用來檢查取整後仍在 [0, 容量] 內。
+    """
+    S, T = mm.S, mm.T
+    C = mm.rows["capacity"].rhs.reshape(S, T)[:, 0]
+    cap = mm.rows["hide_cap"].rhs.reshape(S, T)[:, 0]
+    if "hide_stock" in mm.rows:
+        H0 = mm.rows["hide_stock"].rhs.reshape(S, T)[:, 0]
+    else:
+        H0 = mm.rows["release_stock"].rhs.reshape(S, T)[:, 0]
+    H = np.cumsum(h_in - h_out, axis=1)
+
+    Hr = np.zeros((S, T))
+    prev = np.zeros(S)
+    bad = np.zeros(S, dtype=bool)
+    for t in range(T):
+        near = np.round(H[:, t])
+        other = np.where(near > H[:, t], np.floor(H[:, t] + eps), np.ceil(H[:, t] - eps))
+
+        def ok(c):
+            B_new = B[:, t] + H[:, t] - c
+            step = c - prev
+            return ((B_new >= -eps) & (B_new <= C + eps) & (step <= cap + eps)
+                    & (H0 + c >= np.maximum(-step, 0) - eps) & (H0 + c >= -eps))
+
+        near_ok, other_ok, keep_ok = ok(near), ok(other), ok(prev)
+        Hr[:, t] = np.where(near_ok, near, np.where(other_ok, other, np.where(keep_ok, prev, near)))
+        bad |= ~(near_ok | other_ok | keep_ok)
+        prev = Hr[:, t]
+    step = np.diff(np.hstack([np.zeros((S, 1)), Hr]), axis=1)
+    return np.maximum(step, 0.0), np.maximum(-step, 0.0), bad
+
+
+def repair_model(mm, v, h_in, h_out, release, free):
+    """
+    固定 v 的 LP 模型，free 以外的站固定 h_in、h_out；free 站的 h 保持整數，
+    並依 release（一維，LP 釋放量大於藏車量）固定只可藏車或只可釋放。
+    """
+    model = relaxed(mm, v)
+    free = np.repeat(free, mm.T)
+    for name, value in (("h_in", h_in), ("h_out", h_out)):
+        cb = model.cols[name]
+        cb.lb[~free] = value.ravel()[~free]
+        cb.ub[~free] = value.ravel()[~free]
+        if free.any():
+            cb.vtype = mm.cols[name].vtype
+    model.cols["h_in"].ub[free & release] = 0.0
+    model.cols["h_out"].ub[free & ~release] = 0.0
+    return model
+
+
+def lp_round_solve(mm, backend="gurobi", time_limit=60, repair_time_limit=None, mip_gap=0.01, threads=None,
+                   progress=None, log=print):
+    """
+    回傳 Solution：values / objective 為修復後的整數可行解，bound 為 LP 下界，gap = (objective - bound) / objective。
+    repair_time_limit：修復步驟（有無法取整的站時為小型 MIP）的時間上限，預設與 time_limit 相同。
+    """
+    start_time = time_time.time()
+    S, T = mm.S, mm.T
+
+    # === LP 鬆弛：下界 ===
+    lp = make_backend(relaxed(mm), backend, "YouBike_LP").solve(time_limit=time_limit, mip_gap=0.0, threads=threads)
+    bound = lp.objective
+    log(f"📏 LP 鬆弛：下界 {bound:.2f}｜{lp.solve_time:.2f} 秒")
+
+    # === 拜訪取整，固定 v 後重解 LP ===
+    v = round_visits(mm, lp.values["x"])
+    model = relaxed(mm, v)
+    values = make_backend(model, backend, "YouBike_LP_Visits").solve(
+        time_limit=time_limit, mip_gap=0.0, threads=threads).values
+    values = _full_x(model, values, mm.cols["x"].size)
+
+    # === 藏車取整，固定 v 與可取整站的 h 後重解 ===
+    h_in, h_out, bad = round_hides(mm, values["h_in"].reshape(S, T), values["h_out"].reshape(S, T),
+                                   values["B"].reshape(S, T))
+    release = values["h_out"] > values["h_in"] + 1e-6
+    try:
+        model = repair_model(mm, v, h_in, h_out, release, bad)
+        sol = make_backend(model, backend, "YouBike_LP_Round").solve(
+            time_limit=repair_time_limit or time_limit, mip_gap=mip_gap, threads=threads)
+        log(f"🔧 取整修復：成本 {sol.objective:.2f}｜開啟 {int(v.sum())} 條 (弧, 期)｜"
+            f"{int(bad.sum())} 站以整數重解藏車")
+    except RuntimeError:
+        model = repair_model(mm, v, h_in, h_out, release, np.ones(S, dtype=bool))
+        sol = make_backend(model, backend, "YouBike_Repair").solve(
+            time_limit=repair_time_limit or time_limit, mip_gap=mip_gap, threads=threads)
+        log(f"🔧 取整後不可行，所有站以整數重解藏車：成本 {sol.objective:.2f}｜{sol.solve_time:.2f} 秒")
+    # 補回 LP 中消去的欄區塊
+    values = _full_x(model, sol.values, mm.cols["x"].size)
+    values["v"] = v
+    if "z" in mm.cols:
+        values["z"] = (values["h_out"] < 0.5).astype(float)
+    sol.values = {name: values[name] for name in mm.cols}
+
+    gap = max(sol.objective - bound, 0.0) / abs(sol.objective) if sol.objective else 0.0
+    solve_time = time_time.time() - start_time
+    if progress is not None:
+        progress.append([solve_time, sol.objective, bound])
+    return Solution(sol.values, sol.objective, gap, sol.status, sol.num_vars, sol.num_constrs,
+                    lp.build_time + sol.build_time, solve_time, num_nonzeros=sol.num_nonzeros, bound=bound)
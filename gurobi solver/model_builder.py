@@ -0,0 +1,321 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# === 矩陣式建模工具 ===
+# 與 quicksolve.py 原本逐條 addConstr 的模型完全相同，
+# 但所有限制式都先組成稀疏係數矩陣，再以 addMConstr 一次加入 Gurobi。
+#
+# 變數排列（皆為一維，時間為最內層索引）：
+#   x, v           : 弧 a = (i, j) × 期 t  → a * T + t
+#   h_in, h_out    : 站 i × 期 t           → i * T + t
+#   B, W_borrow, W_return : 同上
+#
+# 變數型態與限制式方向沿用 Gurobi 的字元代碼，模型本身不依賴 gurobipy。
+
+CONTINUOUS, BINARY, INTEGER = "C", "B", "I"
+
+
+def full_arcs(n):
+    """所有有序站點對 (i, j)，i != j，依 (i, j) 字典序排列。"""
+    i, j = np.nonzero(~np.eye(n, dtype=bool))
+    return np.column_stack([i, j])
+
+
+class ColBlock:
+    def __init__(self, name, size, lb=0.0, ub=np.inf, vtype=CONTINUOUS, obj=0.0):
+        self.name = name
+        self.size = size
+        self.lb = np.broadcast_to(np.asarray(lb, dtype=float), (size,)).copy()
+        self.ub = np.broadcast_to(np.asarray(ub, dtype=float), (size,)).copy()
+        self.vtype = vtype
+        self.obj = np.broadcast_to(np.asarray(obj, dtype=float), (size,)).copy()
+
+
+class RowBlock:
+    def __init__(self, name, coeffs, sense, rhs):
+        self.name = name
+        self.coeffs = coeffs    # {欄區塊名稱: 稀疏矩陣}
+        self.sense = sense      # "<", ">", "="
+        self.rhs = np.asarray(rhs, dtype=float)
+
+
+class MatrixModel:
+    """以欄區塊／列區塊描述的稀疏模型，與求解器無關。"""
+
+    def __init__(self, S, T, arcs):
+        self.S = S
+        self.T = T
+        self.arcs = arcs
+        self.cols = {}
+        self.rows = {}
+        self.exclusive = []  # (欄區塊 a, 欄區塊 b)：a * b == 0（逐元素）
+        self.implied_ub = {}  # 由其他限制式推得的上界，供線性化互斥條件使用（不加入模型）
+
+    def add_cols(self, name, size, **kw):
+        self.cols[name] = ColBlock(name, size, **kw)
+
+    def add_rows(self, name, coeffs, sense, rhs):
+        self.rows[name] = RowBlock(name, coeffs, sense, rhs)
+
+    def row_matrix(self, rb):
+        # 將列區塊展開為對應全部欄位的 CSR 矩陣
+        n_rows = len(rb.rhs)
+        parts = [rb.coeffs.get(name, sp.csr_matrix((n_rows, cb.size))) for name, cb in self.cols.items()]
+        return sp.hstack(parts, format="csr")
+
+    @property
+    def num_vars(self):
+        return sum(cb.size for cb in self.cols.values())
+
+
+def _coo(rows, cols, vals, shape):
+    return sp.csr_matrix((np.asarray(vals, dtype=float), (rows, cols)), shape=shape)
+
+
+def build_matrices(C, D_borrow, D_return, B0, hide_cap, μ, α, β, L, K, T_num, max_visit, delay, arcs=None,
+                   H0=None, arrivals=None, first_period_flows=False, visit_budget=None,
+                   formulation="standard", tight_links=False):
+    """
+    H0: 期初已藏車數 (S,)；arrivals: 前一段已出發、於本段各期抵達的車數 (S, T)；
+    first_period_flows: 第 0 期是否計入調度流入／流出（滾動視窗的非首段為 True）；
+    visit_budget: 本段可用拜訪次數，預設 T_num * max_visit；K 可為純量或各期上限 (T,)。
+    formulation: "standard" 為原模型；"compact" 以藏車庫存狀態變數 H 取代累積和限制式，
+    並以二元變數 z 線性化 h_in * h_out == 0（純線性 MIP，可行解集合與原模型相同）。
+    tight_links: 連結限制式的係數改用 link_caps 推得的上界（不改變可行解集合）。
+    """
+    S, T = D_borrow.shape
+    if arcs is None:
+        arcs = full_arcs(S)
+    if visit_budget is None:
+        visit_budget = T_num * max_visit
+    A = len(arcs)
+    ST, AT = S * T, A * T
+    orig, dest = arcs[:, 0], arcs[:, 1]
+    compact = formulation == "compact"
+    if formulation not in ("standard", "compact"):
+        raise ValueError(f"未知的模型形式: {formulation}")
+
+    t0 = 0 if first_period_flows else 1
+    mm = MatrixModel(S, T, arcs)
+    mm.link_cap = (link_caps(C, hide_cap, L, K, T, delay, arcs, t0) if tight_links
+                   else np.full((A, T), float(L)))
+    mm.add_cols("x", AT, vtype=CONTINUOUS, obj=α)
+    mm.add_cols("v", AT, ub=1.0, vtype=BINARY)
+    mm.add_cols("h_in", ST, vtype=INTEGER, obj=β)
+    mm.add_cols("h_out", ST, vtype=INTEGER, obj=β)
+    mm.add_cols("B", ST)
+    mm.add_cols("W_borrow", ST, obj=1.0)
+    mm.add_cols("W_return", ST, obj=1.0)
+    if compact:
+        mm.add_cols("H", ST)                        # 期末累積藏車
+        mm.add_cols("z", ST, ub=1.0, vtype=BINARY)  # 1：本期只可藏車；0：本期只可釋放
+
+    eye = sp.identity(ST, format="csr")
+    st = np.arange(ST).reshape(S, T)
+    at = np.arange(AT).reshape(A, T)
+
+    # --- 庫存平衡：B[i,t] - B[i,t-1] - 流入 + 流出 - h_out + h_in = (t==0 ? B0 : 0) ---
+    # 一天的第 0 期與原模型相同，不含流入與流出
+    prev = _coo(st[:, 1:].ravel(), st[:, :-1].ravel(), -np.ones(S * (T - 1)), (ST, ST))
+    t_out = np.arange(t0, T)
+    out_rows = (orig[:, None] * T + t_out[None, :]).ravel()
+    out_cols = at[:, t0:].ravel()
+    t_in = np.arange(max(t0, delay), T)
+    in_rows = (dest[:, None] * T + t_in[None, :]).ravel()
+    in_cols = at[:, t_in - delay].ravel()
+    flow = _coo(np.concatenate([out_rows, in_rows]), np.concatenate([out_cols, in_cols]),
+                np.concatenate([np.ones(len(out_rows)), -np.ones(len(in_rows))]), (ST, AT))
+    rhs = np.zeros((S, T)) if arrivals is None else np.asarray(arrivals, dtype=float).copy()
+    rhs[:, 0] += B0
+    mm.add_rows("balance", {"B": eye + prev, "x": flow, "h_out": -eye, "h_in": eye}, "=", rhs.ravel())
+
+    # --- 容量 ---
+    mm.add_rows("capacity", {"B": eye}, "<", np.repeat(C, T))
+
+    # --- 等待時間：W_borrow >= (D_borrow - B) / μ，W_return >= (D_return - (C - B)) / μ ---
+    mm.add_rows("wait_borrow", {"W_borrow": eye, "B": eye / μ}, ">", D_borrow.ravel() / μ)
+    mm.add_rows("wait_return", {"W_return": eye, "B": -eye / μ}, ">", (D_return - C[:, None]).ravel() / μ)
+
+    # --- 藏車上限 ---
+    mm.add_rows("hide_cap", {"h_in": eye}, "<", np.repeat(hide_cap, T))
+
+    stock0 = np.zeros(ST) if H0 is None else np.repeat(np.asarray(H0, dtype=float), T)
+    # h_in[t] <= 藏車上限；h_out[t] <= 期初藏車 + 前 t+1 期最多藏入的車數
+    mm.implied_ub["h_in"] = np.repeat(np.asarray(hide_cap, dtype=float), T)
+    mm.implied_ub["h_out"] = stock0 + np.outer(hide_cap, np.arange(1, T + 1)).ravel()
+
+    if compact:
+        # --- 藏車庫存：H[t] = H[t-1] + h_in[t] - h_out[t]，H[-1] = H0 ---
+        h_rhs = np.zeros((S, T))
+        h_rhs[:, 0] = 0 if H0 is None else H0
+        mm.add_rows("hide_stock", {"H": eye + prev, "h_in": -eye, "h_out": eye}, "=", h_rhs.ravel())
+        # --- 釋放不超過累積藏車（與原模型的累積和限制式等價）：h_out[t] <= H[t] ---
+        mm.add_rows("release_stock", {"h_out": eye, "H": -eye}, "<", np.zeros(ST))
+        # --- 藏車／釋放互斥：h_in <= U_in * z，h_out <= U_out * (1 - z) ---
+        mm.add_rows("hide_switch_in", {"h_in": eye, "z": -sp.diags(mm.implied_ub["h_in"])}, "<", np.zeros(ST))
+        mm.add_rows("hide_switch_out", {"h_out": eye, "z": sp.diags(mm.implied_ub["h_out"])}, "<",
+                    mm.implied_ub["h_out"])
+    else:
+        # --- 藏車／釋放互斥：h_in * h_out == 0 ---
+        mm.exclusive.append(("h_in", "h_out"))
+
+        # --- 釋放不超過累積藏車：h_out[t] <= Σ_{τ<=t} (h_in[τ] - h_out[τ]) ---
+        tril = sp.kron(sp.identity(S), sp.tril(np.ones((T, T))), format="csr")
+        mm.add_rows("release_stock", {"h_out": tril + eye, "h_in": -tril}, "<", stock0)
+
+    # --- 每期調度總量 ---
+    per_period = sp.kron(np.ones((1, A)), sp.identity(T), format="csr")
+    mm.add_rows("dispatch_cap", {"x": per_period}, "<", np.broadcast_to(np.asarray(K, dtype=float), (T,)))
+
+    # --- 拜訪次數與調度變數連結：x <= L * v ---
+    eye_a = sp.identity(AT, format="csr")
+    mm.add_rows("link", {"x": eye_a, "v": -sp.diags(mm.link_cap.ravel())}, "<", np.zeros(AT))
+
+    # --- 總拜訪次數限制 ---
+    mm.add_rows("visit_budget", {"v": sp.csr_matrix(np.ones((1, AT)))}, "<", [visit_budget])
+
+    return mm
+
+
+def link_caps(C, hide_cap, L, K, T, delay, arcs, t0=1):
+    """
+    各弧各期調度量的有效上界 (A, T)。弧 (i, j) 於 t 期出發、u = t + delay 期抵達 j 時，由 j 的庫存平衡
+    流入 = B[u] - B[u-1] + 流出 + h_in - h_out - arrivals <= C_j + 流出 + 藏車上限，
+    其中同期流出 <= min(K, j 的出弧數 * L)（u < t0 時不計流出）；抵達不計入模型的時段只受 L 限制。
+    """
+    S, A = len(C), len(arcs)
+    dest = arcs[:, 1]
+    n_out = np.bincount(arcs[:, 0], minlength=S).astype(float)
+    K_t = np.broadcast_to(np.asarray(K, dtype=float), (T,))
+    u = np.arange(T) + delay
+    arrive = (u >= t0) & (u < T)
+    out = np.zeros((S, T))
+    out[:, t0:] = np.minimum(K_t[t0:], n_out[:, None] * L)
+    cap = np.full((A, T), float(L))
+    bound = np.asarray(C, dtype=float)[dest, None] + out[dest][:, u[arrive]] + np.asarray(hide_cap, dtype=float)[dest, None]
+    cap[:, arrive] = np.minimum(L, bound)
+    return cap
+
+
+def state_rhs(mm, C, D_borrow, D_return, B0, μ, H0=None, arrivals=None, visit_budget=None):
+    """
+    build_matrices 中隨期初狀態與需求改變的右手邊 {列區塊名稱: rhs}，供已建好的模型直接更新。
+    H0 改變時，模型建構時的 H0 需不小於之後的值（互斥條件的上界由它推得）。
+    """
+    S, T = mm.S, mm.T
+    rhs = np.zeros((S, T)) if arrivals is None else np.asarray(arrivals, dtype=float).copy()
+    rhs[:, 0] += B0
+    out = dict(balance=rhs.ravel(), wait_borrow=np.asarray(D_borrow).ravel() / μ,
+               wait_return=(D_return - C[:, None]).ravel() / μ)
+    if H0 is not None:
+        if "hide_stock" in mm.rows:
+            h_rhs = np.zeros((S, T))
+            h_rhs[:, 0] = H0
+            out["hide_stock"] = h_rhs.ravel()
+        else:
+            out["release_stock"] = np.repeat(np.asarray(H0, dtype=float), T)
+    if visit_budget is not None:
+        out["visit_budget"] = [visit_budget]
+    return out
+
+
+def to_gurobi(mm, name="YouBike_Multiperiod"):
+    """將 MatrixModel 送進 Gurobi，回傳 (model, 變數 MVar 字典, 限制式 MConstr 字典)。"""
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    m = gp.Model(name)
+    var = {}
+    for cb in mm.cols.values():
+        var[cb.name] = m.addMVar(cb.size, lb=cb.lb, ub=cb.ub, obj=cb.obj, vtype=cb.vtype, name=cb.name)
+    m.ModelSense = GRB.MINIMIZE
+    x_all = gp.hstack([var[name] for name in mm.cols])
+    con = {}
+    for rb in mm.rows.values():
+        con[rb.name] = m.addMConstr(mm.row_matrix(rb), x_all, rb.sense, rb.rhs, name=rb.name)
+    for a, b in mm.exclusive:
+        con[f"{a}*{b}"] = m.addConstr(var[a] * var[b] == 0, name="exclusive")
+    return m, var, con
+
+
+DISPATCH_COLUMNS = ["from_sno", "to_sno", "from_sna", "to_sna", "time", "quantity"]
+HIDE_COLUMNS = ["sno", "sna", "time", "hide", "release"]
+
+
+def nonzero_entries(arcs, x_val, h_in_val, h_out_val):
+    """
+    解中的非零項（稀疏三元組），依輸出順序排列：
+    調度 (弧, 期, 數量) 依 (期, 起點站, 弧) 排序；藏車 (站, 期, 藏車, 釋放) 依 (期, 站) 排序。
+    數量與 int() 相同向零截斷。
+    """
+    arcs = np.asarray(arcs)
+    a, t = np.nonzero(x_val > 0.5)
+    order = np.lexsort((a, arcs[a, 0], t))
+    a, t = a[order], t[order]
+    i, th = np.nonzero((h_in_val > 0.5) | (h_out_val > 0.5))
+    order = np.lexsort((i, th))
+    i, th = i[order], th[order]
+    return dict(arc=a, arc_time=t, quantity=x_val[a, t].astype(np.int64),
+                station=i, hide_time=th, hide=h_in_val[i, th].astype(np.int64),
+                release=h_out_val[i, th].astype(np.int64))
+
+
+def extract_frames(arcs, x_val, h_in_val, h_out_val, stations, times, sna_map):
+    """將解轉為調度與藏車 DataFrame（欄位與列順序與 quicksolve.py 輸出相同）；以陣列索引一次取出非零項。"""
+    nz = nonzero_entries(arcs, x_val, h_in_val, h_out_val)
+    stations = np.asarray(stations, dtype=object)
+    times = np.asarray(times, dtype=object)
+    sna = np.array([sna_map[s] for s in stations], dtype=object)
+    arcs = np.asarray(arcs)
+
+    dispatch = pd.DataFrame()
+    if len(nz["arc"]):
+        i, j = arcs[nz["arc"], 0], arcs[nz["arc"], 1]
+        dispatch = pd.DataFrame(dict(from_sno=stations[i], to_sno=stations[j], from_sna=sna[i], to_sna=sna[j],
+                                     time=times[nz["arc_time"]], quantity=nz["quantity"]))
+    hide = pd.DataFrame()
+    if len(nz["station"]):
+        i = nz["station"]
+        hide = pd.DataFrame(dict(sno=stations[i], sna=sna[i], time=times[nz["hide_time"]],
+                                 hide=nz["hide"], release=nz["release"]))
+    return dispatch, hide
+
+
+def extract_records(arcs, x_val, h_in_val, h_out_val, stations, times, sna_map):
+    """將解轉為調度與藏車紀錄（dict 串列，欄位順序與 quicksolve.py 輸出相同）。"""
+    dispatch, hide = extract_frames(arcs, x_val, h_in_val, h_out_val, stations, times, sna_map)
+    return dispatch.to_dict("records"), hide.to_dict("records")
+
+
+def save_compact(path, arcs, x_val, h_in_val, h_out_val, stations, times, sna_map):
+    """
+    以欄式 npz 輸出解：站點／時段標籤各存一次，調度與藏車只存非零項的整數索引與數量。
+    比 CSV 小且載入時不需解析字串；load_compact 可還原與 CSV 相同的表。
+    """
+    nz = nonzero_entries(arcs, x_val, h_in_val, h_out_val)
+    arcs = np.asarray(arcs)
+    index = np.int32 if len(stations) < 2 ** 31 else np.int64
+    np.savez_compressed(
+        path,
+        stations=np.asarray(list(stations)),
+        station_names=np.asarray([str(sna_map[s]) for s in stations]),
+        times=np.asarray([str(t) for t in times]),
+        dispatch_from=arcs[nz["arc"], 0].astype(index), dispatch_to=arcs[nz["arc"], 1].astype(index),
+        dispatch_time=nz["arc_time"].astype(np.int32), dispatch_quantity=nz["quantity"].astype(np.int32),
+        hide_station=nz["station"].astype(index), hide_time=nz["hide_time"].astype(np.int32),
+        hide_quantity=nz["hide"].astype(np.int32), release_quantity=nz["release"].astype(np.int32),
+    )
+
+
+def load_compact(path):
+    """讀取 save_compact 的輸出，回傳 (調度 DataFrame, 藏車 DataFrame)，欄位與 CSV 相同。"""
+    with np.load(path) as f:
+        stations, sna, times = f["stations"], f["station_names"], f["times"]
+        i, j, t = f["dispatch_from"], f["dispatch_to"], f["dispatch_time"]
+        dispatch = pd.DataFrame(dict(from_sno=stations[i], to_sno=stations[j], from_sna=sna[i], to_sna=sna[j],
+                                     time=times[t], quantity=f["dispatch_quantity"]), columns=DISPATCH_COLUMNS)
+        i, t = f["hide_station"], f["hide_time"]
+        hide = pd.DataFrame(dict(sno=stations[i], sna=sna[i], time=times[t],
+                                 hide=f["hide_quantity"], release=f["release_quantity"]), columns=HIDE_COLUMNS)
+    return dispatch, hide
@@ -0,0 +1,164 @@
+import multiprocessing as mp
+import argparse
+import os
+import queue
+import shutil
+import time as time_time
+import pandas as pd
+from demand_store import load_demand
+from evaluate import load_plan, evaluate
+from telemetry import RunTelemetry
+
+# === 限時求解組合 ===
+# 同一行政區同時以多個子程序執行不同方法，時限一到就取目前已完成的最佳計畫：
+#   greedy   ：貪婪法（通常 1 秒內完成，保底）；
+#   lp_round ：LP 鬆弛＋取整修復（見 lp_round.py）；
+#   mip      ：quicksolve 的完整 MIP，以貪婪法結果為起始解（HiGHS 不支援起始解，直接求解）。
+# 各方法的目標值記帳方式不同（貪婪法以期末庫存計算、MIP 第 0 期調出不扣庫存），
+# 因此一律以 evaluate.py 的重播規則重新計分。各方法的截止時間為 budget 扣除 margin（取解、輸出與回報的時間）；
+# lp_round 與 mip 在建模後依剩餘時間設定求解器上限，時限到時以目前的可行解輸出，不會因終止而失去解。
+# HiGHS 只在部分時點檢查時間，實測可能超過上限數秒，因此預設保留較多 margin。截止後仍未回報的子程序直接終止。
+# 各方法寫入自己的 results/portfolio_<方法>_*-*.csv，結果快取另放 results/.cache/portfolio，
+# 不覆寫 greedy_* 與 {backend}_* 的正式結果，也不占用一般求解的快取。
+# 最佳計畫複製為 results/portfolio_dispatch-*.csv / portfolio_hide-*.csv，
+# 各方法的狀態與成本另存 results/portfolio-*.csv 與 portfolio_summary-*.txt。
+
+STRATEGIES = ("greedy", "lp_round", "mip")
+CACHE_DIR = os.path.join("results", ".cache", "portfolio")
+
+
+def _run_strategy(name, location, deadline, threads, backend, use_cache, results):
+    # 子程序內執行：輸出檔寫完才回報，未回報的方法一律視為未完成
+    quiet = lambda *a, **k: None
+    start_time = time_time.time()
+    tag = f"portfolio_{name}"
+    try:
+        if name == "greedy":
+            from greedy import run_greedy
+            result = run_greedy(location, log=quiet, tag=tag)
+        else:
+            from quicksolve import solve_location
+            result = solve_location(location, max(deadline - start_time, 1), threads=threads, backend=backend,
+                                    use_greedy=name == "mip", lp_round=name == "lp_round", use_cache=use_cache,
+                                    cache_dir=CACHE_DIR, tag=tag, deadline=deadline, log=quiet)
+        results.put((name, result, None, time_time.time() - start_time))
+    except Exception as e:
+        results.put((name, None, str(e), time_time.time() - start_time))
+
+
+def run_portfolio(location, budget=30, strategies=STRATEGIES, margin=None, threads=None, backend=None,
+                  use_cache=True, log=print):
+    """
+    在 budget 秒內同時執行各方法，回傳 (各方法狀態與成本 DataFrame, 最佳方法名稱或 None)。
+    margin：保留給取解、輸出與回報的秒數，預設為 budget 的 10%（HiGHS 為 30%）；threads：MIP 的執行緒數，預設為其餘核心。
+    """
+    if backend is None:
+        from backends import default_backend
+        backend = default_backend()
+    os.makedirs("results", exist_ok=True)
+    if margin is None:
+        margin = (0.1 if backend == "gurobi" else 0.3) * budget
+    threads = threads or max((os.cpu_count() or 1) - len(strategies) + 1, 1)
+    tel = RunTelemetry("portfolio", location, dict(budget=budget, strategies=list(strategies), margin=margin,
+                                                   threads=threads, backend=backend))
+
+    # === 平行執行，時限到即終止 ===
+    start_time = time_time.time()
+    results = mp.Queue()
+    procs = {}
+    with tel.phase("solve"):
+        for name in strategies:
+            p = mp.Process(target=_run_strategy, args=(
+                name, location, start_time + budget - margin, threads if name == "mip" else 1, backend, use_cache,
+                results))
+            p.start()
+            procs[name] = p
+        done = {}
+        deadline = start_time + budget
+        while len(done) < len(procs):
+            try:
+                name, result, error, runtime = results.get(timeout=max(deadline - time_time.time(), 0))
+            except queue.Empty:
+                break
+            done[name] = (result, error, runtime)
+            log(f"{'❌' if error else '✅'} {name:<8} {error or f'完成｜{runtime:.1f} 秒'}")
+        for name, p in procs.items():
+            if name not in done:
+                p.terminate()
+                log(f"⏰ {name:<8} 時限內未完成，已終止")
+            p.join()
+    wall = time_time.time() - start_time
+
+    # === 以相同規則重新計分 ===
+    with tel.phase("evaluate"):
+        demand = load_demand(location)
+        C = demand.capacity
+        B0 = (0.35 * C).astype(int)
+        rows, plans, files = [], [], []
+        for name in strategies:
+            result, error, runtime = done.get(name, (None, "時限內未完成", None))
+            row = dict(location=location, strategy=name, status="failed" if error else "done", error=error,
+                       reported=None, cost=None, wait=None, dispatch=None, hide=None, runtime=runtime)
+            if result is not None:
+                tag = result["solver"]
+                paths = (f"./results/{tag}_dispatch-{location}.csv", f"./results/{tag}_hide-{location}.csv")
+                row.update(reported=result["objective"], cached=result.get("cached", False))
+                plans.append(load_plan(*paths, demand))
+                files.append((len(rows), paths))
+            rows.append(row)
+        if plans:
+            ev = evaluate(plans, C, B0, demand.D_borrow, demand.D_return)
+            for k, (r, _) in enumerate(files):
+                rows[r].update(cost=ev["total"][k, 0], wait=ev["wait"][k, 0], dispatch=ev["dispatch"][k],
+                               hide=ev["hide"][k])
+
+    table = pd.DataFrame(rows)
+    winner = None
+    if plans:
+        best = min(range(len(files)), key=lambda k: ev["total"][k, 0])
+        r, (dispatch_csv, hide_csv) = files[best]
+        winner = rows[r]["strategy"]
+        shutil.copyfile(dispatch_csv, f"./results/portfolio_dispatch-{location}.csv")
+        shutil.copyfile(hide_csv, f"./results/portfolio_hide-{location}.csv")
+    table["winner"] = table["strategy"] == winner
+    table.to_csv(f"./results/portfolio-{location}.csv", index=False)
+
+    lines = [f"=== 限時求解組合：{location}（{budget:g} 秒，{backend}）==="]
+    for row in rows:
+        if row["cost"] is not None:
+            lines.append(f"{'🏆' if row['strategy'] == winner else '  '} {row['strategy']:<8} 成本 {row['cost']:.2f}"
+                         f"（求解器回報 {row['reported']:.2f}）｜{row['runtime']:.1f} 秒")
+        else:
+            lines.append(f"   {row['strategy']:<8} {row['error']}")
+    lines.append(f"🎯 最佳方法: {winner}" if winner else "⚠️ 時限內沒有任何方法完成")
+    lines.append(f"⏱️ 牆鐘時間: {wall:.2f} 秒")
+    with open(f"./results/portfolio_summary-{location}.txt", "w", encoding="utf-8") as f:
+        f.write("".join(line + "\n" for line in lines))
+    for line in lines:
+        log(line)
+    tel.set(winner=winner, objective=None if winner is None else float(table.loc[table["winner"], "cost"].iat[0]),
+            costs={row["strategy"]: row["cost"] for row in rows}, stations=demand.S, periods=demand.T)
+    tel.write()
+    return table, winner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="限時求解組合：同時執行多種方法，時限到時取最佳計畫")
+    parser.add_argument("locations", nargs="+", help="行政區，例如 datong（多個時依序執行，各自有完整時限）")
+    parser.add_argument("--budget", type=float, default=30, help="每個行政區的牆鐘時間上限（秒），預設 30")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help=f"以逗號分隔，預設 {','.join(STRATEGIES)}")
+    parser.add_argument("--margin", type=float, default=None, help="保留給取解、輸出與回報的秒數，預設為時限的 10%%（HiGHS 為 30%%）")
+    parser.add_argument("--threads", type=int, default=None, help="MIP 的執行緒數，預設為其餘核心")
+    parser.add_argument("--backend", choices=["auto", "gurobi", "highs"], default="auto",
+                        help="lp_round 與 mip 的求解器；auto：有 Gurobi 完整授權時用 Gurobi，否則用 HiGHS")
+    parser.add_argument("--no-cache", action="store_true", help="不使用結果快取，一律重新求解")
+    args = parser.parse_args()
+
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    unknown = set(strategies) - set(STRATEGIES)
+    if unknown:
+        raise SystemExit(f"⚠️ 未知的方法: {', '.join(sorted(unknown))}（可用: {', '.join(STRATEGIES)}）")
+    for loc in args.locations:
+        run_portfolio(loc, args.budget, strategies, margin=args.margin, threads=args.threads,
+                      backend=None if args.backend == "auto" else args.backend, use_cache=not args.no_cache)
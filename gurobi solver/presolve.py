@@ -0,0 +1,252 @@
+from model_builder import build_matrices, full_arcs
+from backends import make_backend
+from lp_round import relaxed
+from demand_store import load_demand
+from spatial import load_coordinates, candidate_arcs
+from scipy.sparse.csgraph import shortest_path
+import argparse
+import sys
+import time as time_time
+import numpy as np
+import scipy.sparse as sp
+
+# === 依需求的站點預處理（只做可證明不改變最佳值的固定） ===
+# 不做任何調度與藏車時，各站庫存固定為期初庫存（加上前一段已出發、之後抵達的車）。以此基準分類站點：
+#   缺車：某期借車需求 > 基準庫存；滿站：某期還車需求 > 基準空位；
+#   critical 兩者皆有、receiver 只缺車、donor 只滿站、balanced 皆無（不介入時等待成本為 0）。
+# 分類只用於報告。只看基準庫存固定變數並不正確：經由 balanced 站轉送到缺車站（i → j → k）、
+# 先調出車輛騰出空位再收下游滿站的車，都需要兩端看起來「沒事」的弧。因此只固定下列可由交換論證
+# 證明的變數（任一最佳解改寫成這些變數為 0、目標值不增加的可行解），其餘一律保留：
+#   - 調度 (i, j, t)：抵達後 j 及 j 經候選弧可到達的站，在抵達之後都沒有借車需求、也不能藏車
+#     （不抵達的最後幾期不需此條件），且把車留在 i 不增加等待：t 期起 i 沒有任何流入、沒有釋放，
+#     還車需求不超過 i 的空位下界（第 0 期不計流出時不需要 i 的條件）。拿掉這批車的整段後續路徑，
+#     省下至少 α，下游只少了不需要的車，i 的庫存不超過上界；
+#   - 藏車 (i, t)：t 期起 i 沒有流入、還車需求不超過空位下界。改為不藏（並取消之後最早的釋放）後
+#     庫存只增不減，且不超過不藏時的量；
+#   - 釋放 (i, t)：t 期起 i 沒有借車需求、沒有調出，或期初沒有藏車且之前的藏車都已固定為 0。
+# 各條件互相依賴（固定調度會讓更多站「沒有流入」），因此從全部保留開始反覆套用到不再變動；
+# 每一步只依賴已證明的固定，整體仍保持最佳值。空位下界：i 從未有流入時庫存不超過期初庫存＋已藏車＋在途抵達，
+# 否則只用容量。check mip 以同一求解器將兩個模型解到 gap 0 並比較，不一致或未證明最佳時以狀態碼 1 結束。
+
+μ = 6
+α = 1
+β = 0.04
+L = 20
+T_num = 30
+max_visit = 3
+K = T_num * L
+delay = 2
+
+KINDS = ("balanced", "donor", "receiver", "critical")
+
+
+def _later(mask):
+    """later[i, t]：mask[i, τ] 在某個 τ >= t 成立。"""
+    return np.flip(np.logical_or.accumulate(np.flip(mask, axis=1), axis=1), axis=1)
+
+
+class Presolve:
+    """
+    kind (S,)：KINDS 的索引；candidates：預處理前的候選弧；arcs = candidates[arc_index]：保留的弧；
+    x_free (A, T)、h_in_free / h_out_free (S, T)：未被固定的變數（x_free 對應保留的弧）。
+    """
+
+    def __init__(self, kind, candidates, arc_index, x_free, h_in_free, h_out_free):
+        self.kind = kind
+        self.candidates = candidates
+        self.arc_index = arc_index
+        self.arcs = candidates[arc_index]
+        self.x_free = x_free
+        self.h_in_free = h_in_free
+        self.h_out_free = h_out_free
+
+    @property
+    def n_arcs(self):
+        return len(self.candidates)
+
+    def counts(self):
+        return {name: int((self.kind == k).sum()) for k, name in enumerate(KINDS)}
+
+    def num_fixed(self):
+        """被固定或隨弧移除的變數數（x、v、h_in、h_out）。"""
+        T = self.h_in_free.shape[1]
+        return int(2 * (self.n_arcs * T - self.x_free.sum()) + (~self.h_in_free).sum() + (~self.h_out_free).sum())
+
+    def expand(self, values):
+        """以保留的弧排列的 x、v (A, T) 還原為候選弧的排列，其餘區塊不變。"""
+        out = dict(values)
+        for name in ("x", "v"):
+            full = np.zeros((self.n_arcs, values[name].shape[1]))
+            full[self.arc_index] = values[name]
+            out[name] = full
+        return out
+
+
+def _reach(S, arcs):
+    """reach[k, l]：站 l 可由站 k 經候選弧（任意步數，含 0 步）到達。"""
+    adj = sp.csr_matrix((np.ones(len(arcs)), (arcs[:, 0], arcs[:, 1])), shape=(S, S))
+    return np.isfinite(shortest_path(adj, unweighted=True))
+
+
+def presolve(C, D_borrow, D_return, B0, arcs=None, delay=delay, H0=None, arrivals=None, first_period_flows=False):
+    """
+    依需求與容量分類站點，並找出可證明不改變最佳值的固定（見檔頭），參數與 build_matrices 相同；
+    模型須以回傳的 arcs 建構再 apply。
+    """
+    S, T = D_borrow.shape
+    if arcs is None:
+        arcs = full_arcs(S)
+    C = np.asarray(C, dtype=float)
+    H0 = np.zeros(S) if H0 is None else np.asarray(H0, dtype=float)
+    arrivals = np.zeros((S, T)) if arrivals is None else np.asarray(arrivals, dtype=float)
+    base = np.asarray(B0, dtype=float)[:, None] + np.cumsum(arrivals, axis=1)
+    short = D_borrow > base
+    over = D_return > C[:, None] - base
+    kind = np.select([short.any(axis=1) & over.any(axis=1), short.any(axis=1), over.any(axis=1)], [3, 2, 1], 0)
+
+    i, j = arcs[:, 0], arcs[:, 1]
+    n_arrive = max(T - delay, 0)
+    t0 = 0 if first_period_flows else 1
+    reach = _reach(S, arcs).astype(np.int64)
+    borrow_later = _later(D_borrow > 0)
+    x_free = np.ones((len(arcs), T), dtype=bool)
+    h_in_free = np.ones((S, T), dtype=bool)
+    h_out_free = np.ones((S, T), dtype=bool)
+    while True:
+        # 流入：保留的弧在 u - delay 期出發、u 期抵達，或前一段的在途車輛
+        arrive = arrivals > 0
+        inflow = np.zeros((S, T), dtype=bool)
+        np.logical_or.at(inflow[:, delay:], j, x_free[:, :n_arrive])
+        arrive |= inflow
+        depart = np.zeros((S, T), dtype=bool)
+        np.logical_or.at(depart[:, t0:], i, x_free[:, t0:])
+        # 庫存上界：從未有流入的站不超過期初庫存＋已藏車＋在途抵達，否則為容量
+        upper = np.where(arrive.any(axis=1)[:, None], C[:, None],
+                         np.minimum(C[:, None], base + H0[:, None]))
+        # hold[i, t]：t 期起 i 沒有流入、還車需求都在空位下界內，多留在 i 的車不增加等待也不超過容量
+        hold = ~_later(arrive) & ~_later(D_return > C[:, None] - upper)
+
+        # 下游：j 及其可到達的站在抵達之後是否還用得到車（有借車需求或可藏車）
+        wants = ((reach @ (borrow_later | _later(h_in_free)).astype(np.int64)) > 0)
+        useless = np.ones((len(arcs), T), dtype=bool)
+        useless[:, :n_arrive] = ~wants[j][:, delay:]
+        origin_ok = hold[i] & ~_later(h_out_free)[i]
+        origin_ok[:, :t0] = True
+        new_x = x_free & ~(useless & origin_ok)
+
+        new_in = h_in_free & ~hold
+        hid_before = np.logical_or.accumulate(new_in, axis=1) | (H0 > 0)[:, None]
+        new_out = h_out_free & hid_before & (_later(D_borrow > 0) | _later(depart))
+        if (new_x == x_free).all() and (new_in == h_in_free).all() and (new_out == h_out_free).all():
+            break
+        x_free, h_in_free, h_out_free = new_x, new_in, new_out
+
+    keep = np.flatnonzero(x_free.any(axis=1))
+    return Presolve(kind, arcs, keep, x_free[keep], h_in_free, h_out_free)
+
+
+def apply(mm, pre):
+    """把 pre 判定可固定的變數上界設為 0（mm 須以 pre.arcs 建構）；compact 形式的 z 一併固定。"""
+    fixed_x = ~pre.x_free.ravel()
+    mm.cols["x"].ub[fixed_x] = 0.0
+    mm.cols["v"].ub[fixed_x] = 0.0
+    h_in_fixed, h_out_fixed = ~pre.h_in_free.ravel(), ~pre.h_out_free.ravel()
+    mm.cols["h_in"].ub[h_in_fixed] = 0.0
+    mm.cols["h_out"].ub[h_out_fixed] = 0.0
+    if "z" in mm.cols:
+        # z = 1 只可藏車、z = 0 只可釋放；只剩一側可用時直接固定
+        z = mm.cols["z"]
+        z.lb[h_out_fixed] = 1.0
+        z.ub[h_in_fixed & ~h_out_fixed] = 0.0
+    return mm
+
+
+def free_counts(mm):
+    """未固定（ub > lb）的 (變數數, 整數變數數)。"""
+    n_free = n_int = 0
+    for cb in mm.cols.values():
+        free = int((cb.ub > cb.lb).sum())
+        n_free += free
+        n_int += free if cb.vtype != "C" else 0
+    return n_free, n_int
+
+
+def build(C, D_borrow, D_return, B0, hide_cap, arcs, formulation="standard", use_presolve=True):
+    """建構完整或預處理後的模型，回傳 (模型, Presolve 或 None)。"""
+    pre = presolve(C, D_borrow, D_return, B0, arcs, delay) if use_presolve else None
+    mm = build_matrices(C, D_borrow, D_return, B0, hide_cap, μ=μ, α=α, β=β, L=L, K=K, T_num=T_num,
+                        max_visit=max_visit, delay=delay, arcs=pre.arcs if pre is not None else arcs,
+                        formulation=formulation)
+    if pre is not None:
+        apply(mm, pre)
+    return mm, pre
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="站點預處理：分類站點、固定可證明不改變最佳值的變數，並與完整模型比較目標值")
+    parser.add_argument("location")
+    parser.add_argument("--demand", default=None, help="改用指定的需求表（例如 ingest_history.py 的輸出）")
+    parser.add_argument("--k", type=int, default=8, help="每站只建立到最近 k 站的調度弧")
+    parser.add_argument("--radius", type=float, default=2.0, help="調度弧最大距離（公里）")
+    parser.add_argument("--full-arcs", action="store_true", help="不做空間篩選，建立所有站點對")
+    parser.add_argument("--formulation", choices=["standard", "compact"], default="standard")
+    parser.add_argument("--check", choices=["none", "lp", "mip"], default="mip",
+                        help="mip：兩個模型都解到 gap 0 並比較整數最佳值，不一致或未證明最佳時以狀態碼 1 結束"
+                             "（大型行政區建議搭配 --periods 縮小）；lp：只比較 LP 鬆弛，不代表整數最佳值相同")
+    parser.add_argument("--periods", type=int, default=None, help="只取前幾期（縮小驗證用的模型）")
+    parser.add_argument("--backend", choices=["gurobi", "highs"], default="highs")
+    parser.add_argument("--time-limit", type=float, default=600)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    demand = load_demand(args.location, path=args.demand)
+    stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+    if args.periods:
+        D_borrow, D_return, times = D_borrow[:, :args.periods], D_return[:, :args.periods], times[:args.periods]
+    B0 = (0.35 * C).astype(int)
+    hide_cap = (0.4 * C).astype(int)
+    if args.full_arcs:
+        arcs = full_arcs(len(stations))
+    else:
+        arcs = candidate_arcs(*load_coordinates(stations), k=args.k, radius_km=args.radius)
+
+    t0 = time_time.time()
+    full, _ = build(C, D_borrow, D_return, B0, hide_cap, arcs, args.formulation, use_presolve=False)
+    reduced, pre = build(C, D_borrow, D_return, B0, hide_cap, arcs, args.formulation)
+    build_time = time_time.time() - t0
+
+    counts = pre.counts()
+    (n_full, int_full), (n_red, int_red) = free_counts(full), free_counts(reduced)
+    lines = [
+        f"=== 站點預處理：{args.location}（{len(stations)} 站 × {len(times)} 期）===",
+        "🏷️ 站點分類: " + "，".join(f"{name} {n}" for name, n in counts.items()),
+        f"🕸️ 調度弧數: {len(pre.arcs)} / {pre.n_arcs}",
+        f"🔢 調度 (弧, 期): {int(pre.x_free.sum())} / {pre.n_arcs * len(times)}，"
+        f"藏車 (站, 期): {int(pre.h_in_free.sum())}，釋放 (站, 期): {int(pre.h_out_free.sum())} / {len(stations) * len(times)}",
+        f"📐 未固定變數: {n_red} / {n_full} ({1 - n_red / n_full:.1%} 減少)，"
+        f"整數變數: {int_red} / {int_full} ({1 - int_red / int_full:.1%} 減少)",
+        f"🏗️ 建模時間: {build_time:.2f} 秒",
+    ]
+    for line in lines:
+        print(line)
+
+    if args.check != "none":
+        results = []
+        for label, mm in (("完整", full), ("預處理", reduced)):
+            model = relaxed(mm) if args.check == "lp" else mm
+            sol = make_backend(model, args.backend, f"YouBike_{label}").solve(
+                time_limit=args.time_limit, mip_gap=0.0, threads=args.threads)
+            results.append(sol)
+            print(f"🧮 {label}模型{'（LP 鬆弛）' if args.check == 'lp' else ''}: 目標值 {sol.objective:.4f}｜"
+                  f"gap {sol.gap:.2%}｜{sol.solve_time:.2f} 秒")
+        diff = results[1].objective - results[0].objective
+        proven = all(sol.gap <= 1e-6 for sol in results)
+        equal = abs(diff) <= 1e-6 * max(abs(results[0].objective), 1)
+        kind = "LP 鬆弛" if args.check == "lp" else "整數"
+        if not proven:
+            print(f"⚠️ 未在時間內證明最佳（差異 {diff:.6f}），無法確認兩者的{kind}最佳值相同")
+            sys.exit(1)
+        if not equal:
+            print(f"❌ 預處理改變了{kind}最佳值：差異 {diff:.6f}")
+            sys.exit(1)
+        print(f"✅ 兩者的{kind}最佳值相同（差異 {diff:.2e}）")
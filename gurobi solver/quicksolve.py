@@ -1,5 +1,15 @@
-from gurobipy import *
-import pandas as pd
+from model_builder import build_matrices, extract_frames, save_compact
+from backends import make_backend
+from lp_round import lp_round_solve
+from presolve import presolve, apply as apply_presolve
+from demand_store import load_demand
+from spatial import load_coordinates, candidate_arcs
+from greedy import greedy_plan
+from warmstart import greedy_start
+from telemetry import RunTelemetry
+import result_cache
+import numpy as np
+import argparse
 import time as time_time
 import sys, os
 
@@ -11,142 +21,254 @@ L = 20       # 每輛卡車可載車數
 T_num = 30   # 卡車數
 max_visit = 3  # 每台卡車最多拜訪站點數
 K = T_num * L  # 每期最大調度數量
-location = sys.argv[1]
-limit_time = int(sys.argv[2]) if len(sys.argv) > 2 else 600  # 最大運行時間（秒）
-if not os.path.exists("results"):
-    os.makedirs("results")
-
-# === 讀取資料 ===
-start_time = time_time.time()
-df = pd.read_csv(f"assets/gurobi_demand_table_{location}.csv")
-
-# 索引與對應關係
-times = sorted(df["interval_time"].unique())
-stations = sorted(df["sno"].unique())
-sna_map = df.drop_duplicates("sno").set_index("sno")["sna"].to_dict()
-
-S = range(len(stations))
-T = range(len(times))
-s_index = {s: i for i, s in enumerate(stations)}
-t_index = {t: i for i, t in enumerate(times)}
-
-# 資料轉換
-C = {s_index[row.sno]: row.total for _, row in df.drop_duplicates("sno").iterrows()}
-D_borrow = {(s_index[row.sno], t_index[row.interval_time]): row.demand_borrow for _, row in df.iterrows()}
-D_return = {(s_index[row.sno], t_index[row.interval_time]): row.demand_return for _, row in df.iterrows()}
-B0 = {i: int(0.35 * C[i]) for i in S}
-max_hide_per_station = {i: int(0.4 * C[i]) for i in S}
-
-# === 模型建立 ===
-m = Model("YouBike_Multiperiod")
-m.setParam('Threads', 14)  # 或你機器上的實體核心數
-m.setParam("OutputFlag", 0)
-m.setParam("TimeLimit", limit_time)   # 最多跑 30 分鐘
-m.setParam("MIPGap", 0.05)  # 允許 1% 誤差內解即可接受
-
-x = m.addVars(S, S, T, vtype=GRB.CONTINUOUS, name="x")
-v = m.addVars(S, S, T, vtype=GRB.BINARY, name="v")
-h_in = m.addVars(S, T, vtype=GRB.INTEGER, name="h_in")
-h_out = m.addVars(S, T, vtype=GRB.INTEGER, name="h_out")
-B = m.addVars(S, T, lb=0, name="B")
-W_borrow = m.addVars(S, T, lb=0, name="W_borrow")
-W_return = m.addVars(S, T, lb=0, name="W_return")
-
-# 延遲時間設定
 delay = 2  # 調度延遲時間（期數）
 
-# === 限制式 ===
-for t in T:
-    for i in S:
-        if t == 0:
-            inflow = 0
-        else:
-            inflow = quicksum(x[j, i, t - delay] for j in S if j != i) if t - delay >= 0 else 0
 
-        outflow = quicksum(x[i, j, t] for j in S if j != i)
+def solve_location(location, limit_time=600, threads=14, k=8, radius=2.0, full_arcs=False,
+                   use_greedy=False, compare_full=False, backend="gurobi", formulation="standard", tight_links=False,
+                   use_cache=True, cache_dir=result_cache.CACHE_DIR, cache_bytes=result_cache.MAX_BYTES, compact=False,
+                   lp_round=False, use_presolve=False, tag=None, deadline=None, log=print):
+    """
+    求解單一行政區並輸出 results/{backend}_*-{location} 檔案，回傳結果總結。
+    lp_round：改用 LP 鬆弛＋取整修復的快速模式（見 lp_round.py），輸出為 results/{backend}_lp_*-{location}。
+    use_cache：輸入與設定都未變更時直接還原快取結果；只有部分時段需求改變時，固定未變更前綴的計畫、
+    從第一個變更的時段重解。
+    compact：另輸出欄式 results/{backend}_plan-{location}.npz（見 model_builder.save_compact）。
+    use_presolve：依需求分類站點，只固定可證明不改變最佳值的弧與變數（見 presolve.py）；輸出仍以原候選弧排列。
+    tag：輸出檔名與紀錄的前綴，預設為 backend（lp_round 時為 {backend}_lp）。
+    deadline：牆鐘截止時間（time.time() 的值）；求解器的時間上限再縮短為截止前、扣除建模所花時間
+    （作為取解與輸出的預留），時限到時仍以目前的可行解輸出。
+    """
+    if not os.path.exists("results"):
+        os.makedirs("results")
+
+    tag = tag or (f"{backend}_lp" if lp_round else backend)
+    tel = RunTelemetry(tag, location, dict(limit_time=limit_time, threads=threads, k=k, radius=radius,
+                                               full_arcs=full_arcs, use_greedy=use_greedy, formulation=formulation,
+                                               tight_links=tight_links, lp_round=lp_round, presolve=use_presolve))
+
+    # === 讀取資料 ===
+    start_time = time_time.time()
+    with tel.phase("load"):
+        demand = load_demand(location)
+    load_time = time_time.time() - start_time
+
+    # 索引與對應關係、資料轉換
+    stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+    S = range(len(stations))
+    T = range(len(times))
+    B0 = (0.35 * C).astype(int)
+    max_hide_per_station = (0.4 * C).astype(int)
+
+    # === 候選調度弧（空間篩選）===
+    if full_arcs:
+        arcs = None
+    else:
+        lat, lon = load_coordinates(stations)
+        arcs = candidate_arcs(lat, lon, k=k, radius_km=radius)
 
-        if t == 0:
-            m.addConstr(B[i, t] == B0[i] + h_out[i, t] - h_in[i, t])
+    # === 結果快取（鍵含候選弧，站點座標改變時不沿用）===
+    outputs = dict(dispatch=f"./results/{tag}_dispatch-{location}.csv",
+                   hide=f"./results/{tag}_hide-{location}.csv",
+                   summary=f"./results/{tag}_summary-{location}.txt")
+    if compact:
+        outputs["plan"] = f"./results/{tag}_plan-{location}.npz"
+    prefix, n_fixed = None, 0
+    if use_cache:
+        with tel.phase("cache"):
+            params = dict(μ=μ, α=α, β=β, L=L, T_num=T_num, max_visit=max_visit, delay=delay)
+            # tight_links 以 "bound" 記錄，不沿用舊版以 min(L, 目的站容量) 為上界時的快取
+            settings = dict(backend=backend, limit_time=limit_time, mip_gap=0.05, k=k, radius=radius,
+                            full_arcs=full_arcs, use_greedy=use_greedy, compare_full=compare_full,
+                            formulation=formulation, tight_links="bound" if tight_links else False, compact=compact,
+                            lp_round=lp_round, presolve=use_presolve)
+            key, config_key, period_hashes = result_cache.cache_key(demand, params, settings, arcs)
+            hit = result_cache.lookup(key, cache_dir)
+            if hit is not None:
+                result_cache.restore(*hit, outputs)
+            else:
+                entry, n_fixed = result_cache.find_prefix(config_key, period_hashes, cache_dir)
+                if 0 < n_fixed < len(T):
+                    prefix = result_cache.load_plan(entry)
+                else:
+                    n_fixed = 0
+        if hit is not None:
+            log("♻️ 輸入與設定皆未變更，沿用快取結果")
+            result = dict(hit[1]["result"], cached=True, runtime=time_time.time() - start_time)
+            tel.set(cache="hit", objective=result["objective"], stations=len(S), periods=len(T))
+            tel.write()
+            return result
+
+    if prefix is not None:
+        log(f"♻️ 前 {n_fixed} 期需求未變更，固定該段計畫，從 {times[n_fixed]} 起重解")
+
+    def time_left(build_time):
+        if deadline is None:
+            return limit_time
+        return max(min(limit_time, deadline - time_time.time() - build_time), 0.1)
+
+    def build_and_solve(arcs, progress=None, prefix=None):
+        # === 模型建立（稀疏矩陣一次建構）===
+        build_start = time_time.time()
+        pre = None
+        if prefix is None:
+            if use_presolve:
+                pre = presolve(C, D_borrow, D_return, B0, arcs, delay)
+                arcs = pre.arcs
+            mm = build_matrices(C, D_borrow, D_return, B0, max_hide_per_station,
+                                μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay, arcs=arcs,
+                                formulation=formulation, tight_links=tight_links)
         else:
-            m.addConstr(B[i, t] == B[i, t - 1] + inflow - outflow + h_out[i, t] - h_in[i, t])
-
-        m.addConstr(B[i, t] <= C[i])
-        m.addConstr(W_borrow[i, t] >= (D_borrow.get((i, t), 0) - B[i, t]) / μ)
-        m.addConstr(W_return[i, t] >= (D_return.get((i, t), 0) - (C[i] - B[i, t])) / μ)
-        m.addConstr(h_in[i, t] <= max_hide_per_station[i])
-        m.addConstr(h_in[i, t] * h_out[i, t] == 0)
-        m.addConstr(h_out[i, t] <= quicksum(h_in[i, τ] - h_out[i, τ] for τ in range(t + 1)))
-
-for t in T:
-    m.addConstr(quicksum(x[i, j, t] for i in S for j in S if i != j) <= K)
-
-# 拜訪次數與調度變數連結
-M = L
-for i in S:
-    for j in S:
-        if i != j:
-            for t in T:
-                m.addConstr(x[i, j, t] <= M * v[i, j, t])
-
-# 總拜訪次數限制
-m.addConstr(quicksum(v[i, j, t] for i in S for j in S if i != j for t in T) <= T_num * max_visit)
-
-# === 目標函數 ===
-m.setObjective(
-    quicksum(W_borrow[i, t] + W_return[i, t] for i in S for t in T) +
-    α * quicksum(x[i, j, t] for i in S for j in S if i != j for t in T) +
-    β * quicksum(h_in[i, t] + h_out[i, t] for i in S for t in T),
-    GRB.MINIMIZE
-)
-
-m.optimize()
-
-# === 結果輸出 ===
-dispatch_records = []
-hide_records = []
-
-for t in T:
-    time = times[t]
-    for i in S:
-        s1 = stations[i]
-        for j in S:
-            if i != j and x[i, j, t].X > 0.5:
-                s2 = stations[j]
-                dispatch_records.append(dict(
-                    from_sno=s1, to_sno=s2,
-                    from_sna=sna_map[s1], to_sna=sna_map[s2],
-                    time=time, quantity=int(x[i, j, t].X)
-                ))
-        if h_in[i, t].X > 0.5 or h_out[i, t].X > 0.5:
-            hide_records.append(dict(
-                sno=s1, sna=sna_map[s1],
-                time=time,
-                hide=int(h_in[i, t].X),
-                release=int(h_out[i, t].X)
-            ))
-
-pd.DataFrame(dispatch_records).to_csv(f"./results/gurobi_dispatch-{location}.csv", index=False)
-pd.DataFrame(hide_records).to_csv(f"./results/gurobi_hide-{location}.csv", index=False)
-print("✅ 結果已輸出為 CSV 檔案")
-
-# === 統計與列印總結資訊 ===
-total_cost = m.ObjVal
-total_dispatch = sum(x[i, j, t].X for i in S for j in S if i != j for t in T)
-total_hide = sum(h_in[i, t].X for i in S for t in T)
-total_release = sum(h_out[i, t].X for i in S for t in T)
-end_time = time_time.time()
-
-with open(f"./results/gurobi_summary-{location}.txt", "w", encoding="utf-8") as f:
-    f.write("=== 結果總結 ===\n")
-    f.write(f"🎯 總成本 (Objective): {total_cost:.2f}\n")
-    f.write(f"🚚 總調度數量: {int(total_dispatch)}\n")
-    f.write(f"📦 總藏車數量: {int(total_hide)}\n")
-    f.write(f"🔓 總釋放數量: {int(total_release)}\n")
-    f.write(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒\n")
-
-print("=== 結果總結 ===")
-print(f"🎯 總成本 (Objective): {total_cost:.2f}")
-print(f"🚚 總調度數量: {int(total_dispatch)}")
-print(f"📦 總藏車數量: {int(total_hide)}")
-print(f"🔓 總釋放數量: {int(total_release)}")
-print(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒")
\ No newline at end of file
+            # 只建構第 n_fixed 期之後的模型，期初狀態由固定的前綴計畫推得
+            state = result_cache.suffix_state(prefix, n_fixed, prefix["arcs"], delay, T_num * max_visit)
+            arcs = prefix["arcs"]
+            if use_presolve:
+                pre = presolve(C, D_borrow[:, n_fixed:], D_return[:, n_fixed:], state["B0"], arcs, delay,
+                               H0=state["H0"], arrivals=state["arrivals"], first_period_flows=True)
+                arcs = pre.arcs
+            mm = build_matrices(C, D_borrow[:, n_fixed:], D_return[:, n_fixed:], state["B0"], max_hide_per_station,
+                                μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay,
+                                arcs=arcs, H0=state["H0"], arrivals=state["arrivals"],
+                                first_period_flows=True, visit_budget=state["visit_budget"],
+                                formulation=formulation, tight_links=tight_links)
+        if pre is not None:
+            apply_presolve(mm, pre)
+        if lp_round:
+            # 快速模式：LP 鬆弛後取整修復，gap 為相對 LP 下界的差距
+            build_time = time_time.time() - build_start
+            sol = lp_round_solve(mm, backend, time_limit=time_left(build_time), threads=threads, progress=progress, log=log)
+            return mm, pre, sol, build_time, sol.solve_time
+        solver = make_backend(mm, backend, "YouBike_Multiperiod")
+        if use_greedy and prefix is None:
+            dispatch_result, hide_result, _ = greedy_plan(demand)
+            start = greedy_start(mm, stations, times, dispatch_result, hide_result, C, B0, D_borrow, D_return,
+                                 max_hide_per_station, μ=μ, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay)
+            solver.set_start(start)
+        build_time = time_time.time() - build_start
+
+        # 最多運行 limit_time 秒；允許 5% 誤差內解即可接受
+        sol = solver.solve(time_limit=time_left(build_time), mip_gap=0.05, threads=threads, progress=progress)
+        return mm, pre, sol, build_time, sol.solve_time
+
+    mm, pre, sol, build_time, solve_time = build_and_solve(arcs, progress=tel.trajectory, prefix=prefix)
+    tel.record["phases"].update(build=build_time, solve=solve_time)
+    tel.model_size(sol.num_vars, sol.num_constrs, sol.num_nonzeros)
+    n_full_arcs = len(S) * (len(S) - 1)
+    n_vars, n_constrs = sol.num_vars, sol.num_constrs
+    # 完整弧集合的規模：每條弧 x、v 各 T 個變數，連結限制式 T 條
+    n_vars_full = n_vars + 2 * (n_full_arcs - len(mm.arcs)) * len(T)
+    n_constrs_full = n_constrs + (n_full_arcs - len(mm.arcs)) * len(T)
+    n_arcs = len(mm.arcs)
+
+    full_obj = None
+    if compare_full and not full_arcs:
+        with tel.phase("compare_full"):
+            _, _, sol_full, _, _ = build_and_solve(None)
+        full_obj = sol_full.objective
+        del sol_full
+
+    # === 結果輸出 ===
+    arcs = mm.arcs
+    with tel.phase("extract"):
+        values = {name: sol.values[name].reshape(-1, mm.T) for name in result_cache.PLAN_BLOCKS}
+        if pre is not None:
+            # 還原為預處理前的候選弧，使快取的前綴計畫與之後的候選弧一致
+            values, arcs = pre.expand(values), pre.candidates
+        total_cost = sol.objective
+        if prefix is not None:
+            # 接回固定的前綴計畫
+            values = {name: np.hstack([prefix[name][:, :n_fixed], values[name]]) for name in values}
+            total_cost += (prefix["W_borrow"][:, :n_fixed].sum() + prefix["W_return"][:, :n_fixed].sum()
+                           + α * prefix["x"][:, :n_fixed].sum()
+                           + β * (prefix["h_in"][:, :n_fixed].sum() + prefix["h_out"][:, :n_fixed].sum()))
+        x_val, h_in_val, h_out_val = values["x"], values["h_in"], values["h_out"]
+        dispatch_df, hide_df = extract_frames(arcs, x_val, h_in_val, h_out_val, stations, times, sna_map)
+
+    with tel.phase("write"):
+        dispatch_df.to_csv(outputs["dispatch"], index=False)
+        hide_df.to_csv(outputs["hide"], index=False)
+        if compact:
+            save_compact(outputs["plan"], arcs, x_val, h_in_val, h_out_val, stations, times, sna_map)
+    log("✅ 結果已輸出為 CSV 檔案" + ("（另存 npz）" if compact else ""))
+
+    # === 統計與列印總結資訊 ===
+    total_dispatch = x_val.sum()
+    total_hide = h_in_val.sum()
+    total_release = h_out_val.sum()
+    end_time = time_time.time()
+
+    lines = [
+        "=== 結果總結 ===",
+        f"🎯 總成本 (Objective): {total_cost:.2f}",
+        f"🚚 總調度數量: {int(total_dispatch)}",
+        f"📦 總藏車數量: {int(total_hide)}",
+        f"🔓 總釋放數量: {int(total_release)}",
+        f"🕸️ 調度弧數: {n_arcs} / {n_full_arcs}",
+        f"📐 變數數: {n_vars} / {n_vars_full}，限制式數: {n_constrs} / {n_constrs_full}",
+    ]
+    if pre is not None:
+        lines.append("🧹 站點預處理: " + "，".join(f"{name} {n}" for name, n in pre.counts().items())
+                     + f"｜移除 {pre.n_arcs - n_arcs} 條弧，固定 {pre.num_fixed()} 個變數")
+    if lp_round and prefix is None:
+        lines.append(f"📏 LP 下界: {sol.bound:.2f}，與下界差距: {(total_cost - sol.bound) / total_cost:.2%}")
+    elif lp_round:
+        # 固定前綴後的 LP 只是「在此前綴下」的下界，不是整天問題的下界，因此不計算差距
+        lp_bound = sol.bound + (total_cost - sol.objective)  # 加回固定前綴的成本
+        lines.append(f"📏 LP 下界（以沿用的前 {n_fixed} 期計畫為條件）: {lp_bound:.2f}")
+    if prefix is not None:
+        lines.append(f"♻️ 沿用快取的前 {n_fixed} 期計畫，自 {times[n_fixed]} 起重解")
+    if full_obj is not None:
+        lines.append(f"📉 完整弧集合目標值: {full_obj:.2f}，篩選損失: {total_cost - full_obj:.2f} "
+                     f"({(total_cost - full_obj) / full_obj:.2%})")
+    lines += [
+        f"📂 載入時間: {load_time:.3f} 秒",
+        f"🏗️ 建模時間: {build_time:.2f} 秒",
+        f"🧮 求解時間: {solve_time:.2f} 秒",
+        f"⏱️ 運行時間: {end_time - start_time:.2f} 秒",
+    ]
+    with open(outputs["summary"], "w", encoding="utf-8") as f:
+        f.write("".join(line + "\n" for line in lines))
+    for line in lines:
+        log(line)
+    tel.set(objective=total_cost, gap=sol.gap, bound=sol.bound, stations=len(S), periods=len(T), arcs=n_arcs,
+            cache="prefix" if prefix is not None else ("miss" if use_cache else "off"), fixed_periods=n_fixed)
+
+    result = dict(location=location, solver=tag, objective=total_cost, dispatch=float(total_dispatch),
+                  hide=float(total_hide), release=float(total_release), gap=sol.gap,
+                  build_time=build_time, solve_time=solve_time, runtime=end_time - start_time)
+    if use_cache:
+        with tel.phase("cache"):
+            result_cache.store(key, config_key, period_hashes, outputs, dict(values, arcs=arcs), result,
+                               cache_dir, cache_bytes)
+    tel.write()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YouBike 多期調度 MIP 求解")
+    parser.add_argument("location")
+    parser.add_argument("limit_time", nargs="?", type=int, default=600)  # 最大運行時間（秒）
+    parser.add_argument("--threads", type=int, default=14)
+    parser.add_argument("--k", type=int, default=8, help="每站只建立到最近 k 站的調度弧")
+    parser.add_argument("--radius", type=float, default=2.0, help="調度弧最大距離（公里）")
+    parser.add_argument("--full-arcs", action="store_true", help="不做空間篩選，建立所有站點對")
+    parser.add_argument("--greedy-start", action="store_true", help="以貪婪法結果作為 MIP 起始解")
+    parser.add_argument("--compare-full", action="store_true", help="另解完整弧集合模型並比較目標值")
+    parser.add_argument("--backend", choices=["gurobi", "highs"], default="gurobi",
+                        help="求解器；highs 使用 scipy 內建的 HiGHS，不需授權（不支援起始解）")
+    parser.add_argument("--formulation", choices=["standard", "compact"], default="standard",
+                        help="compact：藏車庫存狀態變數＋線性化互斥，不含二次與 O(T²) 限制式")
+    parser.add_argument("--tight-links", action="store_true", help="連結限制式改用由目的站容量、同期流出與藏車上限推得的上界（不改變最佳解）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用結果快取，一律重新求解")
+    parser.add_argument("--cache-size", type=int, default=result_cache.MAX_BYTES // (1024 * 1024),
+                        help="結果快取大小上限（MB），超過時淘汰最久未使用的結果")
+    parser.add_argument("--compact", action="store_true", help="另輸出欄式 npz 結果檔（只存非零項）")
+    parser.add_argument("--lp-round", action="store_true", help="快速模式：LP 鬆弛後取整修復，回報相對 LP 下界的差距")
+    parser.add_argument("--presolve", action="store_true", help="依需求分類站點，只固定可證明不改變最佳值的弧與變數")
+    args = parser.parse_args()
+
+    solve_location(args.location, args.limit_time, threads=args.threads, k=args.k, radius=args.radius,
+                   full_arcs=args.full_arcs, use_greedy=args.greedy_start, compare_full=args.compare_full,
+                   backend=args.backend, formulation=args.formulation, tight_links=args.tight_links,
+                   use_cache=not args.no_cache, cache_bytes=args.cache_size * 1024 * 1024, compact=args.compact,
+                   lp_round=args.lp_round, use_presolve=args.presolve)
@@ -1,4 +1,11 @@
-from gurobipy import *
+from gurobipy import GRB
+from model_builder import build_matrices, to_gurobi
+from demand_store import load_demand
+from spatial import load_coordinates, candidate_arcs
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import itertools
+import numpy as np
 import pandas as pd
 import time as time_time
 import sys, os
@@ -11,153 +18,156 @@ L = 20       # 每輛卡車可載車數
 T_num = 30   # 卡車數
 max_visit = 3  # 每台卡車最多拜訪站點數
 K = T_num * L  # 每期最大調度數量
-location = sys.argv[1]
-if not os.path.exists("results"):
-    os.makedirs("results")
-
-with open(f"./results/gurobi_range_summary-{location}.txt", "w", encoding="utf-8") as f:
-    f.write("=== Gurobi Range Summary ===\n")
-    f.write(f"Location: {location}\n")
-
-# === 讀取資料 ===
-start_time = time_time.time()
-df = pd.read_csv(f"assets/gurobi_demand_table_{location}.csv")
-
-# 索引與對應關係
-times = sorted(df["interval_time"].unique())
-stations = sorted(df["sno"].unique())
-sna_map = df.drop_duplicates("sno").set_index("sno")["sna"].to_dict()
-
-S = range(len(stations))
-T = range(len(times))
-s_index = {s: i for i, s in enumerate(stations)}
-t_index = {t: i for i, t in enumerate(times)}
-
-# 資料轉換
-C = {s_index[row.sno]: row.total for _, row in df.drop_duplicates("sno").iterrows()}
-D_borrow = {(s_index[row.sno], t_index[row.interval_time]): row.demand_borrow for _, row in df.iterrows()}
-D_return = {(s_index[row.sno], t_index[row.interval_time]): row.demand_return for _, row in df.iterrows()}
-B0 = {i: int(0.35 * C[i]) for i in S}
-max_hide_per_station = {i: int(0.4 * C[i]) for i in S}
-
-def quicksum(β = 0.04):
-    # === 模型建立 === 
-    m = Model("YouBike_Multiperiod")
+delay = 2  # 調度延遲時間（期數）
+
+# === 參數掃描：模型只建一次，之後只改目標係數／右手邊並從上一個解重新求解 ===
+# α、β 只出現在目標函數；μ 改等待限制式中 B 的係數與右手邊；K、max_visit 只改右手邊。
+# L 與弧集合會改變模型結構，不同 L 的掃描點分在不同子程序各自建模。
+
+
+def sweep_group(location, L, points, limit_time, threads, arcs_opt):
+    stations, times, sna_map, C, D_borrow, D_return = load_demand(location).arrays()
+    B0 = (0.35 * C).astype(int)
+    max_hide_per_station = (0.4 * C).astype(int)
+    arcs = None
+    if arcs_opt is not None:
+        lat, lon = load_coordinates(stations)
+        arcs = candidate_arcs(lat, lon, k=arcs_opt[0], radius_km=arcs_opt[1])
+
+    # === 模型建立（只建一次）===
+    first = points[0]
+    build_start = time_time.time()
+    mm = build_matrices(C, D_borrow, D_return, B0, max_hide_per_station,
+                        μ=first["μ"], α=first["α"], β=first["β"], L=L, K=first["K"], T_num=T_num,
+                        max_visit=first["max_visit"], delay=delay, arcs=arcs)
+    m, var, con = to_gurobi(mm, "YouBike_Multiperiod")
     m.setParam("OutputFlag", 0)
-    m.setParam("TimeLimit", 300)
+    m.setParam("TimeLimit", limit_time)
     m.setParam("MIPGap", 0.05)  # 允許 1% 誤差內解即可接受
-
-    x = m.addVars(S, S, T, vtype=GRB.CONTINUOUS, name="x")
-    v = m.addVars(S, S, T, vtype=GRB.BINARY, name="v")
-    h_in = m.addVars(S, T, vtype=GRB.INTEGER, name="h_in")
-    h_out = m.addVars(S, T, vtype=GRB.INTEGER, name="h_out")
-    B = m.addVars(S, T, lb=0, name="B")
-    W_borrow = m.addVars(S, T, lb=0, name="W_borrow")
-    W_return = m.addVars(S, T, lb=0, name="W_return")
-
-    # 延遲時間設定
-    delay = 2  # 調度延遲時間（期數）
-
-    # === 限制式 ===
-    for t in T:
-        for i in S:
-            if t == 0:
-                inflow = 0
-            else:
-                inflow = quicksum(x[j, i, t - delay] for j in S if j != i) if t - delay >= 0 else 0
-
-            outflow = quicksum(x[i, j, t] for j in S if j != i)
-
-            if t == 0:
-                m.addConstr(B[i, t] == B0[i] + h_out[i, t] - h_in[i, t])
-            else:
-                m.addConstr(B[i, t] == B[i, t - 1] + inflow - outflow + h_out[i, t] - h_in[i, t])
-
-            m.addConstr(B[i, t] <= C[i])
-            m.addConstr(W_borrow[i, t] >= (D_borrow.get((i, t), 0) - B[i, t]) / μ)
-            m.addConstr(W_return[i, t] >= (D_return.get((i, t), 0) - (C[i] - B[i, t])) / μ)
-            m.addConstr(h_in[i, t] <= max_hide_per_station[i])
-            m.addConstr(h_in[i, t] * h_out[i, t] == 0)
-            m.addConstr(h_out[i, t] <= quicksum(h_in[i, τ] - h_out[i, τ] for τ in range(t + 1)))
-
-    for t in T:
-        m.addConstr(quicksum(x[i, j, t] for i in S for j in S if i != j) <= K)
-
-    # 拜訪次數與調度變數連結
-    M = L
-    for i in S:
-        for j in S:
-            if i != j:
-                for t in T:
-                    m.addConstr(x[i, j, t] <= M * v[i, j, t])
-
-    # 總拜訪次數限制
-    m.addConstr(quicksum(v[i, j, t] for i in S for j in S if i != j for t in T) <= T_num * max_visit)
-
-    # === 目標函數 ===
-    m.setObjective(
-        quicksum(W_borrow[i, t] + W_return[i, t] for i in S for t in T) +
-        α * quicksum(x[i, j, t] for i in S for j in S if i != j for t in T) +
-        β * quicksum(h_in[i, t] + h_out[i, t] for i in S for t in T),
-        GRB.MINIMIZE
-    )
-
-    m.optimize()
-
-    # === 結果輸出 ===
-    dispatch_records = []
-    hide_records = []
-
-    for t in T:
-        time = times[t]
-        for i in S:
-            s1 = stations[i]
-            for j in S:
-                if i != j and x[i, j, t].X > 0.5:
-                    s2 = stations[j]
-                    dispatch_records.append(dict(
-                        from_sno=s1, to_sno=s2,
-                        from_sna=sna_map[s1], to_sna=sna_map[s2],
-                        time=time, quantity=int(x[i, j, t].X)
-                    ))
-            if h_in[i, t].X > 0.5 or h_out[i, t].X > 0.5:
-                hide_records.append(dict(
-                    sno=s1, sna=sna_map[s1],
-                    time=time,
-                    hide=int(h_in[i, t].X),
-                    release=int(h_out[i, t].X)
-                ))
-
-    # === 統計與列印總結資訊 ===
-    total_cost = m.ObjVal
-    total_dispatch = sum(x[i, j, t].X for i in S for j in S if i != j for t in T)
-    total_hide = sum(h_in[i, t].X for i in S for t in T)
-    total_release = sum(h_out[i, t].X for i in S for t in T)
-    
-    print("=== 結果總結 ===")
-    print(f"🎯 (調度, 藏車)成本權重: ({α}, {β})")
-    print(f"🎯 權重比值(調度/藏車): {(α/β):.4f}")
-    print(f"🎯 總成本 (Objective): {total_cost:.2f}")
-    print(f"🚚 總調度數量: {int(total_dispatch)}")
-    print(f"📦 總藏車數量: {int(total_hide)}")
-    print(f"🔓 總釋放數量: {int(total_release)}")
-
-    with open(f"./results/gurobi_range_summary-{location}.txt", "w+", encoding="utf-8") as f:
-        f.write("=== 結果總結 ===\n")
-        f.write(f"🎯 (調度, 藏車)成本權重: ({α}, {β})\n")
-        f.write(f"🎯 權重比值(調度/藏車): {(α/β):.4f}\n")
-        f.write(f"🎯 總成本 (Objective): {total_cost:.2f}\n")
-        f.write(f"🚚 總調度數量: {int(total_dispatch)}\n")
-        f.write(f"📦 總藏車數量: {int(total_hide)}\n")
-        f.write(f"🔓 總釋放數量: {int(total_release)}\n")
-
-for i in range(20, 40, 5):
-    β = α / i
-    print(f"=== 執行調度與藏車成本權重: (α={α}, β={β}) ===")
-    quicksum(β)
-
-end_time = time_time().time()
-
-print(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒")
-with open(f"./results/gurobi_range_summary-{location}.txt", "w+", encoding="utf-8") as f:
-    f.write(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒\n")
\ No newline at end of file
+    if threads:
+        m.setParam("Threads", threads)
+    m.update()
+    build_time = time_time.time() - build_start
+
+    wait_rows = None
+    cur_μ = first["μ"]
+    rows = []
+    for p in points:
+        update_start = time_time.time()
+        var["x"].Obj = np.full(var["x"].shape, p["α"])
+        var["h_in"].Obj = np.full(var["h_in"].shape, p["β"])
+        var["h_out"].Obj = np.full(var["h_out"].shape, p["β"])
+        con["dispatch_cap"].RHS = np.full(mm.T, p["K"])
+        con["visit_budget"].RHS = np.array([T_num * p["max_visit"]])
+        if p["μ"] != cur_μ:
+            if wait_rows is None:
+                wait_rows = (con["wait_borrow"].tolist(), con["wait_return"].tolist(), var["B"].tolist())
+            wb, wr, Bs = wait_rows
+            for cb, cr, b in zip(wb, wr, Bs):
+                m.chgCoeff(cb, b, 1 / p["μ"])
+                m.chgCoeff(cr, b, -1 / p["μ"])
+            con["wait_borrow"].RHS = D_borrow.ravel() / p["μ"]
+            con["wait_return"].RHS = (D_return - C[:, None]).ravel() / p["μ"]
+            cur_μ = p["μ"]
+        # 上一個掃描點的解作為起始解
+        if m.SolCount:
+            for mv in var.values():
+                mv.Start = mv.X
+        m.update()
+        update_time = time_time.time() - update_start
+
+        solve_start = time_time.time()
+        m.optimize()
+        solve_time = time_time.time() - solve_start
+
+        if m.SolCount == 0:
+            # 時限內沒有可行解：記錄為失敗的掃描點，其餘掃描點照常進行
+            status = "time_limit" if m.Status == GRB.TIME_LIMIT else f"status_{m.Status}"
+            rows.append(dict(**p, L=L, status=status, build_time=build_time if not rows else update_time,
+                             solve_time=solve_time))
+            continue
+        x_val, h_in_val, h_out_val = var["x"].X, var["h_in"].X, var["h_out"].X
+        wait_cost = var["W_borrow"].X.sum() + var["W_return"].X.sum()
+        rows.append(dict(
+            **p, L=L, status="ok",
+            objective=m.ObjVal, gap=m.MIPGap,
+            wait_cost=wait_cost,
+            dispatch=x_val.sum(), hide=h_in_val.sum(), release=h_out_val.sum(),
+            build_time=build_time if not rows else update_time,
+            solve_time=solve_time,
+        ))
+    return rows
+
+
+def pareto_front(df, cols=("wait_cost", "dispatch", "hide")):
+    # 非支配點：沒有其他點在所有指標上都不差且至少一項更好
+    vals = df[list(cols)].to_numpy()
+    better_eq = (vals[None, :, :] <= vals[:, None, :]).all(axis=2)
+    strictly = (vals[None, :, :] < vals[:, None, :]).any(axis=2)
+    return ~(better_eq & strictly).any(axis=1)
+
+
+def parse_list(text, cast=float):
+    return [cast(v) for v in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YouBike 調度／藏車權重掃描")
+    parser.add_argument("location")
+    parser.add_argument("--beta-div", default="20,25,30,35", help="β = α / i 的 i 值，以逗號分隔")
+    parser.add_argument("--mu", default=str(μ), help="μ 值，以逗號分隔")
+    parser.add_argument("--K", default=str(K), help="每期最大調度數量，以逗號分隔")
+    parser.add_argument("--max-visit", default=str(max_visit), help="每台卡車最多拜訪站點數，以逗號分隔")
+    parser.add_argument("--L", default=str(L), help="每輛卡車可載車數，以逗號分隔（不同值需另建模型，平行求解）")
+    parser.add_argument("--time-limit", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="平行子程序數")
+    parser.add_argument("--k", type=int, default=8, help="每站只建立到最近 k 站的調度弧")
+    parser.add_argument("--radius", type=float, default=2.0, help="調度弧最大距離（公里）")
+    parser.add_argument("--full-arcs", action="store_true", help="不做空間篩選，建立所有站點對")
+    args = parser.parse_args()
+    location = args.location
+    if not os.path.exists("results"):
+        os.makedirs("results")
+
+    start_time = time_time.time()
+    points = [dict(α=α, β=α / i, μ=mu, K=k_, max_visit=mv)
+              for mu, k_, mv, i in itertools.product(parse_list(args.mu), parse_list(args.K),
+                                                     parse_list(args.max_visit, int), parse_list(args.beta_div))]
+    groups = parse_list(args.L)
+    arcs_opt = None if args.full_arcs else (args.k, args.radius)
+
+    if len(groups) == 1:
+        rows = sweep_group(location, groups[0], points, args.time_limit, args.threads, arcs_opt)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers or len(groups)) as pool:
+            futures = [pool.submit(sweep_group, location, l_, points, args.time_limit, args.threads, arcs_opt)
+                       for l_ in groups]
+            rows = [r for fut in futures for r in fut.result()]
+
+    table = pd.DataFrame(rows)
+    solved = table["status"] == "ok"
+    table["pareto"] = False
+    if solved.any():
+        table.loc[solved, "pareto"] = pareto_front(table[solved])
+    table.to_csv(f"./results/gurobi_range_pareto-{location}.csv", index=False)
+    end_time = time_time.time()
+
+    with open(f"./results/gurobi_range_summary-{location}.txt", "w", encoding="utf-8") as f:
+        f.write("=== Gurobi Range Summary ===\n")
+        f.write(f"Location: {location}\n")
+        for r in rows:
+            f.write("=== 結果總結 ===\n")
+            f.write(f"🎯 (調度, 藏車)成本權重: ({r['α']}, {r['β']})\n")
+            f.write(f"🎯 權重比值(調度/藏車): {(r['α'] / r['β']):.4f}\n")
+            if r["status"] != "ok":
+                f.write(f"⚠️ 時限內沒有可行解（{r['status']}）\n")
+                continue
+            f.write(f"🎯 總成本 (Objective): {r['objective']:.2f}\n")
+            f.write(f"🚚 總調度數量: {int(r['dispatch'])}\n")
+            f.write(f"📦 總藏車數量: {int(r['hide'])}\n")
+            f.write(f"🔓 總釋放數量: {int(r['release'])}\n")
+        f.write(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒\n")
+
+    print(table.to_string(index=False))
+    print(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒")
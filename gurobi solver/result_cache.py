@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import time as time_time
+import numpy as np
+
+# === 求解結果快取 ===
+# 以輸入內容的雜湊為鍵：站點、容量、候選調度弧（隨站點座標改變）、各期需求、
+# 模型參數（μ, α, β, L, T_num, max_visit, delay）與求解設定。
+# 每筆快取存於 results/.cache/<鍵>/：輸出檔（dispatch / hide / summary）、完整計畫 plan.npz 與 meta.json。
+# 完全相同的輸入直接還原輸出檔；只有部分時段需求改變時，找出設定相同、未變更前綴最長的快取，
+# 供求解器固定該前綴的計畫、只從第一個變更的時段重解。總大小超過上限時依最後使用時間淘汰。
+
+CACHE_DIR = os.path.join("results", ".cache")
+MAX_BYTES = 512 * 1024 * 1024
+PLAN_BLOCKS = ("x", "v", "h_in", "h_out", "B", "W_borrow", "W_return")
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part, dtype=float if part.dtype.kind == "f" else None)
+            h.update(str(part.shape).encode())
+            h.update(part.tobytes())
+        elif isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def cache_key(demand, params, settings, arcs=None):
+    """
+    回傳 (鍵, 設定鍵, 各期需求雜湊)；設定鍵不含需求，用來尋找可沿用前綴的快取。
+    arcs 為候選調度弧（None 表示所有站點對），座標改變使候選弧不同時不會沿用舊的計畫。
+    """
+    config = json.dumps(dict(params=params, settings=settings), sort_keys=True, ensure_ascii=False, default=float)
+    config_key = _digest(config, np.asarray(demand.stations), np.asarray(demand.capacity),
+                         "full" if arcs is None else np.asarray(arcs))
+    D_borrow, D_return = np.asarray(demand.D_borrow), np.asarray(demand.D_return)
+    period_hashes = [_digest(t, D_borrow[:, k], D_return[:, k]) for k, t in enumerate(demand.times)]
+    return _digest(config_key, *period_hashes), config_key, period_hashes
+
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(entry, meta):
+    tmp = os.path.join(entry, "meta.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1, default=float)
+    os.replace(tmp, os.path.join(entry, "meta.json"))
+
+
+def _entries(folder):
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if os.path.isdir(os.path.join(folder, name))]
+
+
+def lookup(key, folder=CACHE_DIR):
+    """命中時回傳 (快取目錄, meta) 並更新最後使用時間，否則回傳 None。"""
+    entry = os.path.join(folder, key)
+    meta = _read_meta(entry)
+    if meta is None:
+        return None
+    meta["last_used"] = time_time.time()
+    _write_meta(entry, meta)
+    return entry, meta
+
+
+def restore(entry, meta, targets):
+    """將快取的輸出檔複製到 targets {名稱: 路徑}。"""
+    for name, path in targets.items():
+        shutil.copyfile(os.path.join(entry, meta["files"][name]), path)
+
+
+def find_prefix(config_key, period_hashes, folder=CACHE_DIR):
+    """設定相同且未變更前綴最長的快取，回傳 (快取目錄, 前綴期數)；沒有可沿用的前綴時回傳 (None, 0)。"""
+    best, best_n, best_used = None, 0, 0.0
+    for entry in _entries(folder):
+        meta = _read_meta(entry)
+        if meta is None or meta["config_key"] != config_key or len(meta["period_hashes"]) != len(period_hashes):
+            continue
+        n = 0
+        for a, b in zip(meta["period_hashes"], period_hashes):
+            if a != b:
+                break
+            n += 1
+        if n > best_n or (n == best_n and n > 0 and meta["last_used"] > best_used):
+            best, best_n, best_used = entry, n, meta["last_used"]
+    return best, best_n
+
+
+def load_plan(entry):
+    with np.load(os.path.join(entry, "plan.npz")) as f:
+        return {name: f[name] for name in f.files}
+
+
+def store(key, config_key, period_hashes, files, plan, result, folder=CACHE_DIR, max_bytes=MAX_BYTES):
+    """寫入一筆快取：files {名稱: 輸出檔路徑}、plan {欄區塊: (列數, T)} 與 arcs、result 為結果總結。"""
+    entry = os.path.join(folder, key)
+    tmp = entry + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    names = {}
+    for name, path in files.items():
+        names[name] = os.path.basename(path)
+        shutil.copyfile(path, os.path.join(tmp, names[name]))
+    np.savez_compressed(os.path.join(tmp, "plan.npz"), **plan)
+    now = time_time.time()
+    _write_meta(tmp, dict(key=key, config_key=config_key, period_hashes=period_hashes, files=names,
+                          result=result, created=now, last_used=now))
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+    evict(folder, max_bytes)
+    return entry
+
+
+def _size(entry):
+    return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+
+def evict(folder=CACHE_DIR, max_bytes=MAX_BYTES):
+    """總大小超過 max_bytes 時，依最後使用時間由舊到新刪除；回傳刪除的筆數。"""
+    entries = []
+    for entry in _entries(folder):
+        meta = _read_meta(entry)
+        entries.append((meta["last_used"] if meta else 0.0, _size(entry), entry))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def suffix_state(plan, n_fixed, arcs, delay, visits_total):
+    """
+    固定前 n_fixed 期的計畫後，從第 n_fixed 期開始重解所需的狀態（與 rolling.py 的跨視窗傳遞相同）：
+    期初庫存 B0、已藏車數 H0、前綴已出發並於之後抵達的車數 arrivals (S, T - n_fixed)、剩餘拜訪次數。
+    """
+    S, T = plan["B"].shape
+    in_transit = np.zeros((S, T + delay + 1))
+    for k in range(n_fixed):
+        np.add.at(in_transit[:, k + delay], arcs[:, 1], plan["x"][:, k])
+    return dict(
+        B0=plan["B"][:, n_fixed - 1].copy(),
+        H0=(plan["h_in"][:, :n_fixed] - plan["h_out"][:, :n_fixed]).sum(axis=1),
+        arrivals=in_transit[:, n_fixed:T],
+        visit_budget=max(visits_total - int(round(plan["v"][:, :n_fixed].sum())), 0),
+    )
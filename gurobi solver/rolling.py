@@ -0,0 +1,88 @@
+import math
+import time as time_time
+import numpy as np
+from model_builder import build_matrices
+from backends import make_backend
+
+# === 滾動視窗（receding horizon）求解引擎 ===
+# 每個視窗求解 window 期，只採用前 commit 期的決策，接著視窗往後移 commit 期。
+# 跨視窗傳遞：期末庫存 B、累積藏車量、已出發但尚未抵達的調度車輛，
+# 並以上一個視窗重疊部分的解作為 MIP 起始解（HiGHS 不支援起始解，每個視窗直接求解）。
+
+
+def rolling_solve(C, D_borrow, D_return, B0, hide_cap, μ, α, β, L, K, T_num, max_visit, delay,
+                  window=12, commit=6, time_limit=10, mip_gap=0.05, threads=None, arcs=None, backend="gurobi",
+                  log=print):
+    S, T = D_borrow.shape
+    window = max(window, commit)
+    B_cur = np.asarray(B0, dtype=float).copy()
+    H_cur = np.zeros(S)                 # 目前藏著的車數
+    in_transit = np.zeros((S, T + delay + 1))  # 依抵達期（絕對期數）累計的在途車數
+    visits_left = T_num * max_visit
+
+    plan = None
+    prev = None  # (視窗起點, 該視窗的解)
+    windows = []
+    start = 0
+    while start < T:
+        end = min(start + window, T)
+        n = end - start
+        n_commit = n if end == T else min(commit, n)
+        # 拜訪次數依剩餘期數按比例分配，避免前段把全日額度用完
+        budget = visits_left if end == T else math.ceil(visits_left * n / (T - start))
+
+        build_start = time_time.time()
+        mm = build_matrices(C, D_borrow[:, start:end], D_return[:, start:end], B_cur, hide_cap,
+                            μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay, arcs=arcs,
+                            H0=H_cur, arrivals=in_transit[:, start:end], first_period_flows=start > 0,
+                            visit_budget=budget)
+        solver = make_backend(mm, backend, f"YouBike_Window_{start}")
+        if plan is None:
+            A = len(mm.arcs)
+            plan = {name: np.zeros((A if name in ("x", "v") else S, T)) for name in mm.cols}
+
+        # 上一個視窗在重疊期間的解作為起始解，其餘（NaN）留給求解器補齊
+        if prev is not None:
+            p_start, p_sol = prev
+            overlap = p_start + p_sol["B"].shape[1] - start
+            if overlap > 0:
+                start_values = {}
+                for name, value in p_sol.items():
+                    st = np.full((value.shape[0], n), np.nan)
+                    st[:, :overlap] = value[:, start - p_start:]
+                    start_values[name] = st
+                solver.set_start(start_values)
+        build_time = time_time.time() - build_start
+
+        try:
+            result = solver.solve(time_limit=time_limit, mip_gap=mip_gap, threads=threads)
+        except RuntimeError as e:
+            raise RuntimeError(f"視窗 {start}–{end} 在時間限制內找不到可行解（{e}）") from None
+        solve_time = result.solve_time
+
+        sol = {name: value.reshape(-1, n) for name, value in result.values.items()}
+        for name in sol:
+            plan[name][:, start:start + n_commit] = sol[name][:, :n_commit]
+
+        # 傳遞狀態到下一個視窗
+        c = slice(0, n_commit)
+        B_cur = sol["B"][:, n_commit - 1].copy()
+        H_cur = H_cur + sol["h_in"][:, c].sum(axis=1) - sol["h_out"][:, c].sum(axis=1)
+        x_c = sol["x"][:, c]
+        for k in range(n_commit):
+            np.add.at(in_transit[:, start + k + delay], mm.arcs[:, 1], x_c[:, k])
+        visits_left -= int(round(sol["v"][:, c].sum()))
+
+        windows.append(dict(start=start, end=end, commit=n_commit, build_time=build_time,
+                            solve_time=solve_time, obj=result.objective, gap=result.gap, status=result.status))
+        log(f"🪟 視窗 {start:>3}–{end:<3} 採用 {n_commit} 期｜建模 {build_time:.2f} 秒｜"
+            f"求解 {solve_time:.2f} 秒｜gap {result.gap:.2%}")
+
+        prev = (start, sol)
+        start += n_commit
+
+    plan["arcs"] = mm.arcs
+    plan["windows"] = windows
+    plan["objective"] = (plan["W_borrow"].sum() + plan["W_return"].sum()
+                         + α * plan["x"].sum() + β * (plan["h_in"].sum() + plan["h_out"].sum()))
+    return plan
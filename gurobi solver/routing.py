@@ -0,0 +1,250 @@
+from demand_store import load_demand
+from spatial import load_coordinates, haversine_matrix
+from evaluate import load_plan
+from scipy.optimize import linear_sum_assignment
+import argparse
+import hashlib
+import os
+import time as time_time
+import numpy as np
+import pandas as pd
+
+# === 卡車路線排程 ===
+# 模型只以總量限制卡車（每期 K = T_num * L、全天拜訪次數 T_num * max_visit），輸出的是站對站的調度量。
+# 這裡把每期的調度量拆成 T_num 台卡車實際可跑的路線，每台卡車每期只跑一條路線：
+#   1. 每條調度弧為一件工作（起點取車 → 終點卸車），超過 L 的調度量拆成多件；
+#   2. 以節省法（Clarke-Wright，虛擬場站為距離中位站）把工作串成路線，路線的工作數不超過卡車剩餘的拜訪次數；
+#      每台卡車全天最多服務 max_visit 件工作（全部卡車合計即模型的 T_num * max_visit）；
+#   3. 每條路線以 2-opt 改善停靠順序，須維持先取後卸且車上數量不超過 L；
+#   4. 依各卡車上一期的結束位置，以指派問題分配路線，空車移動距離一併計入；
+#   5. 路線多於可用卡車、或剩餘拜訪次數不足時，排不進的工作另列為未服務，不會額外加開車次。
+# 距離矩陣由站點經緯度計算（大圓距離 × 繞行係數），依站點與座標的雜湊快取。
+
+L = 20         # 每台卡車最多載車數
+T_num = 30     # 卡車數
+max_visit = 3  # 每台卡車全天最多服務的調度弧數
+
+DIST_CACHE = os.path.join("results", ".cache", "distances")
+
+
+def distance_matrix(stations, lat, lon, folder=DIST_CACHE):
+    """站點兩兩距離（公里，float32），以站點與座標的雜湊為鍵快取；缺座標的站點以其餘站點的中心代替。"""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    known = ~(np.isnan(lat) | np.isnan(lon))
+    if known.any() and not known.all():
+        lat, lon = np.where(known, lat, lat[known].mean()), np.where(known, lon, lon[known].mean())
+    elif not known.any():
+        lat, lon = np.zeros_like(lat), np.zeros_like(lon)
+
+    h = hashlib.sha256()
+    for part in (np.asarray(stations), lat, lon):
+        h.update(np.ascontiguousarray(part).tobytes())
+    path = os.path.join(folder, h.hexdigest()[:32] + ".npy")
+    if os.path.exists(path):
+        return np.load(path)
+    d = haversine_matrix(lat, lon).astype(np.float32)
+    os.makedirs(folder, exist_ok=True)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, d)
+    os.replace(tmp, path)
+    return d
+
+
+def split_jobs(arcs, q, L=L):
+    """單期調度量 q (A,) 拆成工作 (起點, 終點, 數量)，每件不超過 L。"""
+    jobs = []
+    for a in np.flatnonzero(q > 0.5):
+        i, j = int(arcs[a, 0]), int(arcs[a, 1])
+        left = int(round(q[a]))
+        while left > 0:
+            jobs.append((i, j, min(left, L)))
+            left -= L
+    return jobs
+
+
+def path_length(stops, d):
+    return float(sum(d[a[0], b[0]] for a, b in zip(stops, stops[1:])))
+
+
+def feasible(stops, L=L):
+    """停靠序列 [(站, 工作, ±數量)]：每件工作先取後卸，車上數量在 [0, L]。"""
+    load, picked = 0, set()
+    for _, job, q in stops:
+        if q > 0:
+            picked.add(job)
+        elif job not in picked:
+            return False
+        load += q
+        if load > L:
+            return False
+    return True
+
+
+def two_opt(stops, d, L=L):
+    """反轉區段改善停靠順序（開放路徑），只接受可行且較短的序列。"""
+    best = path_length(stops, d)
+    improved = True
+    while improved:
+        improved = False
+        for a in range(len(stops) - 1):
+            for b in range(a + 1, len(stops)):
+                cand = stops[:a] + stops[a:b + 1][::-1] + stops[b + 1:]
+                length = path_length(cand, d)
+                if length < best - 1e-9 and feasible(cand, L):
+                    stops, best, improved = cand, length, True
+    return stops
+
+
+def savings_routes(jobs, d, depot, n_trucks=T_num, max_visit=max_visit):
+    """節省法把工作串成路線（工作索引串列），每條最多 max_visit 件；路線數多於 n_trucks 時繼續合併，直到無法再合併。"""
+    n = len(jobs)
+    if n == 0:
+        return []
+    start = np.array([i for i, _, _ in jobs])
+    end = np.array([j for _, j, _ in jobs])
+    s = d[end, depot][:, None] + d[depot, start][None, :] - d[end[:, None], start[None, :]]
+    np.fill_diagonal(s, -np.inf)
+
+    routes = {k: [k] for k in range(n)}
+    route_of = list(range(n))
+    for flat in np.argsort(-s, axis=None, kind="stable"):
+        a, b = divmod(int(flat), n)
+        if not np.isfinite(s[a, b]) or (s[a, b] <= 0 and len(routes) <= n_trucks):
+            break
+        ra, rb = route_of[a], route_of[b]
+        if ra == rb or routes[ra][-1] != a or routes[rb][0] != b or len(routes[ra]) + len(routes[rb]) > max_visit:
+            continue
+        routes[ra] += routes.pop(rb)
+        for k in routes[ra]:
+            route_of[k] = ra
+    return list(routes.values())
+
+
+def build_stops(route, jobs, d, L=L):
+    stops = []
+    for k in route:
+        i, j, q = jobs[k]
+        stops += [(i, k, q), (j, k, -q)]
+    return two_opt(stops, d, L)
+
+
+def route_day(arcs, x, d, L=L, T_num=T_num, max_visit=max_visit):
+    """
+    逐期排出所有卡車路線。回傳 (停靠紀錄 DataFrame, 每期統計 DataFrame, 未服務工作 DataFrame)；
+    停靠紀錄的 leg_km 為自上一停靠點（或卡車上一期結束位置）起的距離，每條路線第一站的 leg_km 即空車移動距離。
+    每台卡車每期最多一條路線、全天最多 max_visit 件工作；排不進的工作列入未服務，該期統計標記為不可行。
+    """
+    depot = int(np.argmin(d.sum(axis=1)))
+    pos = np.full(T_num, -1)  # 各卡車目前位置，-1 表示尚未出車
+    left = np.full(T_num, max_visit)  # 各卡車當天剩餘的拜訪次數
+    rows, stats, unserved = [], [], []
+    for t in range(x.shape[1]):
+        jobs = split_jobs(arcs, x[:, t], L)
+        free = np.flatnonzero(left > 0)
+        routes = []
+        if len(free):
+            routes = [build_stops(route, jobs, d, L)
+                      for route in savings_routes(jobs, d, depot, len(free), int(left.max()))]
+        else:
+            routes = [build_stops([k], jobs, d, L) for k in range(len(jobs))]
+
+        # 指派路線給本期尚未出車、剩餘拜訪次數足夠的卡車；指派不到的路線拆回單件工作再試一次
+        pending, n_routes, before = routes, len(routes), len(unserved)
+        for _ in range(2):
+            if not pending or not len(free):
+                break
+            start = np.array([r[0][0] for r in pending])
+            size = np.array([len(r) // 2 for r in pending])
+            cost = np.where(pos[free, None] < 0, 0.0, d[np.maximum(pos[free], 0)[:, None], start[None, :]])
+            cost = np.where(size[None, :] <= left[free, None], cost, np.inf)
+            ok = np.isfinite(cost)
+            trucks, picked = linear_sum_assignment(np.where(ok, cost, 1e12))
+            used, assigned = [], set()
+            for f, p in zip(trucks, picked):
+                if not ok[f, p]:
+                    continue
+                truck, stops, load = free[f], pending[p], 0
+                prev = pos[truck]
+                for seq, (s, job, q) in enumerate(stops):
+                    load += q
+                    rows.append(dict(truck=int(truck), period=t, seq=seq, station=s,
+                                     action="pickup" if q > 0 else "drop", quantity=abs(q), load=load,
+                                     leg_km=float(d[prev, s]) if prev >= 0 else 0.0))
+                    prev = s
+                pos[truck] = prev
+                left[truck] -= len(stops) // 2
+                used.append(f)
+                assigned.add(int(p))
+            free = np.delete(free, used)
+            pending = [build_stops([job], jobs, d, L) for k, r in enumerate(pending) if k not in assigned
+                       for job in sorted({job for _, job, _ in r})]
+        for r in pending:
+            for job in sorted({job for _, job, _ in r}):
+                i, j, q = jobs[job]
+                unserved.append(dict(period=t, origin=i, destination=j, quantity=q))
+        missed = len(unserved) - before
+        stats.append(dict(period=t, jobs=len(jobs), routes=n_routes, unserved=missed, feasible=missed == 0))
+    stops = pd.DataFrame(rows, columns=["truck", "period", "seq", "station", "action", "quantity", "load", "leg_km"])
+    return (stops, pd.DataFrame(stats, columns=["period", "jobs", "routes", "unserved", "feasible"]),
+            pd.DataFrame(unserved, columns=["period", "origin", "destination", "quantity"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把調度計畫拆成各卡車的路線")
+    parser.add_argument("location", help="行政區，例如 datong")
+    parser.add_argument("--plan", default="gurobi",
+                        help="計畫名稱（讀取 results/{plan}_dispatch-{location}.csv），預設 gurobi")
+    parser.add_argument("--detour", type=float, default=1.3, help="繞行係數：道路距離 / 大圓距離")
+    args = parser.parse_args()
+
+    loc = args.location
+    start_time = time_time.time()
+    demand = load_demand(loc)
+    stations, times, sna_map, *_ = demand.arrays()
+    dispatch_csv = f"./results/{args.plan}_dispatch-{loc}.csv"
+    if not os.path.exists(dispatch_csv):
+        raise SystemExit(f"⚠️ 找不到 {dispatch_csv}")
+    plan = load_plan(dispatch_csv, f"./results/{args.plan}_hide-{loc}.csv", demand)
+    lat, lon = load_coordinates(stations)
+    d = distance_matrix(stations, lat, lon) * np.float32(args.detour)
+    load_time = time_time.time() - start_time
+
+    t0 = time_time.time()
+    stops, stats, unserved = route_day(plan["arcs"], plan["x"], d)
+    route_time = time_time.time() - t0
+
+    # === 輸出各卡車排程 ===
+    stations = np.asarray(stations)
+    schedule = stops.sort_values(["truck", "period", "seq"], kind="stable").reset_index(drop=True)
+    schedule["cum_km"] = schedule.groupby("truck")["leg_km"].cumsum()
+    sno = stations[schedule["station"].to_numpy(dtype=int)]
+    schedule.insert(1, "time", np.asarray(times, dtype=object)[schedule["period"].to_numpy(dtype=int)])
+    schedule.insert(5, "sno", sno)
+    schedule.insert(6, "sna", [sna_map[s] for s in sno])
+    schedule = schedule.drop(columns=["period", "station"]).round({"leg_km": 3, "cum_km": 3})
+    schedule.to_csv(f"./results/{args.plan}_routes-{loc}.csv", index=False)
+    if len(unserved):
+        unserved.insert(1, "time", np.asarray(times, dtype=object)[unserved["period"].to_numpy(dtype=int)])
+        unserved["origin"] = stations[unserved["origin"].to_numpy(dtype=int)]
+        unserved["destination"] = stations[unserved["destination"].to_numpy(dtype=int)]
+        unserved.drop(columns="period").to_csv(f"./results/{args.plan}_routes_unserved-{loc}.csv", index=False)
+
+    # load 為離開該站時的車上數量；駛向該站的這一段車上數量為 load 扣回本站的取放量，為 0 即空車移動
+    signed = np.where(stops["action"] == "pickup", stops["quantity"], -stops["quantity"])
+    empty = stops["load"] - signed <= 1e-9
+    total_km = stops["leg_km"].sum()
+    empty_km = stops.loc[empty, "leg_km"].sum()
+    per_truck = stops.groupby("truck")["leg_km"].sum()
+    lines = [
+        "=== 卡車路線總結 ===",
+        f"🚚 調度工作: {stats['jobs'].sum()} 件，路線 {stops.groupby(['truck', 'period']).ngroups} 條，出車 {stops['truck'].nunique()} / {T_num} 台",
+        f"🛣️ 總距離: {total_km:.2f} 公里（載運 {total_km - empty_km:.2f}，空車移動 {empty_km:.2f}）",
+        f"📏 單車最長: {per_truck.max() if len(per_truck) else 0:.2f} 公里",
+        f"🔁 卡車數或拜訪次數不足的時段: {int((~stats['feasible']).sum())} 期，未服務工作 {len(unserved)} 件",
+        f"📂 載入時間: {load_time:.3f} 秒",
+        f"🧭 排程時間: {route_time:.2f} 秒",
+    ]
+    with open(f"./results/{args.plan}_routes_summary-{loc}.txt", "w", encoding="utf-8") as f:
+        f.write("".join(line + "\n" for line in lines))
+    for line in lines:
+        print(line)
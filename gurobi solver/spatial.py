@@ -0,0 +1,72 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# === 站點空間索引與候選調度弧 ===
+EARTH_RADIUS_KM = 6371.0
+
+
+def load_coordinates(stations, folder="assets/interval_outputs"):
+    """從 interval_*.csv 取得各站經緯度，找不到的站點為 NaN。"""
+    lat = pd.Series(np.nan, index=stations, dtype=float)
+    lon = pd.Series(np.nan, index=stations, dtype=float)
+    for path in sorted(glob.glob(os.path.join(folder, "interval_*.csv"))):
+        snap = pd.read_csv(path, usecols=["sno", "latitude", "longitude"]).drop_duplicates("sno").set_index("sno")
+        missing = lat.index[lat.isna()]
+        found = missing.intersection(snap.index)
+        lat[found] = snap.loc[found, "latitude"]
+        lon[found] = snap.loc[found, "longitude"]
+        if not lat.isna().any():
+            break
+    return lat.to_numpy(), lon.to_numpy()
+
+
+def _unit_vectors(lat, lon):
+    φ, λ = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(φ) * np.cos(λ), np.cos(φ) * np.sin(λ), np.sin(φ)])
+
+
+def haversine_matrix(lat, lon):
+    """站點兩兩之間的大圓距離（公里）。"""
+    φ, λ = np.radians(lat), np.radians(lon)
+    dφ = φ[:, None] - φ[None, :]
+    dλ = λ[:, None] - λ[None, :]
+    a = np.sin(dφ / 2) ** 2 + np.cos(φ)[:, None] * np.cos(φ)[None, :] * np.sin(dλ / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def candidate_arcs(lat, lon, k=None, radius_km=None, symmetric=True):
+    """
+    以 k 近鄰與半徑篩選調度弧 (i, j)：j 需同時是 i 的前 k 近鄰且距離不超過 radius_km。
+    k 或 radius_km 為 None 表示不設該條件；缺座標的站點保留所有弧。
+    symmetric=True 時 (i, j) 與 (j, i) 同進同出。
+    """
+    n = len(lat)
+    if k is None and radius_km is None:
+        i, j = np.nonzero(~np.eye(n, dtype=bool))
+        return np.column_stack([i, j])
+
+    known = ~(np.isnan(lat) | np.isnan(lon))
+    idx = np.flatnonzero(known)
+    keep = np.zeros((n, n), dtype=bool)
+
+    if len(idx) > 1:
+        tree = cKDTree(_unit_vectors(lat[idx], lon[idx]))
+        kk = len(idx) if k is None else min(k + 1, len(idx))  # 含自己
+        # 半徑換算為單位球上的弦長
+        bound = np.inf if radius_km is None else 2 * np.sin(radius_km / (2 * EARTH_RADIUS_KM)) * (1 + 1e-12)
+        dist, nbr = tree.query(_unit_vectors(lat[idx], lon[idx]), k=kk, distance_upper_bound=bound)
+        dist, nbr = dist.reshape(len(idx), -1), nbr.reshape(len(idx), -1)
+        rows = np.repeat(idx, nbr.shape[1])
+        valid = np.isfinite(dist).ravel()
+        keep[rows[valid], idx[nbr.ravel()[valid]]] = True
+
+    keep[~known, :] = True
+    keep[:, ~known] = True
+    if symmetric:
+        keep |= keep.T
+    np.fill_diagonal(keep, False)
+    i, j = np.nonzero(keep)
+    return np.column_stack([i, j])
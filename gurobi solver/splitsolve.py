@@ -1,5 +1,11 @@
-from gurobipy import *
-import pandas as pd
+from model_builder import extract_frames, save_compact
+from demand_store import load_demand
+from rolling import rolling_solve
+from decompose import decompose_solve
+from telemetry import RunTelemetry
+from spatial import load_coordinates, candidate_arcs
+import argparse
+import time as time_time
 import os
 
 # === 全域參數設定 ===
@@ -10,124 +16,107 @@ L = 20        # 每輛卡車可載車數
 T_num = 30    # 卡車數
 max_visit = 3 # 每台卡車最多拜訪站點數
 K = T_num * L # 每期最大調度數量
-limit_time = 120  # 每段最多運行時間（秒）
-
-# === 載入資料（處理整個台北市，不過濾 sarea）===
-df = pd.read_csv("./assets/gurobi_demand_table.csv")
-
-# 整理時間與站點
-times = sorted(df["interval_time"].unique())
-stations = sorted(df["sno"].unique())
-sna_map = df.drop_duplicates("sno").set_index("sno")["sna"].to_dict()
-
-# 索引對應
-S = range(len(stations))
-s_index = {s: i for i, s in enumerate(stations)}
-stations_map = {i: s for s, i in s_index.items()}
-C = {s_index[row.sno]: row.total for _, row in df.drop_duplicates("sno").iterrows()}
-max_hide_per_station = {i: int(0.4 * C[i]) for i in S}
-B0 = {i: int(0.35 * C[i]) for i in S}
-
-# 時間切段（每 12 個半小時 = 6 小時一段）
-interval_per_batch = 12
-batches = [times[i:i + interval_per_batch] for i in range(0, len(times), interval_per_batch)]
+delay = 2     # 調度延遲時間（期數）
+
+parser = argparse.ArgumentParser(description="YouBike 滾動視窗／空間分解求解")
+parser.add_argument("location", nargs="?", default=None, help="行政區；省略時處理整個台北市")
+parser.add_argument("--mode", choices=["rolling", "decompose"], default="rolling",
+                    help="rolling：依時間切視窗；decompose：依空間分群平行求解後協調跨群調度")
+parser.add_argument("--window", type=int, default=12, help="每個視窗的期數")
+parser.add_argument("--commit", type=int, default=6, help="每個視窗採用的期數（其餘與下個視窗重疊）")
+parser.add_argument("--time-limit", type=float, default=10, help="每個視窗（分解模式為每群）最多運行時間（秒）")
+parser.add_argument("--k", type=int, default=8, help="每站只建立到最近 k 站的調度弧")
+parser.add_argument("--radius", type=float, default=2.0, help="調度弧最大距離（公里）")
+parser.add_argument("--max-cluster", type=int, default=60, help="分解模式：每群最多站數")
+parser.add_argument("--coord-k", type=int, default=2, help="分解模式：跨群調度弧只連到最近 k 站")
+parser.add_argument("--coord-time-limit", type=float, default=120, help="分解模式：協調模型最多運行時間（秒）")
+parser.add_argument("--workers", type=int, default=None, help="分解模式：平行子程序數")
+parser.add_argument("--backend", choices=["gurobi", "highs"], default="gurobi", help="滾動視窗與分解模式的求解器")
+parser.add_argument("--formulation", choices=["standard", "compact"], default="standard", help="分解模式的模型形式")
+parser.add_argument("--compact", action="store_true", help="另輸出欄式 npz 結果檔（只存非零項）")
+args = parser.parse_args()
+
+# === 載入資料（未指定行政區時處理整個台北市，不過濾 sarea）===
+start_time = time_time.time()
+name = args.location or "full"
+tel = RunTelemetry(f"gurobi_{args.mode}", name, vars(args))
+
+# 整理時間與站點、索引對應
+with tel.phase("load"):
+    demand = load_demand(args.location)
+    stations, times, sna_map, C, D_borrow, D_return = demand.arrays()
+    lat, lon = load_coordinates(stations)
+max_hide_per_station = (0.4 * C).astype(int)
+B0 = (0.35 * C).astype(int)
+arcs = candidate_arcs(lat, lon, k=args.k, radius_km=args.radius)
 
 # 建立輸出資料夾
 if not os.path.exists("results"):
     os.makedirs("results")
 
-dispatch_records = []
-hide_records = []
-prev_B = B0.copy()
-
-for batch_id, batch_times in enumerate(batches):
-    print(f"🟢 處理第 {batch_id + 1} 段，共 {len(batch_times)} 個時段...")
-
-    T = range(len(batch_times))
-    t_index = {t: i for i, t in enumerate(batch_times)}
-    D_borrow = {(s_index[row.sno], t_index[row.interval_time]): row.demand_borrow
-                for _, row in df[df["interval_time"].isin(batch_times)].iterrows()}
-    D_return = {(s_index[row.sno], t_index[row.interval_time]): row.demand_return
-                for _, row in df[df["interval_time"].isin(batch_times)].iterrows()}
-
-    # 模型
-    m = Model(f"YouBike_Batch_{batch_id + 1}")
-    m.setParam("OutputFlag", 0)
-    m.setParam("TimeLimit", limit_time)
-    m.setParam("MIPGap", 0.05)
-
-    x = m.addVars(S, S, T, vtype=GRB.CONTINUOUS, name="x")
-    v = m.addVars(S, S, T, vtype=GRB.BINARY, name="v")
-    h_in = m.addVars(S, T, vtype=GRB.INTEGER, name="h_in")
-    h_out = m.addVars(S, T, vtype=GRB.INTEGER, name="h_out")
-    B = m.addVars(S, T, lb=0, name="B")
-    W_borrow = m.addVars(S, T, lb=0, name="W_borrow")
-    W_return = m.addVars(S, T, lb=0, name="W_return")
-
-    delay = 2
-
-    for t in T:
-        for i in S:
-            inflow = quicksum(x[j, i, t - delay] for j in S if j != i) if t - delay >= 0 else 0
-            outflow = quicksum(x[i, j, t] for j in S if j != i)
-
-            if t == 0:
-                m.addConstr(B[i, t] == prev_B[i] + h_out[i, t] - h_in[i, t])
-            else:
-                m.addConstr(B[i, t] == B[i, t - 1] + inflow - outflow + h_out[i, t] - h_in[i, t])
-
-            m.addConstr(B[i, t] <= C[i])
-            m.addConstr(W_borrow[i, t] >= (D_borrow.get((i, t), 0) - B[i, t]) / μ)
-            m.addConstr(W_return[i, t] >= (D_return.get((i, t), 0) - (C[i] - B[i, t])) / μ)
-            m.addConstr(h_in[i, t] <= max_hide_per_station[i])
-            m.addConstr(h_in[i, t] * h_out[i, t] == 0)
-            m.addConstr(h_out[i, t] <= quicksum(h_in[i, τ] - h_out[i, τ] for τ in range(t + 1)))
-
-    for t in T:
-        m.addConstr(quicksum(x[i, j, t] for i in S for j in S if i != j) <= K)
-
-    for i in S:
-        for j in S:
-            if i != j:
-                for t in T:
-                    m.addConstr(x[i, j, t] <= L * v[i, j, t])
-
-    m.addConstr(quicksum(v[i, j, t] for i in S for j in S if i != j for t in T) <= T_num * max_visit)
-
-    m.setObjective(
-        quicksum(W_borrow[i, t] + W_return[i, t] for i in S for t in T) +
-        α * quicksum(x[i, j, t] for i in S for j in S if i != j for t in T) +
-        β * quicksum(h_in[i, t] + h_out[i, t] for i in S for t in T),
-        GRB.MINIMIZE
-    )
-
-    m.optimize()
-
-    for t in T:
-        time = batch_times[t]
-        for i in S:
-            s1 = stations_map[i]
-            for j in S:
-                if i != j and x[i, j, t].X > 0.5:
-                    s2 = stations_map[j]
-                    dispatch_records.append(dict(
-                        from_sno=s1, to_sno=s2,
-                        from_sna=sna_map[s1], to_sna=sna_map[s2],
-                        time=time, quantity=int(x[i, j, t].X)
-                    ))
-            if h_in[i, t].X > 0.5 or h_out[i, t].X > 0.5:
-                hide_records.append(dict(
-                    sno=s1, sna=sna_map[s1],
-                    time=time,
-                    hide=int(h_in[i, t].X),
-                    release=int(h_out[i, t].X)
-                ))
-
-    # 傳遞期末庫存
-    prev_B = {i: int(B[i, len(T) - 1].X) for i in S}
-    print(f"✅ 第 {batch_id + 1} 段完成")
-
-# 輸出 CSV
-pd.DataFrame(dispatch_records).to_csv(f"./results/gurobi_dispatch-full.csv", index=False)
-pd.DataFrame(hide_records).to_csv(f"./results/gurobi_hide-full.csv", index=False)
-print("🎉 所有區段已完成並輸出結果")
\ No newline at end of file
+solve_start = time_time.time()
+if args.mode == "rolling":
+    plan = rolling_solve(C, D_borrow, D_return, B0, max_hide_per_station,
+                         μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay,
+                         window=args.window, commit=args.commit, time_limit=args.time_limit, arcs=arcs,
+                         backend=args.backend)
+else:
+    plan = decompose_solve(C, D_borrow, D_return, B0, max_hide_per_station,
+                           μ=μ, α=α, β=β, L=L, K=K, T_num=T_num, max_visit=max_visit, delay=delay,
+                           lat=lat, lon=lon, sarea=demand.sarea, max_cluster=args.max_cluster, k=args.k,
+                           radius_km=args.radius, coord_k=args.coord_k, time_limit=args.time_limit,
+                           coord_time_limit=args.coord_time_limit,
+                           backend=args.backend, formulation=args.formulation, workers=args.workers)
+
+solve_wall = time_time.time() - solve_start
+
+with tel.phase("extract"):
+    dispatch_df, hide_df = extract_frames(plan["arcs"], plan["x"], plan["h_in"], plan["h_out"],
+                                          stations, times, sna_map)
+
+# 輸出 CSV（--compact 時另存欄式 npz）
+with tel.phase("write"):
+    dispatch_df.to_csv(f"./results/gurobi_dispatch-{name}.csv", index=False)
+    hide_df.to_csv(f"./results/gurobi_hide-{name}.csv", index=False)
+    if args.compact:
+        save_compact(f"./results/gurobi_plan-{name}.npz", plan["arcs"], plan["x"], plan["h_in"], plan["h_out"],
+                     stations, times, sna_map)
+print("🎉 所有子問題已完成並輸出結果")
+
+end_time = time_time.time()
+if args.mode == "rolling":
+    parts = plan["windows"]
+    title = "滾動視窗"
+    layout = f"🪟 視窗: {args.window} 期，每次採用 {args.commit} 期，共 {len(parts)} 個視窗"
+else:
+    parts = plan["clusters"] + ([plan["coordination"]] if plan["coordination"] else [])
+    title = "空間分解"
+    layout = (f"🧩 分群: {len(plan['clusters'])} 群（每群最多 {args.max_cluster} 站），"
+              f"平行求解 {plan['cluster_time']:.2f} 秒")
+    if plan["coordination"]:
+        layout += f"\n🤝 協調: {plan['coordination']['stations']} 個邊界站、{plan['coordination']['arcs']} 條跨群弧"
+build_time = sum(p["build_time"] for p in parts)
+solve_time = sum(p["solve_time"] for p in parts)
+with open(f"./results/gurobi_{args.mode}_summary-{name}.txt", "w", encoding="utf-8") as f:
+    f.write(f"=== 結果總結（{title}）===\n")
+    f.write(layout + "\n")
+    f.write(f"🎯 總成本 (Objective): {plan['objective']:.2f}\n")
+    f.write(f"🚚 總調度數量: {int(plan['x'].sum())}\n")
+    f.write(f"📦 總藏車數量: {int(plan['h_in'].sum())}\n")
+    f.write(f"🔓 總釋放數量: {int(plan['h_out'].sum())}\n")
+    f.write(f"🏗️ 建模時間: {build_time:.2f} 秒\n")
+    f.write(f"🧮 求解時間: {solve_time:.2f} 秒\n")
+    f.write(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒\n")
+
+print(f"=== 結果總結（{title}）===")
+print(f"🎯 總成本 (Objective): {plan['objective']:.2f}")
+print(f"🚚 總調度數量: {int(plan['x'].sum())}")
+print(f"📦 總藏車數量: {int(plan['h_in'].sum())}")
+print(f"🔓 總釋放數量: {int(plan['h_out'].sum())}")
+print(f"⏱️ 運行時間: {end_time - start_time:.2f} 秒")
+
+# 子問題的建模與求解時間加總；solve_wall 為實際經過時間（分解模式為平行）
+tel.record["phases"].update(build=build_time, solve=solve_time, solve_wall=solve_wall)
+tel.set(objective=float(plan["objective"]), stations=len(stations), periods=len(times), arcs=len(plan["arcs"]),
+        parts=parts)
+tel.write()
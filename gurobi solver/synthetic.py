@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+# === 合成需求資料 ===
+# 產生與 gurobi_demand_table_*.csv 相同欄位的需求表，以及各站經緯度，供規模測試使用。
+# 每站的在站車數比例 = 基準值 + 日週期（住宅區早上變空、商業區早上變滿）+ AR(1) 擾動，
+# 與實際資料相同：demand_return 為在站車數、demand_borrow 為空位數。
+
+CENTER = (25.04, 121.55)      # 台北市中心附近
+STATIONS_PER_KM2 = 1500 / 270  # 約為台北市的站點密度
+DISTRICT_SIZE = 125            # 每個合成行政區的平均站數
+
+
+def _period_labels(n_periods):
+    step = 30 if n_periods <= 48 else 1440 // n_periods
+    return [f"{(step * t) // 60:02d}:{(step * t) % 60:02d}" for t in range(n_periods)]
+
+
+def generate_demand(n_stations, n_periods=46, volatility=0.3, seed=0):
+    """回傳 (需求表 DataFrame, lat, lon)；相同參數與 seed 產生相同資料。"""
+    rng = np.random.default_rng(seed)
+    S, T = n_stations, n_periods
+
+    # 站點座標：以台北市的站點密度散佈在正方形區域內
+    side_km = np.sqrt(S / STATIONS_PER_KM2)
+    xy = rng.uniform(-side_km / 2, side_km / 2, size=(S, 2))
+    lat = CENTER[0] + xy[:, 1] / 111.0
+    lon = CENTER[1] + xy[:, 0] / (111.0 * np.cos(np.radians(CENTER[0])))
+
+    # 行政區：依座標切成約 DISTRICT_SIZE 站一格的網格
+    n_side = max(1, int(round(np.sqrt(S / DISTRICT_SIZE))))
+    cell = np.minimum(((xy + side_km / 2) / side_km * n_side).astype(int), n_side - 1)
+    sarea = np.array([f"合成{r * n_side + c + 1}區" for r, c in cell])
+
+    capacity = np.clip(np.round(rng.lognormal(np.log(25), 0.45, S)), 5, 99)
+    base = rng.uniform(0.2, 0.8, S)
+    amplitude = rng.uniform(0.05, 0.35, S) * rng.choice([-1, 1], S)
+    phase = rng.uniform(-0.5, 0.5, S)
+    t = np.arange(T) / T
+    fill = base[:, None] + amplitude[:, None] * np.sin(2 * np.pi * (t[None, :] - 0.25) + phase[:, None])
+
+    # AR(1) 擾動，volatility 為擾動的標準差
+    noise = np.zeros((S, T))
+    shocks = rng.normal(0, volatility * np.sqrt(1 - 0.7 ** 2), (S, T))
+    noise[:, 0] = rng.normal(0, volatility, S)
+    for k in range(1, T):
+        noise[:, k] = 0.7 * noise[:, k - 1] + shocks[:, k]
+    fill = np.clip(fill + noise, 0, 1)
+
+    bikes = np.round(capacity[:, None] * fill * 4) / 4
+    times = _period_labels(T)
+    sno = 900000001 + np.arange(S)
+    df = pd.DataFrame(dict(
+        sno=np.tile(sno, T),
+        sna=np.tile([f"合成站{i:04d}" for i in range(S)], T),
+        sarea=np.tile(sarea, T),
+        interval_time=np.repeat(times, S),
+        total=np.tile(capacity, T),
+        demand_borrow=(capacity[:, None] - bikes).T.ravel(),
+        demand_return=bikes.T.ravel(),
+    ))
+    return df, lat, lon
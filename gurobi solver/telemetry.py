@@ -0,0 +1,76 @@
+import json
+import os
+import platform
+import resource
+import sys
+import time as time_time
+from contextlib import contextmanager
+
+# === 執行紀錄（telemetry）===
+# 每次求解輸出一份 JSON：各階段耗時（load / build / solve / extract / write）、模型規模、
+# 記憶體峰值，以及 MIP 求解過程中的 incumbent / bound / gap 軌跡，存於 results/telemetry/。
+
+TELEMETRY_DIR = os.path.join("results", "telemetry")
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """記憶體峰值（MB）；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes。"""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class RunTelemetry:
+    def __init__(self, solver, location, params=None):
+        self.record = dict(
+            solver=solver, location=location, params=params or {},
+            started_at=time_time.strftime("%Y-%m-%dT%H:%M:%S"), host=platform.node(),
+            phases={}, model={}, trajectory=[],
+        )
+        self._start = time_time.time()
+
+    @contextmanager
+    def phase(self, name):
+        # 同名階段可重複進入，耗時累加
+        t0 = time_time.time()
+        try:
+            yield
+        finally:
+            phases = self.record["phases"]
+            phases[name] = phases.get(name, 0.0) + time_time.time() - t0
+
+    def model_size(self, num_vars, num_constrs, num_nonzeros):
+        self.record["model"] = dict(vars=int(num_vars), constrs=int(num_constrs), nonzeros=int(num_nonzeros))
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    @property
+    def trajectory(self):
+        """求解器回呼填入的 (秒, incumbent, bound) 清單。"""
+        return self.record["trajectory"]
+
+    def finish(self):
+        self.record["wall_time"] = time_time.time() - self._start
+        self.record["peak_rss_mb"] = peak_rss_mb()
+        self.record["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        return self.record
+
+    def write(self, folder=TELEMETRY_DIR):
+        self.finish()
+        os.makedirs(folder, exist_ok=True)
+        stamp = time_time.strftime("%Y%m%d-%H%M%S", time_time.localtime(self._start)) + f"{self._start % 1:.3f}"[1:]
+        path = os.path.join(folder, f"{self.record['solver']}-{self.record['location']}-{stamp}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.record, f, ensure_ascii=False, indent=1, default=float)
+        return path
+
+
+def load_records(folder=TELEMETRY_DIR):
+    records = []
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        if name.endswith(".json"):
+            with open(os.path.join(folder, name), encoding="utf-8") as f:
+                rec = json.load(f)
+            rec["file"] = name
+            records.append(rec)
+    return records
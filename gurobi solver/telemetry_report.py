@@ -0,0 +1,66 @@
+from telemetry import load_records, TELEMETRY_DIR
+import argparse
+import pandas as pd
+
+# === 執行紀錄比較：讀取 results/telemetry/*.json，依行政區與求解器彙整 ===
+
+PHASES = ("load", "build", "solve", "extract", "write")
+
+
+def first_time(trajectory, target=None):
+    """第一次出現 incumbent（target 為 None）或 gap <= target 的秒數。"""
+    for t, best, bound in trajectory:
+        if best is None or (target is not None and bound is None):
+            continue
+        if target is None or abs(best - bound) <= target * abs(best):
+            return t
+    return None
+
+
+def summarize(records, target_gap=0.05):
+    rows = []
+    for rec in records:
+        model = rec.get("model", {})
+        traj = rec.get("trajectory", [])
+        row = dict(file=rec["file"], solver=rec["solver"], location=rec["location"], started_at=rec["started_at"])
+        row.update({p: rec["phases"].get(p) for p in PHASES})
+        row.update(
+            wall=rec.get("wall_time"), vars=model.get("vars"), constrs=model.get("constrs"),
+            nonzeros=model.get("nonzeros"), peak_rss_mb=rec.get("peak_rss_mb"),
+            objective=rec.get("objective"), gap=rec.get("gap"),
+            first_incumbent=first_time(traj), time_to_gap=first_time(traj, target_gap),
+        )
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較各次求解的執行紀錄")
+    parser.add_argument("--folder", default=TELEMETRY_DIR)
+    parser.add_argument("--location", action="append", help="只顯示指定行政區，可重複指定")
+    parser.add_argument("--solver", action="append", help="只顯示指定求解器，可重複指定")
+    parser.add_argument("--all", action="store_true", help="顯示所有紀錄（預設每個求解器／行政區只取最新一筆）")
+    parser.add_argument("--metric", default="wall", help="樞紐表的比較欄位，例如 solve、peak_rss_mb、objective")
+    parser.add_argument("--target-gap", type=float, default=0.05)
+    parser.add_argument("--csv", default=None, help="另存明細 CSV")
+    args = parser.parse_args()
+
+    table = summarize(load_records(args.folder), args.target_gap)
+    if table.empty:
+        print(f"⚠️ {args.folder} 內沒有執行紀錄")
+        raise SystemExit(0)
+    if args.location:
+        table = table[table["location"].isin(args.location)]
+    if args.solver:
+        table = table[table["solver"].isin(args.solver)]
+    if not args.all:
+        table = table.sort_values("started_at").groupby(["solver", "location"]).tail(1)
+    table = table.sort_values(["location", "solver", "started_at"]).reset_index(drop=True)
+
+    if args.csv:
+        table.to_csv(args.csv, index=False)
+    pd.set_option("display.width", 200)
+    print(table.drop(columns=["file"]).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if table["solver"].nunique() > 1:
+        print(f"\n=== {args.metric} ===")
+        print(table.pivot_table(index="location", columns="solver", values=args.metric, aggfunc="last").to_string())
@@ -0,0 +1,129 @@
+from model_builder import build_matrices, full_arcs
+from backends import make_backend
+from demand_store import load_demand, load_frame
+from synthetic import generate_demand
+import argparse
+import sys
+import numpy as np
+
+# === 稀疏矩陣模型驗證：原始 gurobipy 逐條建模 vs. build_matrices ===
+# 在小型實例（行政區的前幾站、前幾期，或合成資料）上以原始 quicksolve.py 的寫法逐條建立模型，
+# 與 build_matrices（完整弧集合、第 0 期不計調度流入／流出）分別求解至 gap 0，比較最佳目標值。
+# 小型實例可在 Gurobi 的限制授權內求解；任一實例不一致時以狀態碼 1 結束，可直接作為回歸檢查。
+
+μ = 6
+α = 1
+β = 0.04
+L = 20
+T_num = 30
+max_visit = 3
+K = T_num * L
+delay = 2
+
+
+def baseline_objective(C, D_borrow, D_return, B0, hide_cap, time_limit=60):
+    """
+    原始 quicksolve.py 的模型（x、v 含 i == j 的欄位）的最佳目標值。
+    非負變數的 h_in * h_out == 0 改以等價的 SOS1 表示：二次等式在 Gurobi 中的重寫超出限制授權的規模。
+    """
+    from gurobipy import Model, GRB, quicksum
+    S, T = range(D_borrow.shape[0]), range(D_borrow.shape[1])
+    m = Model("YouBike_Baseline")
+    m.setParam("OutputFlag", 0)
+    m.setParam("TimeLimit", time_limit)
+    m.setParam("MIPGap", 0.0)
+
+    x = m.addVars(S, S, T, vtype=GRB.CONTINUOUS, name="x")
+    v = m.addVars(S, S, T, vtype=GRB.BINARY, name="v")
+    h_in = m.addVars(S, T, vtype=GRB.INTEGER, name="h_in")
+    h_out = m.addVars(S, T, vtype=GRB.INTEGER, name="h_out")
+    B = m.addVars(S, T, lb=0, name="B")
+    W_borrow = m.addVars(S, T, lb=0, name="W_borrow")
+    W_return = m.addVars(S, T, lb=0, name="W_return")
+
+    for t in T:
+        for i in S:
+            if t == 0:
+                inflow = 0
+            else:
+                inflow = quicksum(x[j, i, t - delay] for j in S if j != i) if t - delay >= 0 else 0
+            outflow = quicksum(x[i, j, t] for j in S if j != i)
+            if t == 0:
+                m.addConstr(B[i, t] == B0[i] + h_out[i, t] - h_in[i, t])
+            else:
+                m.addConstr(B[i, t] == B[i, t - 1] + inflow - outflow + h_out[i, t] - h_in[i, t])
+            m.addConstr(B[i, t] <= C[i])
+            m.addConstr(W_borrow[i, t] >= (D_borrow[i, t] - B[i, t]) / μ)
+            m.addConstr(W_return[i, t] >= (D_return[i, t] - (C[i] - B[i, t])) / μ)
+            m.addConstr(h_in[i, t] <= hide_cap[i])
+            m.addSOS(GRB.SOS_TYPE1, [h_in[i, t], h_out[i, t]])  # 原為 h_in * h_out == 0
+            m.addConstr(h_out[i, t] <= quicksum(h_in[i, τ] - h_out[i, τ] for τ in range(t + 1)))
+    for t in T:
+        m.addConstr(quicksum(x[i, j, t] for i in S for j in S if i != j) <= K)
+    for i in S:
+        for j in S:
+            if i != j:
+                for t in T:
+                    m.addConstr(x[i, j, t] <= L * v[i, j, t])
+    m.addConstr(quicksum(v[i, j, t] for i in S for j in S if i != j for t in T) <= T_num * max_visit)
+
+    m.setObjective(
+        quicksum(W_borrow[i, t] + W_return[i, t] for i in S for t in T) +
+        α * quicksum(x[i, j, t] for i in S for j in S if i != j for t in T) +
+        β * quicksum(h_in[i, t] + h_out[i, t] for i in S for t in T),
+        GRB.MINIMIZE
+    )
+    m.optimize()
+    if m.SolCount == 0 or m.MIPGap > 1e-6:
+        raise RuntimeError(f"原始模型未在時間內證明最佳（狀態 {m.Status}）")
+    return m.ObjVal
+
+
+def matrix_objective(C, D_borrow, D_return, B0, hide_cap, backend, time_limit=60, **options):
+    mm = build_matrices(C, D_borrow, D_return, B0, hide_cap, μ=μ, α=α, β=β, L=L, K=K, T_num=T_num,
+                        max_visit=max_visit, delay=delay, arcs=full_arcs(len(C)), **options)
+    sol = make_backend(mm, backend, "YouBike_Matrix").solve(time_limit=time_limit, mip_gap=0.0)
+    if sol.gap > 1e-6:
+        raise RuntimeError(f"矩陣模型未在時間內證明最佳（gap {sol.gap:.2%}）")
+    return sol.objective
+
+
+def instances(locations, seeds, stations, periods):
+    """(名稱, C, D_borrow, D_return)：各行政區與合成資料的前 stations 站、前 periods 期。"""
+    for loc in locations:
+        demand = load_demand(loc)
+        yield loc, demand.capacity[:stations], demand.D_borrow[:stations, :periods], demand.D_return[:stations, :periods]
+    for seed in seeds:
+        demand = load_frame(generate_demand(stations, periods, seed=seed)[0])
+        yield f"synthetic-{seed}", demand.capacity, demand.D_borrow, demand.D_return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較原始逐條建模與稀疏矩陣模型的最佳目標值")
+    parser.add_argument("locations", nargs="*", default=["datong"], help="行政區，預設 datong")
+    parser.add_argument("--seeds", type=int, nargs="*", default=[0, 1, 2], help="合成實例的 seed，預設 0 1 2")
+    parser.add_argument("--stations", type=int, default=6, help="每個實例取前幾站，預設 6")
+    parser.add_argument("--periods", type=int, default=8, help="每個實例取前幾期，預設 8")
+    parser.add_argument("--backend", choices=["gurobi", "highs"], default="highs", help="矩陣模型的求解器，預設 highs")
+    parser.add_argument("--time-limit", type=float, default=60)
+    args = parser.parse_args()
+
+    failed = []
+    for name, C, D_borrow, D_return in instances(args.locations, args.seeds, args.stations, args.periods):
+        B0 = (0.35 * C).astype(int)
+        hide_cap = (0.4 * C).astype(int)
+        base = baseline_objective(C, D_borrow, D_return, B0, hide_cap, args.time_limit)
+        results = {formulation: matrix_objective(C, D_borrow, D_return, B0, hide_cap, args.backend,
+                                                 args.time_limit, formulation=formulation)
+                   for formulation in ("standard", "compact")}
+        results["compact+tight"] = matrix_objective(C, D_borrow, D_return, B0, hide_cap, args.backend,
+                                                    args.time_limit, formulation="compact", tight_links=True)
+        for label, obj in results.items():
+            ok = np.isclose(obj, base, rtol=1e-6, atol=1e-6)
+            if not ok:
+                failed.append((name, label))
+            print(f"{'✅' if ok else '❌'} {name:<12} {label:<14} 原始 {base:.6f}｜矩陣 {obj:.6f}｜差異 {obj - base:+.2e}")
+    if failed:
+        print(f"⚠️ {len(failed)} 組目標值不一致: " + "，".join(f"{n} {f}" for n, f in failed))
+        sys.exit(1)
+    print("✅ 所有實例的最佳目標值一致")
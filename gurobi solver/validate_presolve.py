@@ -0,0 +1,84 @@
+from model_builder import build_matrices, full_arcs
+from backends import make_backend
+from demand_store import load_demand
+from presolve import presolve, apply, μ, α, β, L, K, T_num, max_visit, delay
+import argparse
+import sys
+import numpy as np
+
+# === 站點預處理驗證：完整模型 vs. presolve 固定後的模型 ===
+# 在小型實例上將兩個模型都解到 gap 0，比較整數最佳值。實例包含：
+#   relay：只有 0 → 1、1 → 2 兩條弧、只有站 2 缺車的 3 站例子（經由 balanced 站轉送，舊規則會讓最佳值加倍）；
+#   行政區的前幾站、前幾期；
+#   稀疏的隨機需求（多數時段沒有需求，預處理才有變數可固定），隨機挑選弧子集、模型形式與第 0 期是否計入調度。
+# 任一實例不一致或未證明最佳時以狀態碼 1 結束，可直接作為回歸檢查。
+
+
+def objective(C, D_borrow, D_return, arcs, first_period_flows, formulation, use_presolve, backend, time_limit):
+    """回傳 (最佳目標值, 固定的變數數)。"""
+    B0 = (0.35 * C).astype(int)
+    hide_cap = (0.4 * C).astype(int)
+    pre = presolve(C, D_borrow, D_return, B0, arcs, delay,
+                   first_period_flows=first_period_flows) if use_presolve else None
+    mm = build_matrices(C, D_borrow, D_return, B0, hide_cap, μ=μ, α=α, β=β, L=L, K=K, T_num=T_num,
+                        max_visit=max_visit, delay=delay, arcs=pre.arcs if pre is not None else arcs,
+                        first_period_flows=first_period_flows, formulation=formulation)
+    if pre is not None:
+        apply(mm, pre)
+    sol = make_backend(mm, backend, "YouBike_Presolve").solve(time_limit=time_limit, mip_gap=0.0)
+    if sol.gap > 1e-6:
+        raise RuntimeError(f"未在時間內證明最佳（gap {sol.gap:.2%}）")
+    return sol.objective, 0 if pre is None else pre.num_fixed()
+
+
+def instances(locations, seeds, stations, periods):
+    """(名稱, C, D_borrow, D_return, arcs, first_period_flows, formulation)。"""
+    C = np.array([20.0, 20.0, 20.0])
+    D_borrow, D_return = np.zeros((3, periods)), np.zeros((3, periods))
+    D_borrow[1, :] = 7
+    D_borrow[2, 3:] = 14
+    for fpf in (False, True):
+        yield f"relay-{int(fpf)}", C, D_borrow, D_return, np.array([[0, 1], [1, 2]]), fpf, "standard"
+    for loc in locations:
+        demand = load_demand(loc)
+        yield (loc, demand.capacity[:stations], demand.D_borrow[:stations, :periods],
+               demand.D_return[:stations, :periods], full_arcs(stations), False, "standard")
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        S = int(rng.integers(3, stations + 1))
+        C = rng.integers(5, 25, S).astype(float)
+        D = [np.where(rng.random((S, periods)) < rng.uniform(0.1, 0.6), rng.integers(0, 25, (S, periods)), 0)
+             .astype(float) for _ in range(2)]
+        arcs = full_arcs(S)
+        if rng.random() < 0.5:
+            arcs = arcs[rng.random(len(arcs)) < 0.5]
+        formulation = "compact" if rng.random() < 0.5 else "standard"
+        yield f"sparse-{seed}", C, D[0], D[1], arcs, bool(rng.random() < 0.5), formulation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較完整模型與站點預處理後模型的整數最佳值")
+    parser.add_argument("locations", nargs="*", default=["datong"], help="行政區，預設 datong")
+    parser.add_argument("--seeds", type=int, nargs="*", default=list(range(20)), help="稀疏隨機實例的 seed，預設 0–19")
+    parser.add_argument("--stations", type=int, default=5, help="每個實例最多幾站，預設 5")
+    parser.add_argument("--periods", type=int, default=8, help="每個實例取前幾期，預設 8")
+    parser.add_argument("--backend", choices=["gurobi", "highs"], default="highs", help="求解器，預設 highs")
+    parser.add_argument("--time-limit", type=float, default=60)
+    args = parser.parse_args()
+
+    failed, total_fixed = [], 0
+    for name, C, D_borrow, D_return, arcs, fpf, formulation in instances(args.locations, args.seeds,
+                                                                          args.stations, args.periods):
+        opts = (C, D_borrow, D_return, arcs, fpf, formulation)
+        full, _ = objective(*opts, False, args.backend, args.time_limit)
+        reduced, n_fixed = objective(*opts, True, args.backend, args.time_limit)
+        total_fixed += n_fixed
+        ok = np.isclose(reduced, full, rtol=1e-6, atol=1e-6)
+        if not ok:
+            failed.append(name)
+        print(f"{'✅' if ok else '❌'} {name:<12} {formulation:<8} 完整 {full:.6f}｜預處理 {reduced:.6f}｜"
+              f"固定 {n_fixed} 個變數｜差異 {reduced - full:+.2e}")
+    if failed:
+        print(f"⚠️ {len(failed)} 個實例的最佳值不一致: " + "，".join(failed))
+        sys.exit(1)
+    print(f"✅ 所有實例的最佳值一致（共固定 {total_fixed} 個變數）")
@@ -0,0 +1,130 @@
+import numpy as np
+
+# === 以貪婪法結果作為 Gurobi MIP 起始解 ===
+# 貪婪法沒有調度延遲、不受拜訪次數限制，也可能釋放從未藏起的車，
+# 因此先修補成模型可行的解，再依模型的庫存動態推出一致的 B 與 W。
+
+
+def plan_arrays(mm, stations, times, dispatch_result, hide_result):
+    """將調度／藏車紀錄對應到模型的 x (弧 × 期) 與 h_in、h_out (站 × 期)；不在弧集合內的調度會被捨棄。"""
+    s_index = {s: i for i, s in enumerate(stations)}
+    t_index = {t: k for k, t in enumerate(times)}
+    arc_index = {(i, j): a for a, (i, j) in enumerate(mm.arcs)}
+    x = np.zeros((len(mm.arcs), mm.T))
+    net_hide = np.zeros((mm.S, mm.T))
+    for r in dispatch_result:
+        a = arc_index.get((s_index[r["from_sno"]], s_index[r["to_sno"]]))
+        if a is not None:
+            x[a, t_index[r["time"]]] += r["quantity"]
+    for r in hide_result:
+        net_hide[s_index[r["sno"]], t_index[r["time"]]] += r["hide"] - r["release"]
+    return x, net_hide
+
+
+def repair_plan(x, net_hide, C, B0, hide_cap, L, K, visit_budget, delay, arcs, max_iter=100000):
+    """
+    修補調度／藏車計畫使其滿足模型限制：
+    x <= L、每期總量 <= K、拜訪次數 <= visit_budget、藏車為整數且 <= 上限、
+    釋放不超過累積藏車、h_in * h_out == 0，以及 0 <= B <= C（含調度延遲）。
+    """
+    S, T = net_hide.shape
+    x = np.minimum(x, L)
+    # 拜訪次數：只保留數量最大的 visit_budget 筆 (弧, 期)
+    flat = x.ravel()
+    nz = np.flatnonzero(flat > 0)
+    if len(nz) > visit_budget:
+        drop = nz[np.argsort(-flat[nz], kind="stable")[visit_budget:]]
+        flat[drop] = 0
+    # 每期總量
+    per_t = x.sum(axis=0)
+    over = per_t > K
+    x[:, over] *= K / per_t[over]
+
+    h_in = np.minimum(np.floor(np.maximum(net_hide, 0)), hide_cap[:, None])
+    h_out = np.floor(np.maximum(-net_hide, 0))
+
+    orig, dest = arcs[:, 0], arcs[:, 1]
+    B = np.zeros((S, T))
+    H = np.zeros((S, T))  # 期末累積藏車
+    t = 0
+    for _ in range(max_iter):
+        if t >= T:
+            break
+        B_prev = B0 if t == 0 else B[:, t - 1]
+        H_prev = np.zeros(S) if t == 0 else H[:, t - 1]
+
+        # 釋放不得超過累積藏車：h_out <= H_prev + h_in - h_out，且 h_in * h_out == 0
+        h_out[:, t] = np.minimum(h_out[:, t], np.floor(H_prev / 2))
+        h_in[h_out[:, t] > 0, t] = 0
+
+        inflow = np.zeros(S)
+        outflow = np.zeros(S)
+        if t >= 1:
+            np.add.at(outflow, orig, x[:, t])
+            if t - delay >= 0:
+                np.add.at(inflow, dest, x[:, t - delay])
+        b = B_prev + inflow - outflow + h_out[:, t] - h_in[:, t]
+
+        # 車不夠：先少藏，再依比例減少本期流出（只影響之後的抵達量）
+        short = b < -1e-9
+        if short.any():
+            cut = np.minimum(h_in[:, t], np.ceil(-b - 1e-9))
+            h_in[:, t] -= np.where(short, cut, 0)
+            b = B_prev + inflow - outflow + h_out[:, t] - h_in[:, t]
+            short = b < -1e-9
+            if short.any():
+                # 第 0 期不計流出，只會因藏車而不足，上面已處理
+                for i in np.flatnonzero(short):
+                    out_arcs = np.flatnonzero((orig == i) & (x[:, t] > 0))
+                    scale = max(0.0, 1 + b[i] / outflow[i])
+                    x[out_arcs, t] *= scale
+                continue  # 重算本期
+
+        # 車太多：先少釋放，再加藏車，最後回頭減少 t - delay 期的流入並從該期重算
+        full = b > C + 1e-9
+        if full.any():
+            excess = np.where(full, np.ceil(b - C - 1e-9), 0)
+            cut = np.minimum(h_out[:, t], excess)
+            h_out[:, t] -= cut
+            excess -= cut
+            room = np.where(full & (h_out[:, t] == 0) & (excess > 0), np.maximum(hide_cap - h_in[:, t], 0), 0)
+            h_in[:, t] += np.minimum(room, excess)
+            b = B_prev + inflow - outflow + h_out[:, t] - h_in[:, t]
+            full = b > C + 1e-9
+            if full.any():
+                for i in np.flatnonzero(full):
+                    in_arcs = np.flatnonzero((dest == i) & (x[:, t - delay] > 0))
+                    scale = max(0.0, 1 - (b[i] - C[i]) / inflow[i])
+                    x[in_arcs, t - delay] *= scale
+                t = max(t - delay, 0)
+                continue
+
+        B[:, t] = np.clip(b, 0, C)
+        H[:, t] = H_prev + h_in[:, t] - h_out[:, t]
+        t += 1
+    else:
+        raise RuntimeError("起始解修補未收斂")
+
+    v = (x > 1e-9).astype(float)
+    return x, v, h_in, h_out, B
+
+
+def greedy_start(mm, stations, times, dispatch_result, hide_result, C, B0, D_borrow, D_return, hide_cap,
+                 μ, L, K, T_num, max_visit, delay):
+    """回傳各模型變數（與 MatrixModel 欄區塊同名）的起始值。"""
+    x, net_hide = plan_arrays(mm, stations, times, dispatch_result, hide_result)
+    x, v, h_in, h_out, B = repair_plan(x, net_hide, C, np.asarray(B0, dtype=float), np.asarray(hide_cap, dtype=float),
+                                       mm.link_cap, K, T_num * max_visit, delay, mm.arcs)
+    W_borrow = np.maximum(D_borrow - B, 0) / μ
+    W_return = np.maximum(D_return - (C[:, None] - B), 0) / μ
+    start = dict(x=x, v=v, h_in=h_in, h_out=h_out, B=B, W_borrow=W_borrow, W_return=W_return)
+    if "H" in mm.cols:
+        # 精簡模型的藏車庫存與藏車／釋放切換變數
+        start["H"] = np.cumsum(h_in - h_out, axis=1)
+        start["z"] = (h_in > 0).astype(float)
+    return start
+
+
+def set_start(var, start):
+    for name, value in start.items():
+        var[name].Start = np.asarray(value, dtype=float).ravel()